@@ -0,0 +1,91 @@
+"""访问日志解析基准测试
+
+生成 log_format monitor 格式的日志，分别测量纯解析与“写文件-增量读取-解析”的吞吐量，
+低于 --min-rate（默认每秒10万行）时以非零状态退出。
+
+    python benchmarks/bench_logtail.py --lines 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.logtail import AccessLogAnalyzer, LogStats  # noqa: E402
+from core.sketch import IPStatsTracker  # noqa: E402
+
+PATHS = [b'/', b'/api/metrics', b'/api/alerts?limit=100', b'/static/app.js', b'/login']
+AGENTS = [b'Mozilla/5.0 (X11; Linux x86_64)', b'curl/7.68.0', b'python-requests/2.26.0']
+STATUSES = [b'200'] * 90 + [b'304'] * 4 + [b'404'] * 4 + [b'500', b'502']
+
+
+def generate(lines: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(lines):
+        out.append(b'10.0.%d.%d - - [10/Oct/2021:13:55:36 +0800] "GET %s HTTP/1.1" %s %d "-" "%s" %.3f\n' % (
+            rng.randrange(256), rng.randrange(256), rng.choice(PATHS), rng.choice(STATUSES),
+            rng.randrange(100, 50000), rng.choice(AGENTS), rng.expovariate(20)
+        ))
+    return b''.join(out)
+
+
+def bench_parse(data: bytes, lines: int, chunk_size: int) -> float:
+    stats = LogStats()
+    tracker = IPStatsTracker({})
+    start = time.perf_counter()
+    # 与采集时一致，按块切分到行边界后解析
+    offset = 0
+    while offset < len(data):
+        end = data.rfind(b'\n', offset, offset + chunk_size) + 1 or len(data)
+        stats.parse(data[offset:end], tracker)
+        offset = end
+    elapsed = time.perf_counter() - start
+    assert stats.requests == lines, f"parsed {stats.requests} of {lines} lines"
+    return lines / elapsed
+
+
+def bench_tail(data: bytes, lines: int) -> float:
+    with tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, 'access.log')
+        open(log_path, 'wb').close()
+        analyzer = AccessLogAnalyzer({'monitoring': {'access_logs': {
+            'paths': [log_path],
+            'state_path': os.path.join(workdir, 'offsets.json'),
+            'start_at': 'start'
+        }}})
+        analyzer.collect()
+        with open(log_path, 'ab') as f:
+            f.write(data)
+        start = time.perf_counter()
+        summary = analyzer.collect()
+        elapsed = time.perf_counter() - start
+        analyzer.close()
+    assert summary['requests'] == lines, f"tailed {summary['requests']} of {lines} lines"
+    return lines / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=500000)
+    parser.add_argument('--chunk-size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--min-rate', type=float, default=100000)
+    args = parser.parse_args()
+
+    data = generate(args.lines)
+    parse_rate = bench_parse(data, args.lines, args.chunk_size)
+    tail_rate = bench_tail(data, args.lines)
+    print(f"lines:        {args.lines}")
+    print(f"data:         {len(data) / 1024 / 1024:.1f} MB")
+    print(f"parse only:   {parse_rate:,.0f} lines/s")
+    print(f"tail + parse: {tail_rate:,.0f} lines/s")
+    if min(parse_rate, tail_rate) < args.min_rate:
+        print(f"FAIL: below {args.min_rate:,.0f} lines/s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,511 @@
+"""监控流水线基准测试
+
+以本地替身服务（benchmarks/fakes.py）代替Nginx、InfluxDB、SMTP、Webhook与Slack，
+按目标数（默认1、100、10000）分别在独立子进程中运行完整的监控循环，测量：
+
+- 每秒循环次数与各阶段（采集/发布/优化/告警/通知/清理）耗时分位数，各探测项平均耗时
+- 并发客户端下 /api/metrics、/api/metrics/history、/api/metrics/recent 的延迟分位数
+- 历史数据导出吞吐量（MB/s）
+- 进程内存峰值（ru_maxrss）
+
+指定 --shards 时改为测量分片探测：按给定的worker数（0表示不分片、在主进程内探测）
+以1秒采集周期持续探测，记录全部worker合计的每秒探测数与主进程每次读取结果的耗时。
+替身服务是单线程事件循环，其处理能力也会限制可达到的探测速率。
+
+结果以JSON输出；指定 --baseline 时与上次结果比较，任一指标退化超过 --tolerance 时以非零状态退出。
+
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --targets 100 --baseline results.json
+    python benchmarks/bench_pipeline.py --targets 10000 --shards 0,1,2,4
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import importlib.util
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+STAGES = ('collect', 'publish', 'optimize', 'alerts', 'notify', 'cleanup', 'tick')
+PROBES = ('nginx', 'psutil', 'ssl', 'logs', 'targets')
+# 预填充的近期历史（秒），用于API与导出测试；近期存储保留6小时，留出测试期间写入的余量
+HISTORY_SECONDS = 5 * 3600
+
+# 比较基线时检查的指标：(路径, 越大越好)
+REGRESSION_CHECKS = [
+    ('ticks_per_second', True),
+    ('stages.tick.p99_ms', False),
+    ('api.p99_ms', False),
+    ('export.csv.mb_per_second', True),
+    ('memory_peak_mb', False),
+    ('probes_per_second', True),
+    ('main_process.p99_ms', False)
+]
+
+
+def percentiles(values) -> dict:
+    import numpy as np
+    if not len(values):
+        return {'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    values = np.asarray(values) * 1000
+    return {
+        'p50_ms': float(np.percentile(values, 50)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max())
+    }
+
+
+def build_config(standins, workdir: str, targets: int, log_path: str) -> dict:
+    """以仓库配置为基础，把所有外部依赖指向替身服务，数据文件放在临时目录"""
+    import yaml
+    with open(os.path.join(ROOT, 'config', 'app', 'config.yaml'), 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    base = standins.base_url
+
+    monitoring = config['monitoring']
+    monitoring['nginx_status_url'] = f"{base}/status"
+    monitoring['targets'] = [{'name': f"t{i}", 'url': f"{base}/t/{i}"} for i in range(targets)]
+    # 替身服务都在同一主机上，放开单主机并发限制
+    monitoring['probe']['per_host_concurrency'] = monitoring['probe']['max_concurrency']
+    monitoring['store'].update(resolution='1s', retention='6h', max_memory='256MB')
+    monitoring['access_logs'].update(paths=[log_path], state_path=os.path.join(workdir, 'offsets.json'),
+                                     start_at='end')
+
+    influx = config['database']['influxdb']
+    influx.update(host='127.0.0.1', port=standins.http_port)
+    influx['writer']['spool_path'] = os.path.join(workdir, 'spool.lp')
+
+    alerts = config['alerts']
+    alerts['channels'] = ['email', 'webhook', 'slack']
+    alerts['email'] = {'smtp_server': '127.0.0.1', 'smtp_port': standins.smtp_port, 'username': 'bench',
+                       'password': 'bench', 'from': 'bench@localhost', 'to': 'ops@localhost'}
+    alerts['webhook'] = {'url': f"{base}/webhook"}
+    alerts['slack'] = {'webhook_url': f"{base}/slack"}
+    alerts['history']['persist_path'] = os.path.join(workdir, 'alerts.jsonl')
+    alerts['notify'].update(group_wait='100ms', rate_limit={})
+    # 每个目标首轮即触发告警，覆盖告警存储与通知路径
+    alerts['rules'].append({'name': 'bench_probe', 'metric': 'response_time', 'threshold': 0,
+                            'for': 0, 'severity': 'warning'})
+    return config
+
+
+def prefill_history(monitor, fields):
+    """按1秒间隔写入HISTORY_SECONDS的历史数据"""
+    import numpy as np
+    now = datetime.utcnow()
+    rng = np.random.default_rng(1)
+    values = rng.random((HISTORY_SECONDS, len(fields)))
+    for i in range(HISTORY_SECONDS):
+        monitor.store.record(now - timedelta(seconds=HISTORY_SECONDS - i),
+                             dict(zip(fields, values[i].tolist())))
+    return now - timedelta(seconds=HISTORY_SECONDS - 1), now
+
+
+def run_ticks(monitor, optimizer, alert_system, append_log, ticks: int) -> dict:
+    """按 main.monitor_loop 的顺序连续运行，不等待采集周期"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    timings = {stage: [] for stage in STAGES}
+
+    def stage(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[name].append(time.perf_counter() - start)
+        return result
+
+    for _ in range(ticks):
+        append_log()
+        # 连续运行不经过采集周期，各探测项每轮都执行
+        for cadence in monitor.cadence.cadences.values():
+            cadence.deadline = 0.0
+        tick_start = time.perf_counter()
+        metrics = stage('collect', loop.run_until_complete, monitor.collect_metrics())
+        stage('publish', lambda: monitor.snapshots.publish({
+            'metrics': monitor.build_metrics_view(metrics, optimizer.monitor_resources()),
+            'status': {'alerts': {'active_count': alert_system.active_count()}}
+        }))
+        optimized = stage('optimize', lambda: {**metrics, **optimizer.optimize_performance(metrics)})
+        alerts = stage('alerts', alert_system.check_alerts, optimized)
+        stage('notify', alert_system.send_notifications, alerts)
+        stage('cleanup', optimizer.cleanup)
+        timings['tick'].append(time.perf_counter() - tick_start)
+
+    loop.run_until_complete(monitor.close())
+    loop.close()
+    return {
+        'ticks': ticks,
+        'ticks_per_second': ticks / sum(timings['tick']),
+        'stages': {name: percentiles(values) for name, values in timings.items()},
+        'last_probe_stats': dict(monitor.scheduler.stats)
+    }
+
+
+def probe_means() -> dict:
+    """由自监控直方图计算各探测项的平均耗时"""
+    from prometheus_client import REGISTRY
+    result = {}
+    for probe in PROBES:
+        total = REGISTRY.get_sample_value('monitor_probe_seconds_sum', {'probe': probe})
+        count = REGISTRY.get_sample_value('monitor_probe_seconds_count', {'probe': probe})
+        if count:
+            result[probe] = {'mean_ms': total / count * 1000, 'count': int(count)}
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _api_clients(base: str, paths, clients: int, total: int) -> list:
+    import aiohttp
+    latencies = []
+    remaining = iter(range(total))
+
+    async def client(session):
+        for i in remaining:
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            async with session.get(base + path) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"GET {path} returned {response.status}")
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+    return latencies
+
+
+def bench_api(monitor, optimizer, history_range, clients: int, total: int) -> dict:
+    """以uvicorn运行FastAPI路由，并发客户端轮流请求快照、历史与近期数据"""
+    if importlib.util.find_spec('uvicorn') is None:
+        return {'skipped': 'uvicorn is not installed'}
+    import uvicorn
+    from fastapi import FastAPI
+    from src.api import metrics as metrics_api
+
+    metrics_api.init(monitor, optimizer)
+    app = FastAPI()
+    app.include_router(metrics_api.router, prefix="/api")
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='error',
+                                           access_log=False, lifespan='off'))
+    thread = threading.Thread(target=server.run, name='bench-api', daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    # 历史查询取预填充数据的最后一小时
+    end_ms = int((history_range[1] - datetime(1970, 1, 1)).total_seconds() * 1000)
+    start_ms = end_ms - 3600 * 1000
+    paths = [
+        '/api/metrics',
+        f"/api/metrics/history?start_time={start_ms}&end_time={end_ms}&interval=1&max_points=1000",
+        '/api/metrics/recent?window=300&series=response_time,error_rate,request_rate'
+    ]
+    try:
+        started = time.perf_counter()
+        latencies = asyncio.run(_api_clients(f"http://127.0.0.1:{port}", paths, clients, total))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.should_exit = True
+        thread.join()
+    return dict(percentiles(latencies), clients=clients, requests=total, requests_per_second=total / elapsed)
+
+
+def bench_export(monitor, history_range) -> dict:
+    """流式导出预填充的历史数据，测量输出吞吐量"""
+    from src.api.metrics import EXPORT_FORMATS
+    formats = ['csv']
+    if importlib.util.find_spec('pyarrow') is not None:
+        formats += ['parquet', 'arrow']
+    start, end = history_range
+    result = {}
+    for name in formats:
+        encoder = EXPORT_FORMATS[name][2]
+        size = 0
+        began = time.perf_counter()
+        for chunk in encoder(monitor.iter_historical_metrics(start, end)):
+            size += len(chunk)
+        elapsed = time.perf_counter() - began
+        result[name] = {'bytes': size, 'seconds': elapsed, 'mb_per_second': size / 1024 / 1024 / elapsed}
+    return result
+
+
+def run_scenario(targets: int, options: dict) -> dict:
+    """在当前进程中运行一个目标规模的完整测试（由独立子进程调用）"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+
+    from fakes import StandIns
+    from bench_logtail import generate
+    from src.core.monitor import NetworkMonitor, HISTORY_FIELDS
+    from src.core.optimizer import PerformanceOptimizer
+    from src.core.alert import AlertSystem
+
+    with StandIns() as standins, tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, 'access.log')
+        open(log_path, 'wb').close()
+        config = build_config(standins, workdir, targets, log_path)
+        log_chunk = generate(options['log_lines'])
+
+        def append_log():
+            with open(log_path, 'ab') as f:
+                f.write(log_chunk)
+
+        optimizer = PerformanceOptimizer(config)
+        monitor = NetworkMonitor(config, query_cache=optimizer.query_cache)
+        alert_system = AlertSystem(config)
+        history_range = prefill_history(monitor, HISTORY_FIELDS)
+        try:
+            run_ticks(monitor, optimizer, alert_system, append_log, options['warmup'])
+            result = {'targets': targets}
+            result.update(run_ticks(monitor, optimizer, alert_system, append_log, options['ticks']))
+            result['probes'] = probe_means()
+            result['api'] = bench_api(monitor, optimizer, history_range,
+                                      options['api_clients'], options['api_requests'])
+            result['export'] = bench_export(monitor, history_range)
+            # 等待通知分发与写入器刷新
+            time.sleep(1.5)
+            result['standins'] = dict(standins.counters)
+            result['alerts_active'] = alert_system.active_count()
+        finally:
+            alert_system.close()
+            monitor.cleanup()
+            optimizer.sampler.stop()
+        # Linux下ru_maxrss单位为KB，macOS为字节
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['memory_peak_mb'] = peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        return result
+
+
+def _probe_count() -> float:
+    from prometheus_client import REGISTRY
+    return sum(REGISTRY.get_sample_value('monitor_probe_total', {'result': result}) or 0.0
+               for result in ('ok', 'timeout', 'failed'))
+
+
+async def _measure_probes(config: dict, workers: int, seconds: float) -> dict:
+    """持续探测seconds秒：分片模式下每0.25秒读取一次结果，否则在主进程内连续运行探测轮次"""
+    import aiohttp
+    from src.core.scheduler import ProbeScheduler, TargetRegistry, probe_http
+    from src.core.sharding import ShardedProbes
+
+    registry = TargetRegistry(config)
+    scheduler = ProbeScheduler(config)
+    calls = []
+    if workers:
+        shards = ShardedProbes(config, scheduler)
+        try:
+            # 等待各分片发布第一轮结果
+            started = time.monotonic()
+            while time.monotonic() - started < shards.interval * 2 + scheduler.tick_deadline:
+                await shards.collect(registry)
+                if not shards.stats['pending']:
+                    break
+                await asyncio.sleep(0.25)
+            before, began = _probe_count(), time.perf_counter()
+            while time.perf_counter() - began < seconds:
+                start = time.perf_counter()
+                await shards.collect(registry)
+                calls.append(time.perf_counter() - start)
+                await asyncio.sleep(0.25)
+            stats = dict(shards.stats)
+        finally:
+            shards.stop()
+    else:
+        connector = aiohttp.TCPConnector(limit=scheduler.max_concurrency,
+                                         limit_per_host=scheduler.per_host_concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            targets = registry.all()
+            before, began = _probe_count(), time.perf_counter()
+            while time.perf_counter() - began < seconds:
+                start = time.perf_counter()
+                await scheduler.run_tick(targets, lambda target: probe_http(session, target))
+                calls.append(time.perf_counter() - start)
+            stats = dict(scheduler.stats)
+    elapsed = time.perf_counter() - began
+    return {
+        'probes_per_second': (_probe_count() - before) / elapsed,
+        # 主进程每次调用的耗时：分片模式为读取结果，不分片时为完整的一轮探测
+        'main_process': percentiles(calls),
+        'last_probe_stats': stats
+    }
+
+
+def run_shard_scenario(targets: int, workers: int, options: dict) -> dict:
+    """在当前进程中测量一种分片配置的探测吞吐量（由独立子进程调用）"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+
+    from fakes import StandIns
+
+    with StandIns() as standins, tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, 'access.log')
+        config = build_config(standins, workdir, targets, log_path)
+        monitoring = config['monitoring']
+        monitoring['interval'] = '1s'
+        monitoring['intervals']['targets'] = '1s'
+        monitoring['sharding'].update(enabled=bool(workers), workers=workers)
+        result = {'targets': targets, 'workers': workers}
+        result.update(asyncio.run(_measure_probes(config, workers, options['shard_seconds'])))
+        result['standins'] = dict(standins.counters)
+        return result
+
+
+def _scenario_entry(func, args: tuple, queue):
+    try:
+        queue.put(func(*args))
+    except Exception as e:
+        queue.put({'targets': args[0], 'error': f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(targets: int, options: dict, workers: Optional[int] = None) -> dict:
+    """每个规模在独立进程中运行：Prometheus注册表与内存峰值互不影响"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    if workers is None:
+        func, args = run_scenario, (targets, options)
+    else:
+        func, args = run_shard_scenario, (targets, workers, options)
+    process = context.Process(target=_scenario_entry, args=(func, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _lookup(result: dict, path: str):
+    for key in path.split('.'):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """返回退化超过容差的指标"""
+    previous = {(scenario['targets'], scenario.get('workers')): scenario for scenario in baseline.get('scenarios', [])}
+    regressions = []
+    for scenario in results['scenarios']:
+        old = previous.get((scenario['targets'], scenario.get('workers')))
+        if old is None:
+            continue
+        for path, higher_is_better in REGRESSION_CHECKS:
+            current, before = _lookup(scenario, path), _lookup(old, path)
+            if not current or not before:
+                continue
+            change = (current - before) / before
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                label = f"targets={scenario['targets']}"
+                if 'workers' in scenario:
+                    label = f"{label} workers={scenario['workers']}"
+                regressions.append(f"{label} {path}: {before:.2f} -> {current:.2f} "
+                                   f"({change:+.0%})")
+    return regressions
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def summarize(scenario: dict) -> str:
+    if 'error' in scenario:
+        return f"targets={scenario['targets']:>6}  ERROR {scenario['error']}"
+    if 'workers' in scenario:
+        main_process = scenario['main_process']
+        return (f"targets={scenario['targets']:>6}  workers={scenario['workers']}  "
+                f"{scenario['probes_per_second']:9.0f} probes/s  "
+                f"main p50 {main_process['p50_ms']:8.1f}ms  p99 {main_process['p99_ms']:8.1f}ms")
+    api = scenario['api']
+    api_text = f"api p99 {api['p99_ms']:.1f}ms" if 'p99_ms' in api else f"api {api.get('skipped')}"
+    return (f"targets={scenario['targets']:>6}  {scenario['ticks_per_second']:8.2f} ticks/s  "
+            f"tick p99 {scenario['stages']['tick']['p99_ms']:8.1f}ms  {api_text}  "
+            f"export {scenario['export']['csv']['mb_per_second']:.1f}MB/s  "
+            f"peak {scenario['memory_peak_mb']:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', default='1,100,10000', help='逗号分隔的目标数')
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--log-lines', type=int, default=2000, help='每轮追加的访问日志行数')
+    parser.add_argument('--api-clients', type=int, default=32)
+    parser.add_argument('--api-requests', type=int, default=3000)
+    parser.add_argument('--shards', help='逗号分隔的分片worker数（0表示不分片），指定后只测量探测吞吐量')
+    parser.add_argument('--shard-seconds', type=float, default=10.0, help='每种分片配置的测量时长（秒）')
+    parser.add_argument('--output', help='结果JSON文件，默认输出到标准输出')
+    parser.add_argument('--baseline', help='用于比较的上次结果JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+    args = parser.parse_args()
+
+    options = {
+        'ticks': args.ticks,
+        'warmup': args.warmup,
+        'log_lines': args.log_lines,
+        'api_clients': args.api_clients,
+        'api_requests': args.api_requests,
+        'shard_seconds': args.shard_seconds
+    }
+    results = {
+        'revision': _git_revision(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': options,
+        'scenarios': []
+    }
+    workers = [int(value) for value in args.shards.split(',')] if args.shards else [None]
+    for targets in (int(value) for value in args.targets.split(',')):
+        for count in workers:
+            scenario = run_isolated(targets, options, count)
+            results['scenarios'].append(scenario)
+            print(summarize(scenario), file=sys.stderr)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    failed = any('error' in scenario for scenario in results['scenarios'])
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
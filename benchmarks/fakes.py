@@ -0,0 +1,175 @@
+"""基准测试用的本地替身服务
+
+在一个后台线程的事件循环中运行：
+- HTTP：Nginx stub_status（/status）、探测目标（/t/<n>）、InfluxDB行协议写入（/api/v2/write）、
+  Webhook（/webhook）与Slack（/slack）接收端
+- SMTP：支持 EHLO/STARTTLS/AUTH PLAIN/MAIL/RCPT/DATA/NOOP/QUIT 的最小实现（自签名证书）
+
+所有服务只监听127.0.0.1的随机端口，只计数不保存内容。
+"""
+import ssl
+import asyncio
+import datetime
+import tempfile
+import threading
+from aiohttp import web
+
+STUB_STATUS = ("Active connections: {active}\n"
+               "server accepts handled requests\n"
+               " {accepts} {accepts} {requests}\n"
+               "Reading: 0 Writing: 1 Waiting: {waiting}\n")
+
+
+def _self_signed_context() -> ssl.SSLContext:
+    """生成仅供本地SMTP STARTTLS使用的自签名证书"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.utcnow()
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    with tempfile.NamedTemporaryFile('wb', suffix='.pem') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+        f.flush()
+        context.load_cert_chain(f.name)
+    return context
+
+
+class StandIns:
+    """本地替身服务集合，用作上下文管理器；counters记录各服务收到的请求"""
+
+    def __init__(self):
+        self.counters = {
+            'status_requests': 0,
+            'probe_requests': 0,
+            'influx_writes': 0,
+            'influx_lines': 0,
+            'influx_bytes': 0,
+            'webhook_posts': 0,
+            'webhook_alerts': 0,
+            'slack_posts': 0,
+            'smtp_messages': 0
+        }
+        self.http_port = None
+        self.smtp_port = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='bench-standins', daemon=True)
+        self._runner = None
+        self._smtp = None
+
+    def __enter__(self) -> 'StandIns':
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.http_port}"
+
+    async def _start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get('/status', self._status)
+        app.router.add_get('/t/{n}', self._probe)
+        app.router.add_post('/api/v2/write', self._influx_write)
+        app.router.add_post('/webhook', self._webhook)
+        app.router.add_post('/slack', self._slack)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0, backlog=4096)
+        await site.start()
+        self.http_port = site._server.sockets[0].getsockname()[1]
+
+        self._tls = _self_signed_context()
+        self._smtp = await asyncio.start_server(self._smtp_session, '127.0.0.1', 0)
+        self.smtp_port = self._smtp.sockets[0].getsockname()[1]
+
+    async def _stop(self):
+        self._smtp.close()
+        await self._smtp.wait_closed()
+        await self._runner.cleanup()
+
+    async def _status(self, request):
+        self.counters['status_requests'] += 1
+        requests = self.counters['status_requests']
+        return web.Response(text=STUB_STATUS.format(active=requests % 50 + 1, accepts=requests,
+                                                    requests=requests * 3, waiting=requests % 7))
+
+    async def _probe(self, request):
+        self.counters['probe_requests'] += 1
+        return web.Response(text='ok')
+
+    async def _influx_write(self, request):
+        body = await request.read()
+        self.counters['influx_writes'] += 1
+        self.counters['influx_lines'] += body.count(b'\n') + (1 if body and not body.endswith(b'\n') else 0)
+        self.counters['influx_bytes'] += len(body)
+        return web.Response(status=204)
+
+    async def _webhook(self, request):
+        payload = await request.json()
+        self.counters['webhook_posts'] += 1
+        self.counters['webhook_alerts'] += payload.get('count', 0)
+        return web.Response(status=204)
+
+    async def _slack(self, request):
+        await request.read()
+        self.counters['slack_posts'] += 1
+        return web.Response(text='ok')
+
+    async def _smtp_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode('ascii'))
+            await writer.drain()
+
+        tls = False
+        try:
+            await reply('220 localhost ESMTP bench')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('ascii', 'replace').strip()
+                verb = command.split(' ', 1)[0].upper()
+                if verb in ('EHLO', 'HELO'):
+                    extensions = ['AUTH PLAIN'] if tls else ['STARTTLS']
+                    for extension in ['localhost'] + extensions[:-1]:
+                        await reply(f"250-{extension}")
+                    await reply(f"250 {extensions[-1]}")
+                elif verb == 'STARTTLS':
+                    await reply('220 Ready to start TLS')
+                    await writer.start_tls(self._tls)
+                    tls = True
+                elif verb == 'AUTH':
+                    await reply('235 Authentication successful')
+                elif verb == 'DATA':
+                    await reply('354 End data with <CR><LF>.<CR><LF>')
+                    while (await reader.readline()) not in (b'.\r\n', b''):
+                        pass
+                    self.counters['smtp_messages'] += 1
+                    await reply('250 OK')
+                elif verb == 'QUIT':
+                    await reply('221 Bye')
+                    break
+                else:
+                    # MAIL/RCPT/NOOP/RSET
+                    await reply('250 OK')
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
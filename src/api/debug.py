@@ -0,0 +1,53 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from ..core.instrument import SamplingProfiler
+from ..core.utils import parse_duration
+
+router = APIRouter()
+
+# 由主程序注入；未启用时为None
+profiler: Optional[SamplingProfiler] = None
+
+def init(config: dict):
+    """按配置启用采样分析"""
+    global profiler
+    profiler_config = config.get('api', {}).get('profiler', {})
+    if profiler_config.get('enabled', False):
+        profiler = SamplingProfiler(max_seconds=parse_duration(profiler_config.get('max_duration', '30s')))
+
+@router.get("/debug/profile")
+async def profile(
+    seconds: float = 5,
+    interval: float = 0.01,
+    format: str = "json"
+):
+    """
+    采样分析运行中的进程
+
+    在seconds秒内每隔interval秒记录所有线程的调用栈,返回各折叠栈的出现次数
+    (collapsed格式可直接用flamegraph.pl或speedscope生成火焰图)
+
+    Args:
+        seconds: 采样时长(秒),默认5秒,不超过api.profiler.max_duration
+        interval: 采样间隔(秒),默认0.01秒
+        format: 返回格式(json/collapsed)
+    """
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="采样分析未启用(api.profiler.enabled)")
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="不支持的返回格式")
+    if seconds <= 0 or interval <= 0:
+        raise HTTPException(status_code=400, detail="seconds与interval需大于0")
+    if profiler.busy:
+        raise HTTPException(status_code=409, detail="已有采样分析正在进行")
+
+    try:
+        result = await run_in_threadpool(profiler.capture, seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse("".join(f"{stack} {count}\n" for stack, count in result["stacks"].items()))
+    return result
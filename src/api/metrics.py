@@ -1,62 +1,242 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Optional
+import io
+import os
+import csv
+import json
+import struct
+import tempfile
+import time
+import ipaddress
+import importlib.util
+from functools import partial
+from io import StringIO
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Iterator, List, Optional
 from datetime import datetime, timedelta
+import numpy as np
 from ..core.monitor import NetworkMonitor
 from ..core.optimizer import PerformanceOptimizer
 from ..models.metrics import MetricsResponse, MetricsHistoryResponse
 
 router = APIRouter()
-monitor = NetworkMonitor()
-optimizer = PerformanceOptimizer()
+
+# 由主程序注入与监控线程共享的实例
+monitor: Optional[NetworkMonitor] = None
+optimizer: Optional[PerformanceOptimizer] = None
+
+def init(shared_monitor: NetworkMonitor, shared_optimizer: PerformanceOptimizer):
+    """绑定共享的监控与优化实例"""
+    global monitor, optimizer
+    monitor = shared_monitor
+    optimizer = shared_optimizer
 
 @router.get("/metrics", response_model=MetricsResponse)
-async def get_metrics():
+async def get_metrics(request: Request):
     """
     获取实时监控指标
+    
+    直接返回后台循环发布的最新快照,不触发采集
     """
-    try:
-        # 收集指标数据
-        metrics = await monitor.collect_metrics()
-        
-        # 优化数据
-        optimized_metrics = optimizer.optimize_data(metrics)
-        
-        # 缓存数据
-        optimizer.cache_metrics(optimized_metrics)
-        
-        return optimized_metrics
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    snapshot = monitor.snapshots.latest()
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304)
+    return Response(
+        content=snapshot.payload("metrics"),
+        media_type="application/json",
+        headers={"ETag": snapshot.etag}
+    )
 
-@router.get("/metrics/history", response_model=List[MetricsHistoryResponse])
+@router.get("/metrics/history", response_model=MetricsHistoryResponse)
 async def get_metrics_history(
     start_time: int,
     end_time: int,
-    interval: Optional[int] = 60
+    interval: Optional[int] = 60,
+    max_points: Optional[int] = 1000,
+    encoding: str = "json"
 ):
     """
     获取历史监控指标
     
+    返回列式数据 {timestamps: [...], response_time: [...], ...},时间戳为毫秒
+    
     Args:
         start_time: 开始时间戳(毫秒)
         end_time: 结束时间戳(毫秒)
         interval: 数据间隔(秒),默认60秒
+        max_points: 最大返回点数(通常为图表宽度),默认1000
+        encoding: 编码方式(json/binary)
     """
+    if encoding not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="不支持的编码方式")
+    
     try:
-        # 从InfluxDB获取历史数据
-        history_data = await monitor.get_historical_metrics(
-            start_time=datetime.fromtimestamp(start_time/1000),
-            end_time=datetime.fromtimestamp(end_time/1000),
-            interval=interval
+        # 按分辨率选用降采样层级,查询代价与时间跨度无关
+        columns = await run_in_threadpool(
+            monitor.get_historical_metrics,
+            datetime.utcfromtimestamp(start_time/1000),
+            datetime.utcfromtimestamp(end_time/1000),
+            interval,
+            max_points
         )
         
-        # 优化查询结果
-        optimized_data = optimizer.optimize_query(history_data)
-        
-        return optimized_data
+        if encoding == "binary":
+            return Response(content=encode_columns_binary(columns), media_type="application/octet-stream")
+        return Response(content=encode_columns_json(columns), media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _column_values(name: str, values: np.ndarray) -> list:
+    """转换为JSON列表,时间戳转为毫秒,NaN转为null"""
+    if name == "timestamps":
+        values = values * 1000
+    if np.isnan(values).any():
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+def encode_columns_json(columns: dict) -> bytes:
+    """
+    编码为列式JSON
+    """
+    return json.dumps(
+        {name: _column_values(name, values) for name, values in columns.items()},
+        separators=(",", ":")
+    ).encode("utf-8")
+
+def encode_columns_binary(columns: dict) -> bytes:
+    """
+    编码为二进制列式格式
+    
+    布局: 4字节小端头部长度 + JSON头部{columns, length, dtype} + 各列float64小端数据(按columns顺序连续存放)
+    """
+    names = list(columns)
+    length = len(columns["timestamps"])
+    header = json.dumps({"columns": names, "length": length, "dtype": "<f8"}).encode("utf-8")
+    body = [struct.pack("<I", len(header)), header]
+    for name in names:
+        values = columns[name] * 1000 if name == "timestamps" else columns[name]
+        body.append(np.ascontiguousarray(values, dtype="<f8").tobytes())
+    return b"".join(body)
+
+@router.get("/metrics/recent")
+async def get_recent_metrics(
+    window: int = 300,
+    series: Optional[str] = None
+):
+    """
+    获取近期监控指标(由内存环形缓冲区直接返回)
+    
+    Args:
+        window: 时间窗口(秒),默认300秒
+        series: 逗号分隔的序列名,默认返回全部序列
+    """
+    end = datetime.utcnow()
+    start = end - timedelta(seconds=window)
+    names = series.split(",") if series else monitor.store.series()
+    
+    result = {}
+    for name in names:
+        timestamps, values = monitor.store.query(name, start, end)
+        result[name] = {
+            "timestamps": (timestamps * 1000).tolist(),
+            "values": values.tolist()
+        }
+    return {"series": result}
+
+@router.get("/metrics/latency")
+async def get_latency(
+    start_time: int,
+    end_time: int,
+    interval: Optional[int] = None,
+    max_points: Optional[int] = 1000
+):
+    """
+    获取时间范围内的请求延迟分位数
+    
+    由各窗口的延迟草图合并得到(相对误差1%),返回整体分位数及按窗口的序列,时间戳为毫秒;
+    内存中的草图不覆盖开始时间时coverage.truncated为true,coverage.start为实际覆盖的起点
+    
+    Args:
+        start_time: 开始时间戳(毫秒)
+        end_time: 结束时间戳(毫秒)
+        interval: 序列的最小间隔(秒),默认按max_points自动选择
+        max_points: 序列最大点数,默认1000
+    """
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="结束时间需晚于开始时间")
+    result = await run_in_threadpool(
+        monitor.get_latency_quantiles,
+        datetime.utcfromtimestamp(start_time/1000),
+        datetime.utcfromtimestamp(end_time/1000),
+        interval,
+        max_points
+    )
+    return Response(
+        content=json.dumps({
+            "overall": result["overall"],
+            "series": {name: _column_values(name, values) for name, values in result["series"].items()},
+            "coverage": {
+                "start": int(result["coverage"]["start"] * 1000) if result["coverage"]["start"] is not None else None,
+                "truncated": result["coverage"]["truncated"]
+            }
+        }, separators=(",", ":")).encode("utf-8"),
+        media_type="application/json"
+    )
+
+@router.get("/metrics/ips")
+async def get_ip_stats(
+    limit: int = 20,
+    previous: bool = False,
+    ip: Optional[str] = None
+):
+    """
+    按来源IP的热点统计(请求数/流量/错误数Top-K与去重IP数)
+
+    数据来自访问日志的流式草图,内存占用固定;计数为估计值(只会偏大)
+
+    Args:
+        limit: 每个维度返回的热点IP数,默认20
+        previous: 返回上一个完整统计窗口,默认返回当前窗口
+        ip: 查询单个IP在当前窗口的估计计数
+    """
+    tracker = monitor.access_logs.ip_stats
+    if ip is not None:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="无效的IP地址")
+        return tracker.lookup(str(address))
+    if limit < 1 or limit > tracker.top_k:
+        raise HTTPException(status_code=400, detail=f"limit需在1到{tracker.top_k}之间")
+    return tracker.report(limit, previous)
+
+@router.get("/metrics/certificates")
+async def get_certificates(
+    limit: int = 100,
+    invalid_only: bool = False
+):
+    """
+    各TLS端点最近一次的证书检查结果
+
+    按到期时间升序(握手失败的在前),包含到期时间、签发者、SAN与证书链验证结果
+
+    Args:
+        limit: 返回的端点数,默认100
+        invalid_only: 只返回握手失败或验证失败的端点
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit需大于0")
+    results = monitor.tls.results()
+    if invalid_only:
+        results = [item for item in results if not item["valid"]]
+    return {
+        "status": monitor.tls.status(),
+        "items": [
+            {key: value for key, value in item.items() if key != "expires"}
+            for item in results[:limit]
+        ]
+    }
+
 @router.get("/metrics/export")
 async def export_metrics(
     start_time: Optional[int] = None,
@@ -66,121 +246,161 @@ async def export_metrics(
     """
     导出监控指标数据
     
+    按时间分页读取历史数据并流式输出,内存占用与时间范围无关
+    
     Args:
         start_time: 开始时间戳(毫秒)
         end_time: 结束时间戳(毫秒)
-        format: 导出格式(csv/excel)
+        format: 导出格式(csv/excel/parquet/arrow)
     """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="不支持的导出格式")
+    if format in ("parquet", "arrow") and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=400, detail="导出Parquet/Arrow需要安装pyarrow")
+    
     try:
         # 如果没有指定时间范围,默认导出最近24小时的数据
         if not start_time or not end_time:
-            end_time = int(datetime.now().timestamp() * 1000)
+            end_time = int(time.time() * 1000)
             start_time = end_time - 24 * 60 * 60 * 1000
-            
-        # 获取历史数据
-        history_data = await monitor.get_historical_metrics(
-            start_time=datetime.fromtimestamp(start_time/1000),
-            end_time=datetime.fromtimestamp(end_time/1000)
-        )
         
-        # 优化数据
-        optimized_data = optimizer.optimize_query(history_data)
+        # 按页读取历史数据(惰性迭代,不会一次性加载)
+        pages = monitor.iter_historical_metrics(
+            start_time=datetime.utcfromtimestamp(start_time/1000),
+            end_time=datetime.utcfromtimestamp(end_time/1000)
+        )
         
-        # 根据格式处理数据
-        if format == "csv":
-            return await export_to_csv(optimized_data)
-        elif format == "excel":
-            return await export_to_excel(optimized_data)
-        else:
-            raise HTTPException(status_code=400, detail="不支持的导出格式")
-            
+        media_type, extension, encoder = EXPORT_FORMATS[format]
+        filename = f"metrics_{start_time}_{end_time}.{extension}"
+        return StreamingResponse(
+            encoder(pages),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def export_to_csv(data: List[dict]):
+# 导出列定义:(表头, 取值函数)
+EXPORT_COLUMNS = [
+    ("时间", lambda row: row["timestamp"].strftime("%Y-%m-%d %H:%M:%S")),
+    ("响应时间(ms)", lambda row: f"{(row['response_time'] or 0)*1000:.2f}"),
+    ("连接数", lambda row: row["connection_count"]),
+    ("错误率(%)", lambda row: f"{(row['error_rate'] or 0)*100:.2f}"),
+    ("带宽使用(MB/s)", lambda row: f"{((row['bytes_sent'] or 0) + (row['bytes_recv'] or 0))/1000000:.2f}")
+]
+
+# 列式导出的数值列
+COLUMNAR_FIELDS = ["response_time", "connection_count", "error_rate", "bytes_sent", "bytes_recv"]
+
+class _ChunkSink(io.RawIOBase):
+    """收集写入的字节,供生成器逐块取出"""
+    
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_csv(pages: Iterator[List[dict]]) -> Iterator[bytes]:
     """
-    导出为CSV格式
+    流式导出为CSV格式,每页输出一次
     """
-    import csv
-    from io import StringIO
-    
     output = StringIO()
     writer = csv.writer(output)
     
-    # 写入表头
-    headers = [
-        "时间",
-        "响应时间(ms)",
-        "连接数",
-        "错误率(%)",
-        "带宽使用(MB/s)",
-        "SSL状态",
-        "CPU使用率(%)",
-        "内存使用率(%)",
-        "磁盘使用率(%)"
-    ]
-    writer.writerow(headers)
-    
-    # 写入数据
-    for item in data:
-        writer.writerow([
-            item["timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
-            item["response_time"],
-            item["connection_count"],
-            f"{item['error_rate']*100:.2f}",
-            f"{item['bandwidth']/1000000:.2f}",
-            "正常" if item["ssl_status"]["valid"] else "异常",
-            item["resources"]["cpu_percent"],
-            item["resources"]["memory_percent"],
-            item["resources"]["disk_percent"]
-        ])
-    
-    return output.getvalue()
-
-async def export_to_excel(data: List[dict]):
+    # 先输出表头,客户端可以立即开始接收
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    yield output.getvalue().encode("utf-8")
+    
+    for rows in pages:
+        output.seek(0)
+        output.truncate(0)
+        for row in rows:
+            writer.writerow([value(row) for _, value in EXPORT_COLUMNS])
+        yield output.getvalue().encode("utf-8")
+
+def stream_columnar(pages: Iterator[List[dict]], format: str) -> Iterator[bytes]:
+    """
+    流式导出为Parquet或Arrow IPC格式,每页写入一个记录批次
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema(
+        [("timestamp", pa.timestamp("us", tz="UTC"))] +
+        [(field, pa.float64()) for field in COLUMNAR_FIELDS]
+    )
+    sink = _ChunkSink()
+    if format == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    
+    for rows in pages:
+        columns = {"timestamp": [row["timestamp"] for row in rows]}
+        for field in COLUMNAR_FIELDS:
+            columns[field] = [row[field] for row in rows]
+        batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+        if format == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        yield sink.drain()
+    
+    writer.close()
+    yield sink.drain()
+
+def stream_excel(pages: Iterator[List[dict]]) -> Iterator[bytes]:
     """
     导出为Excel格式
+    
+    xlsx需在文件写完后才能读取,以常量内存模式逐行写入临时文件再分块输出
     """
-    import pandas as pd
-    from io import BytesIO
-    
-    # 转换为DataFrame
-    df = pd.DataFrame(data)
-    
-    # 处理数据格式
-    df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
-    df["error_rate"] = df["error_rate"].apply(lambda x: f"{x*100:.2f}%")
-    df["bandwidth"] = df["bandwidth"].apply(lambda x: f"{x/1000000:.2f}")
-    df["ssl_status"] = df["ssl_status"].apply(lambda x: "正常" if x["valid"] else "异常")
-    
-    # 重命名列
-    df.columns = [
-        "时间",
-        "响应时间(ms)",
-        "连接数",
-        "错误率",
-        "带宽使用(MB/s)",
-        "SSL状态",
-        "CPU使用率(%)",
-        "内存使用率(%)",
-        "磁盘使用率(%)"
-    ]
-    
-    # 导出为Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="监控数据")
+    import xlsxwriter
+    
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        worksheet = workbook.add_worksheet("监控数据")
+        for idx, (header, _) in enumerate(EXPORT_COLUMNS):
+            worksheet.set_column(idx, idx, max(len(header) * 2, 20))
+            worksheet.write(0, idx, header)
         
-        # 获取工作表
-        worksheet = writer.sheets["监控数据"]
+        row_index = 1
+        for rows in pages:
+            for row in rows:
+                worksheet.write_row(row_index, 0, [value(row) for _, value in EXPORT_COLUMNS])
+                row_index += 1
+        workbook.close()
         
-        # 调整列宽
-        for idx, col in enumerate(df.columns):
-            max_length = max(
-                df[col].astype(str).apply(len).max(),
-                len(col)
-            )
-            worksheet.set_column(idx, idx, max_length + 2)
-    
-    output.seek(0)
-    return output.getvalue() 
\ No newline at end of file
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+# 导出格式:(媒体类型, 扩展名, 编码函数)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv", stream_csv),
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx", stream_excel),
+    "parquet": ("application/vnd.apache.parquet", "parquet", partial(stream_columnar, format="parquet")),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow", partial(stream_columnar, format="arrow"))
+}
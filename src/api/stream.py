@@ -0,0 +1,71 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from ..core.broadcast import Broadcaster, EVENT_TOPICS, STATE_TOPICS
+from ..core.utils import parse_duration
+
+router = APIRouter()
+
+# 由主程序注入与监控线程共享的广播器
+broadcaster: Optional[Broadcaster] = None
+heartbeat = 15.0
+
+def init(shared_broadcaster: Broadcaster, config: dict):
+    """绑定共享的广播器"""
+    global broadcaster, heartbeat
+    broadcaster = shared_broadcaster
+    heartbeat = parse_duration(config.get('api', {}).get('stream', {}).get('heartbeat', '15s'))
+
+def _split(value: Optional[str]):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+@router.get("/stream")
+async def stream(
+    request: Request,
+    topics: str = "metrics,status,alerts",
+    fields: Optional[str] = None,
+    severity: Optional[str] = None
+):
+    """
+    推送通道(Server-Sent Events)
+
+    连接后先收到各状态主题的snapshot事件,之后只推送delta事件(变化的顶层字段)
+    与alerts事件(告警触发/恢复)。客户端处理过慢时服务端会断开连接,重连后重新获得全量数据。
+
+    Args:
+        topics: 订阅的主题(metrics/status/alerts),逗号分隔
+        fields: 仅推送指定的顶层字段,逗号分隔
+        severity: 仅推送指定级别的告警,逗号分隔
+    """
+    topic_list = _split(topics) or []
+    unknown = set(topic_list) - set(STATE_TOPICS) - set(EVENT_TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的主题: {','.join(sorted(unknown))}")
+
+    subscription = broadcaster.subscribe(topic_list, _split(fields), _split(severity))
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="推送连接数已达上限")
+
+    async def events():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # 心跳,保持连接并及时发现断开的客户端
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,184 +1,284 @@
 import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional
-from loguru import logger
-import smtplib
-from email.mime.text import MIMEText
-import requests
-import json
+from typing import Callable, Dict, List, Optional, Tuple
+from .alert_store import AlertStore
+from .notify import NotificationDispatcher
+from .rules import RuleEngine
+from .store import to_epoch
+from .utils import parse_bandwidth, parse_duration
+
+# 各指标的告警信息模板
+MESSAGE_TEMPLATES = {
+    'response_time': "响应时间过高: {value:.2f}s",
+    'error_rate': "错误率过高: {value:.2%}",
+    'connection_count': "连接数过高: {value:.0f}",
+    'bandwidth': "带宽使用过高: {megabits:.1f}Mbps",
+    'distinct_ips': "来源IP数异常: {value:.0f}",
+    'unlisted_request_rate': "非白名单IP请求速率过高: {value:.1f}/s",
+    'unlisted_error_rate': "非白名单IP错误请求速率过高: {value:.1f}/s",
+    'latency_p50': "请求延迟中位数过高: {value:.3f}s",
+    'latency_p95': "请求延迟P95过高: {value:.3f}s",
+    'latency_p99': "请求延迟P99过高: {value:.3f}s",
+    'latency_p999': "请求延迟P99.9过高: {value:.3f}s",
+    'ssl_days_to_expiry': "证书即将过期: 剩余{value:.1f}天",
+    'ssl_invalid': "TLS握手或证书验证失败的端点数: {value:.0f}"
+}
 
 class AlertSystem:
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, on_change: Optional[Callable[[Dict], None]] = None):
         self.config = config
-        self.alert_history = []
+        # 告警触发或恢复时回调（用于推送）
+        self.on_change = on_change
+        self.store = AlertStore(config)
         self.alert_rules = self._load_alert_rules()
-        self.notification_channels = self._init_notification_channels()
+        self.sample_interval = parse_duration(config.get('monitoring', {}).get('interval', '5s'))
+        self.rule_engine = RuleEngine(self.alert_rules, sample_interval=self.sample_interval)
+        self.dispatcher = NotificationDispatcher(config)
+
+        # 去重与抖动抑制：指纹(规则, 序列) -> 进行中的告警ID / 最近的状态切换时间
+        suppression = config['alerts'].get('suppression', {})
+        self.flap_window = parse_duration(suppression.get('flap_window', '10m'))
+        self.flap_threshold = int(suppression.get('flap_threshold', 4))
+        self._open: Dict[Tuple[str, str], str] = {}
+        self._transitions: Dict[Tuple[str, str], deque] = {}
+        # 重启后接管持久化历史中仍处于活跃状态的告警：恢复规则状态，
+        # 并在规则重新评估满一个持续时间（变化率规则还需填满窗口）之前不判定恢复
+        self._grace: Dict[Tuple[str, str], float] = {}
+        now = time.time()
+        for alert in self.store.query(status='active', limit=self.store.max_alerts)[0]:
+            fingerprint = (alert['type'], alert.get('series', 'host'))
+            if fingerprint in self._open:
+                continue
+            self._open[fingerprint] = alert['id']
+            self.rule_engine.seed(alert['type'], fingerprint[1], to_epoch(alert['timestamp']))
+            self._grace[fingerprint] = now + self._grace_period(alert['type'])
 
     def _load_alert_rules(self) -> Dict:
         """加载告警规则"""
-        return {
+        rules = {
             'response_time': {
+                'metric': 'response_time',
+                'kind': 'threshold',
                 'threshold': float(self.config['alerts']['thresholds']['response_time'].replace('ms', '')) / 1000,
                 'duration': 300,  # 5分钟
                 'severity': 'warning'
             },
             'error_rate': {
+                'metric': 'error_rate',
+                'kind': 'threshold',
                 'threshold': float(self.config['alerts']['thresholds']['error_rate'].replace('%', '')) / 100,
                 'duration': 300,
                 'severity': 'critical'
             },
             'connection_count': {
+                'metric': 'connection_count',
+                'kind': 'threshold',
                 'threshold': int(self.config['alerts']['thresholds']['connection_count']),
                 'duration': 300,
                 'severity': 'warning'
             },
             'bandwidth': {
-                'threshold': int(self.config['alerts']['thresholds']['bandwidth'].replace('Mbps', '000000')),
+                'metric': 'bandwidth',
+                'kind': 'threshold',
+                # 阈值按位计（如100Mbps），采集值为字节/秒
+                'threshold': parse_bandwidth(self.config['alerts']['thresholds']['bandwidth']),
                 'duration': 300,
                 'severity': 'warning'
             }
         }
+        
+        # 自定义规则：threshold（持续超限）、rate（变化率）、absence（数据缺失）
+        for rule in self.config['alerts'].get('rules', []):
+            rules[rule['name']] = {
+                'metric': rule.get('metric', rule['name']),
+                'kind': rule.get('kind', 'threshold'),
+                'op': rule.get('op', '>'),
+                'threshold': float(rule.get('threshold', 0)),
+                'duration': parse_duration(rule.get('for', 0)),
+                'window': parse_duration(rule.get('window', '1m')),
+                'severity': rule.get('severity', 'warning')
+            }
+        return rules
 
-    def _init_notification_channels(self) -> Dict:
-        """初始化通知渠道"""
-        channels = {}
-        for channel in self.config['alerts']['channels']:
-            if channel == 'email':
-                channels['email'] = self._send_email
-            elif channel == 'webhook':
-                channels['webhook'] = self._send_webhook
-            elif channel == 'slack':
-                channels['slack'] = self._send_slack
-        return channels
+    def _grace_period(self, rule_name: str) -> float:
+        """接管告警的恢复判定宽限期，规则已删除时为0"""
+        rule = self.alert_rules.get(rule_name)
+        if rule is None:
+            return 0.0
+        window = rule.get('window', 0) if rule['kind'] == 'rate' else 0
+        return rule['duration'] + window + self.sample_interval
 
     def check_alerts(self, metrics: Dict) -> List[Dict]:
-        """检查告警条件"""
-        alerts = []
+        """检查告警条件，返回需要通知的状态变化（新触发与已恢复）"""
+        notifications = []
         current_time = datetime.utcnow()
+        now = time.time()
+
+        # 规则引擎按持续时间、变化率、缺失等条件增量评估
+        firing = self.rule_engine.evaluate(now, self._extract_samples(metrics))
+        seen = set()
+        for item in firing:
+            fingerprint = (item['rule'], item['series'])
+            seen.add(fingerprint)
+            self._grace.pop(fingerprint, None)
+            alert_id = self._open.get(fingerprint)
+            ongoing = self.store.get(alert_id) if alert_id is not None else None
+            if ongoing is not None and ongoing['status'] == 'active':
+                # 进行中的告警只更新，不重复通知
+                self.store.touch(alert_id, value=item['value'], last_seen=current_time)
+                continue
+            alert = self._create_alert(
+                item['rule'],
+                self._format_message(item),
+                item['value'],
+                current_time,
+                series=item['series']
+            )
+            self._open[fingerprint] = alert['id']
+            self._changed(alert)
+            if not self._record_transition(fingerprint, now, alert):
+                notifications.append(alert)
+
+        # 本周期不再触发的告警转为已恢复
+        for fingerprint in [fp for fp in self._open if fp not in seen]:
+            if self._grace.get(fingerprint, 0) > now:
+                continue
+            self._grace.pop(fingerprint, None)
+            alert = self.store.get(self._open.pop(fingerprint))
+            if alert is None or alert['status'] != 'active':
+                continue
+            self.store.update(alert['id'], status='resolved', resolved_at=current_time)
+            self._changed(alert)
+            if not self._record_transition(fingerprint, now, alert):
+                notifications.append(alert)
+
+        self._prune_transitions(now)
+        return notifications
+
+    def _changed(self, alert: Dict):
+        if self.on_change is not None:
+            self.on_change(alert)
+
+    def _record_transition(self, fingerprint: Tuple[str, str], now: float, alert: Dict) -> bool:
+        """记录状态切换，窗口内切换次数达到阈值时判定为抖动并抑制通知"""
+        transitions = self._transitions.get(fingerprint)
+        if transitions is None:
+            transitions = self._transitions[fingerprint] = deque(maxlen=self.flap_threshold)
+        transitions.append(now)
+        flapping = len(transitions) == self.flap_threshold and now - transitions[0] <= self.flap_window
+        if flapping != alert.get('flapping', False):
+            self.store.touch(alert['id'], flapping=flapping)
+        return flapping
+
+    def _prune_transitions(self, now: float):
+        if len(self._transitions) <= len(self._open) + 256:
+            return
+        stale = [fp for fp, transitions in self._transitions.items()
+                 if fp not in self._open and now - transitions[-1] > self.flap_window]
+        for fingerprint in stale:
+            del self._transitions[fingerprint]
+
+    def _extract_samples(self, metrics: Dict) -> Dict[str, tuple]:
+        """将采集结果整理为 指标名 -> (序列名列表, 数值列表)"""
+        if not metrics:
+            return {}
+        samples = {}
+        # 按来源IP的统计（去重IP数、白名单之外热点IP的速率）
+        ip_stats = metrics.get('access_log', {}).get('ip', {})
+        for metric in {rule['metric'] for rule in self.alert_rules.values()}:
+            if metric == 'bandwidth':
+                value = metrics['bandwidth']['bytes_sent'] + metrics['bandwidth']['bytes_recv']
+            else:
+                value = metrics.get(metric, ip_stats.get(metric))
+            if isinstance(value, (int, float)):
+                samples[metric] = (['host'], [float(value)])
+
+        # 各监控目标的响应时间作为独立序列
+        series, values = [], []
+        for result in metrics.get('targets', []):
+            if result.get('ok'):
+                series.append(f"target:{result['target']}")
+                values.append(result['response_time'])
+        if series and 'response_time' in samples:
+            host_series, host_values = samples['response_time']
+            samples['response_time'] = (host_series + series, host_values + values)
+        elif series:
+            samples['response_time'] = (series, values)
 
-        # 检查响应时间
-        if metrics['response_time'] > self.alert_rules['response_time']['threshold']:
-            alerts.append(self._create_alert(
-                'response_time',
-                f"响应时间过高: {metrics['response_time']:.2f}s",
-                metrics['response_time'],
-                current_time
-            ))
-
-        # 检查错误率
-        if metrics['error_rate'] > self.alert_rules['error_rate']['threshold']:
-            alerts.append(self._create_alert(
-                'error_rate',
-                f"错误率过高: {metrics['error_rate']:.2%}",
-                metrics['error_rate'],
-                current_time
-            ))
-
-        # 检查连接数
-        if metrics['connection_count'] > self.alert_rules['connection_count']['threshold']:
-            alerts.append(self._create_alert(
-                'connection_count',
-                f"连接数过高: {metrics['connection_count']}",
-                metrics['connection_count'],
-                current_time
-            ))
-
-        # 检查带宽使用
-        total_bandwidth = metrics['bandwidth']['bytes_sent'] + metrics['bandwidth']['bytes_recv']
-        if total_bandwidth > self.alert_rules['bandwidth']['threshold']:
-            alerts.append(self._create_alert(
-                'bandwidth',
-                f"带宽使用过高: {total_bandwidth / 1000000:.2f}MB/s",
-                total_bandwidth,
-                current_time
-            ))
-
-        return alerts
-
-    def _create_alert(self, alert_type: str, message: str, value: float, timestamp: datetime) -> Dict:
+        # 各TLS端点的证书剩余天数作为独立序列
+        endpoints, days = metrics.get('tls_expiry', ((), ()))
+        if len(endpoints):
+            samples['ssl_days_to_expiry'] = ([f"tls:{endpoint}" for endpoint in endpoints], days)
+        return samples
+
+    def _format_message(self, item: Dict) -> str:
+        """生成告警信息"""
+        rule = self.alert_rules[item['rule']]
+        if rule['kind'] == 'absence':
+            message = f"{item['metric']}数据缺失超过{rule['duration']:.0f}秒"
+        elif rule['kind'] == 'rate':
+            message = f"{item['metric']}变化率异常: {item['value']:.2f}/s"
+        else:
+            template = MESSAGE_TEMPLATES.get(item['metric'], "{metric}超过阈值: {value:.2f}")
+            message = template.format(metric=item['metric'], value=item['value'],
+                                      megabits=item['value'] * 8 / 1000000)
+        if item['series'] != 'host':
+            message = f"[{item['series']}] {message}"
+        return message
+
+    def _create_alert(self, alert_type: str, message: str, value: float, timestamp: datetime,
+                      series: str = 'host') -> Dict:
         """创建告警记录"""
+        alert_id = f"{alert_type}_{int(timestamp.timestamp())}"
+        if series != 'host':
+            alert_id = f"{alert_type}_{series}_{int(timestamp.timestamp())}"
         alert = {
-            'id': f"{alert_type}_{int(timestamp.timestamp())}",
+            'id': alert_id,
             'type': alert_type,
+            'series': series,
             'message': message,
             'value': value,
             'timestamp': timestamp,
             'severity': self.alert_rules[alert_type]['severity'],
-            'status': 'active'
+            'status': 'active',
+            'last_seen': timestamp
         }
-        self.alert_history.append(alert)
+        self.store.add(alert)
         return alert
 
     def send_notifications(self, alerts: List[Dict]):
-        """发送告警通知"""
-        for alert in alerts:
-            for channel, send_func in self.notification_channels.items():
-                try:
-                    send_func(alert)
-                except Exception as e:
-                    logger.error(f"Error sending {channel} notification: {str(e)}")
-
-    def _send_email(self, alert: Dict):
-        """发送邮件通知"""
-        msg = MIMEText(f"告警类型: {alert['type']}\n"
-                      f"告警信息: {alert['message']}\n"
-                      f"告警时间: {alert['timestamp']}\n"
-                      f"告警级别: {alert['severity']}")
-        
-        msg['Subject'] = f"[{alert['severity'].upper()}] Nginx监控告警"
-        msg['From'] = self.config['alerts']['email']['from']
-        msg['To'] = self.config['alerts']['email']['to']
-
-        with smtplib.SMTP(self.config['alerts']['email']['smtp_server']) as server:
-            server.starttls()
-            server.login(self.config['alerts']['email']['username'],
-                        self.config['alerts']['email']['password'])
-            server.send_message(msg)
-
-    def _send_webhook(self, alert: Dict):
-        """发送Webhook通知"""
-        webhook_url = self.config['alerts']['webhook']['url']
-        payload = {
-            'alert_id': alert['id'],
-            'type': alert['type'],
-            'message': alert['message'],
-            'timestamp': alert['timestamp'].isoformat(),
-            'severity': alert['severity']
-        }
-        
-        requests.post(webhook_url, json=payload)
-
-    def _send_slack(self, alert: Dict):
-        """发送Slack通知"""
-        webhook_url = self.config['alerts']['slack']['webhook_url']
-        payload = {
-            'text': f"*[{alert['severity'].upper()}] Nginx监控告警*\n"
-                   f"类型: {alert['type']}\n"
-                   f"信息: {alert['message']}\n"
-                   f"时间: {alert['timestamp']}"
-        }
-        
-        requests.post(webhook_url, json=payload)
+        """投递告警通知（由后台分发线程按渠道合并发送，不阻塞监控循环）"""
+        self.dispatcher.enqueue(alerts)
 
-    def get_alert_history(self, 
+    def get_alert_history(self,
                          start_time: Optional[datetime] = None,
                          end_time: Optional[datetime] = None,
-                         alert_type: Optional[str] = None) -> List[Dict]:
-        """获取告警历史"""
-        filtered_history = self.alert_history
+                         alert_type: Optional[str] = None,
+                         status: Optional[str] = None,
+                         severity: Optional[str] = None,
+                         cursor: Optional[int] = None,
+                         limit: int = 100) -> Dict:
+        """获取告警历史（按时间倒序分页）"""
+        items, next_cursor = self.store.query(start_time, end_time, cursor=cursor, limit=limit,
+                                              type=alert_type, status=status, severity=severity)
+        return {'items': items, 'next_cursor': next_cursor}
 
-        if start_time:
-            filtered_history = [a for a in filtered_history if a['timestamp'] >= start_time]
-        if end_time:
-            filtered_history = [a for a in filtered_history if a['timestamp'] <= end_time]
-        if alert_type:
-            filtered_history = [a for a in filtered_history if a['type'] == alert_type]
+    def active_count(self) -> int:
+        """活跃告警数量"""
+        return self.store.active_count()
 
-        return filtered_history
+    def resolve_alert(self, alert_id: str) -> Optional[Dict]:
+        """将告警标记为已解决"""
+        alert = self.store.update(alert_id, status='resolved', resolved_at=datetime.utcnow())
+        if alert is not None:
+            self._changed(alert)
+        return alert
 
-    def clear_alert_history(self, before_time: Optional[datetime] = None):
+    def clear_alert_history(self, before_time: Optional[datetime] = None, status: Optional[str] = None):
         """清理告警历史"""
-        if before_time:
-            self.alert_history = [a for a in self.alert_history if a['timestamp'] > before_time]
-        else:
-            self.alert_history = [] 
\ No newline at end of file
+        self.store.clear(before_time, status)
+
+    def close(self):
+        """停止通知分发"""
+        self.dispatcher.close()
\ No newline at end of file
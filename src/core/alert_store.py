@@ -0,0 +1,251 @@
+import os
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from loguru import logger
+from .store import to_epoch
+from .utils import parse_size
+
+# 建立索引的字段
+INDEXED_FIELDS = ('type', 'status', 'severity')
+
+
+class AlertStore:
+    """有界告警历史：按时间、类型、状态、级别索引，活跃告警O(1)计数，可选追加式持久化"""
+
+    def __init__(self, config: Dict):
+        store_config = config.get('alerts', {}).get('history', {})
+        self.max_alerts = int(store_config.get('max_alerts', 10000))
+        self.persist_path = store_config.get('persist_path')
+        self.max_file_bytes = parse_size(store_config.get('max_file_size', '50MB'))
+
+        self._lock = threading.RLock()
+        self._next_seq = 1
+        self._by_seq: Dict[int, Dict] = {}
+        self._by_id: Dict[str, int] = {}
+        # 按写入顺序排列的序号与时间戳（时间单调递增），_head之前为已淘汰
+        self._seqs: List[int] = []
+        self._times: List[float] = []
+        self._head = 0
+        self._index: Dict[str, Dict[str, Set[int]]] = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._active = 0
+        self._file = None
+
+        if self.persist_path:
+            self._load()
+            os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+            self._file = open(self.persist_path, 'a', encoding='utf-8')
+
+    def __len__(self) -> int:
+        return len(self._by_seq)
+
+    def active_count(self) -> int:
+        """活跃告警数量"""
+        return self._active
+
+    def add(self, alert: Dict) -> Dict:
+        """写入一条告警"""
+        with self._lock:
+            self._insert(alert)
+            self._append_log({'op': 'add', 'alert': alert})
+        return alert
+
+    def _insert(self, alert: Dict):
+        seq = self._next_seq
+        self._next_seq += 1
+        previous = self._by_id.pop(alert['id'], None)
+        if previous is not None:
+            self._remove(previous)
+        alert['seq'] = seq
+        self._by_seq[seq] = alert
+        self._by_id[alert['id']] = seq
+        self._seqs.append(seq)
+        self._times.append(to_epoch(alert['timestamp']))
+        for field in INDEXED_FIELDS:
+            self._index[field][alert.get(field)].add(seq)
+        if alert.get('status') == 'active':
+            self._active += 1
+        while len(self._by_seq) > self.max_alerts:
+            self._evict_oldest()
+
+    def _remove(self, seq: int):
+        alert = self._by_seq.pop(seq, None)
+        if alert is None:
+            return
+        for field in INDEXED_FIELDS:
+            bucket = self._index[field].get(alert.get(field))
+            if bucket is not None:
+                bucket.discard(seq)
+                if not bucket:
+                    del self._index[field][alert.get(field)]
+        if alert.get('status') == 'active':
+            self._active -= 1
+        if self._by_id.get(alert['id']) == seq:
+            del self._by_id[alert['id']]
+
+    def _evict_oldest(self):
+        while self._head < len(self._seqs):
+            seq = self._seqs[self._head]
+            self._head += 1
+            if seq in self._by_seq:
+                self._remove(seq)
+                break
+        # 已淘汰部分过半时压缩列表
+        if self._head > 1024 and self._head * 2 > len(self._seqs):
+            del self._seqs[:self._head]
+            del self._times[:self._head]
+            self._head = 0
+
+    def get(self, alert_id: str) -> Optional[Dict]:
+        seq = self._by_id.get(alert_id)
+        return self._by_seq.get(seq) if seq is not None else None
+
+    def update(self, alert_id: str, **changes) -> Optional[Dict]:
+        """更新告警字段（如状态），同步维护索引与活跃计数"""
+        with self._lock:
+            alert = self._apply_update(alert_id, changes)
+            if alert is not None:
+                self._append_log({'op': 'update', 'id': alert_id, 'changes': changes})
+            return alert
+
+    def touch(self, alert_id: str, **fields) -> Optional[Dict]:
+        """更新非索引字段（如最新值），仅修改内存不写持久化日志"""
+        with self._lock:
+            alert = self.get(alert_id)
+            if alert is not None:
+                alert.update((key, value) for key, value in fields.items() if key not in INDEXED_FIELDS)
+            return alert
+
+    def _apply_update(self, alert_id: str, changes: Dict) -> Optional[Dict]:
+        seq = self._by_id.get(alert_id)
+        alert = self._by_seq.get(seq) if seq is not None else None
+        if alert is None:
+            return None
+        was_active = alert.get('status') == 'active'
+        for field in INDEXED_FIELDS:
+            if field in changes and changes[field] != alert.get(field):
+                self._index[field][alert.get(field)].discard(seq)
+                self._index[field][changes[field]].add(seq)
+        alert.update(changes)
+        self._active += (alert.get('status') == 'active') - was_active
+        return alert
+
+    def query(self,
+              start_time: Optional[datetime] = None,
+              end_time: Optional[datetime] = None,
+              cursor: Optional[int] = None,
+              limit: int = 100,
+              **filters) -> Tuple[List[Dict], Optional[int]]:
+        """按条件倒序分页查询，返回(告警列表, 下一页游标)
+
+        filters 支持 type、status、severity；cursor 为上一页返回的游标。
+        """
+        with self._lock:
+            lo = bisect_left(self._times, to_epoch(start_time), self._head) if start_time else self._head
+            hi = bisect_right(self._times, to_epoch(end_time), self._head) if end_time else len(self._times)
+            if cursor is not None:
+                hi = min(hi, bisect_left(self._seqs, cursor, self._head))
+            if lo >= hi:
+                return [], None
+            min_seq, max_seq = self._seqs[lo], self._seqs[hi - 1]
+
+            active_filters = [(field, value) for field, value in filters.items()
+                              if field in INDEXED_FIELDS and value is not None]
+            if active_filters:
+                # 从最小的索引集合开始求交集
+                sets = sorted((self._index[field].get(value, set()) for field, value in active_filters), key=len)
+                candidates = set(sets[0])
+                for other in sets[1:]:
+                    candidates &= other
+                seqs = sorted((seq for seq in candidates if min_seq <= seq <= max_seq), reverse=True)
+            else:
+                seqs = (self._seqs[i] for i in range(hi - 1, lo - 1, -1))
+
+            items = []
+            next_cursor = None
+            for seq in seqs:
+                alert = self._by_seq.get(seq)
+                if alert is None:
+                    continue
+                if len(items) == limit:
+                    next_cursor = items[-1]['seq']
+                    break
+                items.append(alert)
+            return items, next_cursor
+
+    def clear(self, before_time: Optional[datetime] = None, status: Optional[str] = None):
+        """清理历史（可按时间上限与状态过滤，不指定则全部清理）"""
+        with self._lock:
+            self._apply_clear(before_time, status)
+            self._append_log({'op': 'clear', 'before': before_time, 'status': status})
+            self._compact()
+
+    def _apply_clear(self, before_time: Optional[datetime], status: Optional[str]):
+        if status is not None:
+            candidates = list(self._index['status'].get(status, ()))
+        else:
+            candidates = list(self._by_seq)
+        if before_time is not None:
+            limit = bisect_right(self._times, to_epoch(before_time), self._head)
+            max_seq = self._seqs[limit - 1] if limit > self._head else 0
+            candidates = [seq for seq in candidates if seq <= max_seq]
+        for seq in candidates:
+            self._remove(seq)
+
+    def _append_log(self, entry: Dict):
+        if self._file is None:
+            return
+        try:
+            self._file.write(json.dumps(entry, default=_json_default, ensure_ascii=False) + '\n')
+            self._file.flush()
+            if self._file.tell() > self.max_file_bytes:
+                self._compact()
+        except OSError as e:
+            logger.error(f"Error persisting alert history: {str(e)}")
+
+    def _compact(self):
+        """用当前内存中的告警重写持久化文件"""
+        if self._file is None:
+            return
+        temp_path = f"{self.persist_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for seq in self._seqs[self._head:]:
+                alert = self._by_seq.get(seq)
+                if alert is not None:
+                    f.write(json.dumps({'op': 'add', 'alert': alert}, default=_json_default,
+                                       ensure_ascii=False) + '\n')
+        self._file.close()
+        os.replace(temp_path, self.persist_path)
+        self._file = open(self.persist_path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """重放持久化文件，内存占用仍受max_alerts约束"""
+        if not os.path.exists(self.persist_path):
+            return
+        loaded = 0
+        with open(self.persist_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry['op'] == 'add':
+                    alert = entry['alert']
+                    alert['timestamp'] = datetime.fromisoformat(alert['timestamp'])
+                    self._insert(alert)
+                    loaded += 1
+                elif entry['op'] == 'update':
+                    self._apply_update(entry['id'], entry['changes'])
+                elif entry['op'] == 'clear':
+                    before = entry.get('before')
+                    self._apply_clear(datetime.fromisoformat(before) if before else None, entry.get('status'))
+        logger.info(f"Loaded {len(self._by_seq)} alerts from {self.persist_path} ({loaded} records)")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
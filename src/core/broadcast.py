@@ -0,0 +1,161 @@
+import json
+import asyncio
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+from loguru import logger
+from prometheus_client import Counter, Gauge
+from .snapshot import _json_default
+
+# 状态类主题推送全量+增量，事件类主题逐条推送
+STATE_TOPICS = ('metrics', 'status')
+EVENT_TOPICS = ('alerts',)
+
+
+def encode_event(event: str, data: Dict, event_id: Optional[int] = None) -> bytes:
+    """编码为一条SSE消息"""
+    body = json.dumps(data, default=_json_default, ensure_ascii=False)
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event}\ndata: {body}\n\n".encode('utf-8')
+
+
+class Subscription:
+    """单个订阅者：有界队列与订阅过滤条件，队列写满即断开"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, topics: FrozenSet[str],
+                 fields: Optional[FrozenSet[str]], severities: Optional[FrozenSet[str]], maxsize: int):
+        self.loop = loop
+        self.topics = topics
+        self.fields = fields
+        self.severities = severities
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def offer(self, message: Optional[bytes]):
+        """在订阅者所在事件循环中入队"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        """丢弃积压消息并放入结束标记"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class Broadcaster:
+    """推送广播：后台线程发布快照与告警变化，按订阅过滤后扇出到各客户端"""
+
+    def __init__(self, config: Dict):
+        stream_config = config.get('api', {}).get('stream', {})
+        self.queue_size = int(stream_config.get('queue_size', 64))
+        self.max_clients = int(stream_config.get('max_clients', 200))
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        self._version = 0
+
+        # Prometheus指标
+        self.clients = Gauge('stream_clients', 'Connected push feed clients')
+        self.dropped = Counter('stream_dropped_clients_total', 'Push feed clients dropped because they fell behind')
+        self.messages = Counter('stream_messages_total', 'Push feed messages delivered to client queues', ['topic'])
+
+    def subscribe(self, topics: Iterable[str], fields: Optional[Iterable[str]] = None,
+                  severities: Optional[Iterable[str]] = None) -> Optional[Subscription]:
+        """在事件循环中注册订阅者，先推送各状态主题的全量数据；超过连接上限返回None"""
+        subscription = Subscription(
+            asyncio.get_running_loop(),
+            frozenset(topics),
+            frozenset(fields) if fields else None,
+            frozenset(severities) if severities else None,
+            self.queue_size
+        )
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            for topic in STATE_TOPICS:
+                if topic in subscription.topics and topic in self._state:
+                    subscription.offer(encode_event(
+                        'snapshot',
+                        {'topic': topic, 'data': self._filter(self._state[topic], subscription.fields)},
+                        self._version
+                    ))
+            self._subscribers.add(subscription)
+            self.clients.set(len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription.closed:
+                self._drop(subscription)
+            else:
+                self._subscribers.discard(subscription)
+                self.clients.set(len(self._subscribers))
+
+    @staticmethod
+    def _filter(data: Dict, fields: Optional[FrozenSet[str]]) -> Dict:
+        if fields is None:
+            return data
+        return {key: value for key, value in data.items() if key in fields}
+
+    def publish_state(self, topic: str, state: Dict):
+        """发布状态主题的新版本，仅推送与上一版本不同的顶层字段"""
+        with self._lock:
+            previous = self._state.get(topic, {})
+            changes = {key: value for key, value in state.items() if previous.get(key) != value}
+            removed = [key for key in previous if key not in state]
+            # 快照各部分为只读视图，转为dict便于JSON编码
+            self._state[topic] = dict(state)
+            self._version += 1
+            if not changes and not removed:
+                return
+            # 相同过滤条件的订阅者共享一次编码结果
+            encoded: Dict[Optional[FrozenSet[str]], Optional[bytes]] = {}
+            for subscription in list(self._subscribers):
+                if topic not in subscription.topics:
+                    continue
+                if subscription.fields not in encoded:
+                    delta = self._filter(changes, subscription.fields)
+                    gone = [key for key in removed if subscription.fields is None or key in subscription.fields]
+                    encoded[subscription.fields] = encode_event(
+                        'delta', {'topic': topic, 'changes': delta, 'removed': gone}, self._version
+                    ) if delta or gone else None
+                message = encoded[subscription.fields]
+                if message is not None:
+                    self._deliver(subscription, topic, message)
+
+    def publish_event(self, topic: str, event: Dict):
+        """发布事件主题（如告警状态变化）"""
+        with self._lock:
+            self._version += 1
+            message = None
+            for subscription in list(self._subscribers):
+                if topic not in subscription.topics:
+                    continue
+                if subscription.severities is not None and event.get('severity') not in subscription.severities:
+                    continue
+                if message is None:
+                    message = encode_event(topic, event, self._version)
+                self._deliver(subscription, topic, message)
+
+    def _deliver(self, subscription: Subscription, topic: str, message: bytes):
+        if subscription.closed:
+            self._drop(subscription)
+            return
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            self.messages.labels(topic=topic).inc()
+        except RuntimeError:
+            # 事件循环已关闭
+            self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        if subscription in self._subscribers:
+            self._subscribers.discard(subscription)
+            self.clients.set(len(self._subscribers))
+            self.dropped.inc()
+            logger.warning("Dropping slow push feed client")
@@ -0,0 +1,152 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .utils import parse_duration, parse_size
+
+Columns = Dict[str, np.ndarray]
+
+
+class QueryCache:
+    """历史查询缓存：按时间桶对齐，按字节预算LRU淘汰
+
+    已结束超过seal_delay且数据完整的桶封口长期保留；实时桶按live_ttl过期，
+    空桶或点数不足的桶按partial_ttl过期（数据可能稍后补写，如缓冲文件重放）
+    """
+
+    def __init__(self, config: Dict):
+        cache_config = config.get('monitoring', {}).get('cache', {})
+        self.max_bytes = parse_size(cache_config.get('max_memory', '32MB'))
+        self.live_ttl = parse_duration(cache_config.get('live_ttl', '10s'))
+        self.seal_delay = parse_duration(cache_config.get('seal_delay', '2m'))
+        self.partial_ttl = parse_duration(cache_config.get('partial_ttl', '5m'))
+        # 点数达到该比例才视为完整
+        self.seal_min_fill = float(cache_config.get('seal_min_fill', 0.9))
+        self.bucket_points = int(cache_config.get('bucket_points', 240))
+        # key -> (columns, nbytes, expires_at)，expires_at为None表示已封口
+        self._entries: 'OrderedDict[Tuple, Tuple[Columns, int, Optional[float]]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'fetches': 0}
+
+    def bucket_size(self, step: float) -> float:
+        """给定数据粒度时单个缓存桶覆盖的时长"""
+        return step * self.bucket_points
+
+    def _get(self, key: Tuple, now: float) -> Optional[Columns]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        columns, nbytes, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            self._bytes -= nbytes
+            return None
+        self._entries.move_to_end(key)
+        return columns
+
+    def _put(self, key: Tuple, columns: Columns, expires_at: Optional[float]):
+        nbytes = sum(values.nbytes for values in columns.values())
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (columns, nbytes, expires_at)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_bytes, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_bytes
+            self.stats['evictions'] += 1
+
+    def get_range(self, query_key: str, start: float, end: float, step: float,
+                  fetch: Callable[[float, float], Columns]) -> Columns:
+        """读取[start, end)的数据：命中的桶直接复用，连续缺失的桶合并为一次查询
+
+        fetch(start, end) 出错时应抛出异常，避免把失败结果写入缓存。
+        """
+        now = time.time()
+        bucket = self.bucket_size(step)
+        first = math.floor(start / bucket) * bucket
+        bucket_starts = []
+        cursor = first
+        while cursor < end:
+            bucket_starts.append(cursor)
+            cursor += bucket
+
+        parts: Dict[float, Columns] = {}
+        missing: List[List[float]] = []
+        with self._lock:
+            for bucket_start in bucket_starts:
+                columns = self._get((query_key, bucket, bucket_start), now)
+                if columns is None:
+                    self.stats['misses'] += 1
+                    if missing and missing[-1][1] == bucket_start:
+                        missing[-1][1] = bucket_start + bucket
+                    else:
+                        missing.append([bucket_start, bucket_start + bucket])
+                else:
+                    self.stats['hits'] += 1
+                    parts[bucket_start] = columns
+
+        for run_start, run_end in missing:
+            self.stats['fetches'] += 1
+            fetched = fetch(run_start, run_end)
+            timestamps = fetched['timestamps']
+            with self._lock:
+                bucket_start = run_start
+                while bucket_start < run_end:
+                    lo = np.searchsorted(timestamps, bucket_start, side='left')
+                    hi = np.searchsorted(timestamps, bucket_start + bucket, side='left')
+                    # 拷贝切片，避免缓存项持有整段查询结果
+                    columns = {name: values[lo:hi].copy() for name, values in fetched.items()}
+                    parts[bucket_start] = columns
+                    self._put((query_key, bucket, bucket_start), columns,
+                              self._expiry(bucket_start + bucket, hi - lo, step, now))
+                    bucket_start += bucket
+
+        ordered = [parts[bucket_start] for bucket_start in bucket_starts if bucket_start in parts]
+        if not ordered:
+            return {'timestamps': np.empty(0)}
+        names = ordered[0].keys()
+        merged = {name: np.concatenate([part[name] for part in ordered]) for name in names}
+        mask = (merged['timestamps'] >= start) & (merged['timestamps'] < end)
+        return {name: values[mask] for name, values in merged.items()}
+
+    def _expiry(self, bucket_end: float, points: int, step: float, now: float) -> Optional[float]:
+        """缓存项过期时间，None表示封口"""
+        if bucket_end > now - max(self.seal_delay, step):
+            return now + self.live_ttl
+        if points < self.bucket_points * self.seal_min_fill:
+            return now + self.partial_ttl
+        return None
+
+    def invalidate(self, start: float, end: float):
+        """丢弃与[start, end]重叠的缓存桶（补写历史数据后调用）"""
+        with self._lock:
+            stale = [key for key in self._entries if key[2] <= end and key[2] + key[1] > start]
+            for key in stale:
+                _, nbytes, _ = self._entries.pop(key)
+                self._bytes -= nbytes
+
+    def purge_expired(self):
+        """清理已过期的实时桶"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, _, expires_at) in self._entries.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                _, nbytes, _ = self._entries.pop(key)
+                self._bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        """获取缓存状态"""
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
@@ -0,0 +1,73 @@
+import time
+import random
+from typing import Dict, Iterable, Optional, Set
+from .utils import parse_duration
+
+# 采集周期内的探测项（与NetworkMonitor.timeouts一致）
+PROBES = ('nginx', 'psutil', 'ssl', 'targets', 'logs')
+
+
+def probe_intervals(config: Dict) -> Dict[str, float]:
+    """各探测项的采集周期（秒）
+
+    默认与monitoring.interval相同，可在monitoring.intervals中逐项覆盖；
+    短于monitoring.interval时按monitoring.interval执行
+    """
+    monitoring = config.get('monitoring', {})
+    base = parse_duration(monitoring.get('interval', '5s'))
+    intervals = {probe: base for probe in PROBES}
+    for probe, value in monitoring.get('intervals', {}).items():
+        intervals[probe] = parse_duration(value)
+    return {probe: max(interval, base) for probe, interval in intervals.items()}
+
+
+class Cadence:
+    """单调时钟的固定节拍：下一次截止时间 = 上一次截止时间 + 周期，与执行耗时无关；
+    错过的节拍直接跳过，不补跑"""
+
+    def __init__(self, interval: float, jitter: float = 0.0, start: Optional[float] = None):
+        self.interval = interval
+        now = time.monotonic() if start is None else start
+        # 首次触发随机延后，避免多个实例或任务同时启动
+        self.deadline = now + (random.uniform(0, jitter) if jitter > 0 else 0.0)
+        self.skipped = 0
+
+    def due(self, now: Optional[float] = None) -> bool:
+        return (time.monotonic() if now is None else now) >= self.deadline
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        """距下一次截止时间的秒数"""
+        return max(0.0, self.deadline - (time.monotonic() if now is None else now))
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """进入下一个周期，返回因超时跳过的周期数"""
+        now = time.monotonic() if now is None else now
+        self.deadline += self.interval
+        skipped = 0
+        if self.deadline <= now:
+            skipped = int((now - self.deadline) // self.interval) + 1
+            self.deadline += skipped * self.interval
+            self.skipped += skipped
+        return skipped
+
+
+class ProbeCadence:
+    """按各探测项自己的周期判断本轮需要执行哪些探测；首次截止时间按monitoring.jitter各自随机错开，
+    避免周期相同的探测项始终在同一轮执行"""
+
+    def __init__(self, config: Dict, probes: Iterable[str] = PROBES):
+        intervals = probe_intervals(config)
+        jitter = parse_duration(config.get('monitoring', {}).get('jitter', '1s'))
+        start = time.monotonic()
+        self.cadences = {probe: Cadence(intervals[probe], jitter=min(jitter, intervals[probe]), start=start)
+                         for probe in probes}
+
+    def due(self, now: Optional[float] = None) -> Set[str]:
+        """返回到期的探测项，并推进其截止时间"""
+        now = time.monotonic() if now is None else now
+        due = set()
+        for probe, cadence in self.cadences.items():
+            if cadence.due(now):
+                cadence.advance(now)
+                due.add(probe)
+        return due
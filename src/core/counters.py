@@ -0,0 +1,98 @@
+import time
+from operator import attrgetter
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+import numpy as np
+import psutil
+
+# 部分网卡驱动与平台的计数器只有32位，到上限后从0重新计数
+WRAP_32 = np.uint64(1 << 32)
+HALF_32 = np.uint64(1 << 31)
+HALF_64 = np.uint64(1 << 63)
+
+NET_FIELDS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin', 'errout', 'dropin', 'dropout')
+# 计入带宽合计的字段
+BANDWIDTH_FIELDS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv')
+
+
+class CounterRates:
+    """累计计数器差分为速率：按键（如网卡名）保存上次计数与单调时间，处理回绕与重置"""
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self._getter = attrgetter(*self.fields)
+        self._keys: Tuple[str, ...] = ()
+        self._previous: Optional[np.ndarray] = None
+        self._previous_time: Optional[float] = None
+        # 识别为计数器重置（如网卡重建）的次数
+        self.resets = 0
+
+    def _values(self, counters) -> tuple:
+        values = self._getter(counters)
+        return values if len(self.fields) > 1 else (values,)
+
+    def update(self, counters: Mapping[str, object], now: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+        """写入一次采样（键 -> 计数器元组），返回各键的 {字段_per_sec: 速率}；首次出现的键没有速率"""
+        now = time.monotonic() if now is None else now
+        keys = tuple(counters)
+        current = np.array([self._values(counters[key]) for key in keys], dtype=np.uint64)
+        current = current.reshape(len(keys), len(self.fields))
+        previous, previous_time = self._previous, self._previous_time
+        known = np.zeros(len(keys), dtype=bool)
+        if previous is not None:
+            if keys != self._keys:
+                # 网卡增减时按名称对齐上次的计数
+                index = {key: i for i, key in enumerate(self._keys)}
+                known = np.array([key in index for key in keys], dtype=bool)
+                aligned = np.zeros_like(current)
+                aligned[known] = previous[[index[key] for key in keys if key in index]]
+                previous = aligned
+            else:
+                known[:] = True
+        self._keys, self._previous, self._previous_time = keys, current, now
+
+        elapsed = now - previous_time if previous_time is not None else 0.0
+        if elapsed <= 0 or not known.any():
+            return {}
+        deltas = self._deltas(current[known], previous[known])
+        rates = deltas.astype(np.float64) / elapsed
+        names = [f"{field}_per_sec" for field in self.fields]
+        known_keys = [key for key, ok in zip(keys, known) if ok]
+        return {key: dict(zip(names, row)) for key, row in zip(known_keys, rates.tolist())}
+
+    def _deltas(self, current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+        """计算增量：uint64减法自然处理64位回绕；32位回绕按距上限的距离判断，其余变小视为重置"""
+        deltas = current - previous
+        backwards = current < previous
+        if backwards.any():
+            with np.errstate(over='ignore'):
+                wrapped_32 = WRAP_32 - previous + current
+            is_wrap_32 = (previous < WRAP_32) & (wrapped_32 < HALF_32)
+            is_wrap_64 = deltas < HALF_64
+            # 重置后的计数即为重置以来的增量
+            is_reset = backwards & ~is_wrap_32 & ~is_wrap_64
+            self.resets += int(np.count_nonzero(is_reset.any(axis=-1)))
+            deltas = np.where(backwards & is_wrap_32, wrapped_32, deltas)
+            deltas = np.where(is_reset, current, deltas)
+        return deltas
+
+
+class InterfaceRates:
+    """按网卡采集流量计数并转为字节/秒、包/秒，带宽合计排除指定网卡（默认回环）"""
+
+    def __init__(self, config: Dict):
+        bandwidth_config = config.get('monitoring', {}).get('bandwidth', {})
+        self.exclude = set(bandwidth_config.get('exclude_interfaces', ['lo']))
+        self.rates = CounterRates(NET_FIELDS)
+
+    def sample(self) -> Dict:
+        """读取网卡计数器（阻塞调用，应在线程池中执行）"""
+        counters = psutil.net_io_counters(pernic=True)
+        interfaces = self.rates.update(counters)
+        totals = dict.fromkeys(BANDWIDTH_FIELDS, 0.0)
+        for nic, rates in interfaces.items():
+            if nic in self.exclude:
+                continue
+            for field in BANDWIDTH_FIELDS:
+                totals[field] += rates[f"{field}_per_sec"]
+        totals['interfaces'] = interfaces
+        return totals
@@ -0,0 +1,142 @@
+import sys
+import time
+import threading
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from prometheus_client import Counter, Histogram
+
+# 各阶段耗时的桶上界（秒），覆盖亚毫秒到十秒级
+TIMER_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# Prometheus指标（进程内共享，随 start_http_server 暴露）
+STAGE_SECONDS = Histogram('monitor_stage_seconds', 'Monitor loop stage duration in seconds', ['stage'],
+                          buckets=TIMER_BUCKETS)
+PROBE_SECONDS = Histogram('monitor_probe_seconds', 'Collection probe duration in seconds', ['probe'],
+                          buckets=TIMER_BUCKETS)
+IO_SECONDS = Histogram('monitor_io_seconds', 'Outbound I/O duration in seconds (InfluxDB writes, notifications)',
+                       ['operation'], buckets=TIMER_BUCKETS)
+LOOP_LAG = Histogram('monitor_loop_lag_seconds', 'Delay between the scheduled and actual start of a tick',
+                     buckets=TIMER_BUCKETS)
+TICK_OVERRUNS = Counter('monitor_tick_overruns_total', 'Ticks that took longer than the monitoring interval')
+TICKS_SKIPPED = Counter('monitor_ticks_skipped_total', 'Scheduled ticks skipped because the previous tick overran')
+
+_HISTOGRAMS = {'stage': STAGE_SECONDS, 'probe': PROBE_SECONDS, 'io': IO_SECONDS}
+# 缓存带标签的子指标，避免每次计时都查找标签
+_children: Dict[Tuple[str, str], object] = {}
+
+
+def _child(kind: str, name: str):
+    key = (kind, name)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = _HISTOGRAMS[kind].labels(name)
+    return child
+
+
+def observe(kind: str, name: str, seconds: float):
+    """记录一次已测得的耗时（kind: stage/probe/io）"""
+    _child(kind, name).observe(seconds)
+
+
+@contextmanager
+def timed(kind: str, name: str):
+    """计时上下文，异常时同样记录耗时；可包裹await"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _child(kind, name).observe(time.perf_counter() - start)
+
+
+class LoopStats:
+    """监控循环的调度延迟与超时统计"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stats = {'ticks': 0, 'overruns': 0, 'skipped': 0, 'last_lag': 0.0, 'last_duration': 0.0}
+
+    def begin(self, scheduled: Optional[float] = None) -> float:
+        """一轮开始，scheduled为计划开始的单调时间；返回开始时间"""
+        now = time.monotonic()
+        if scheduled is not None:
+            lag = max(0.0, now - scheduled)
+            LOOP_LAG.observe(lag)
+            self.stats['last_lag'] = lag
+        return now
+
+    def end(self, started: float) -> float:
+        """一轮结束，耗时超过采集周期时计为超时；返回耗时"""
+        duration = time.monotonic() - started
+        observe('stage', 'tick', duration)
+        self.stats['ticks'] += 1
+        self.stats['last_duration'] = duration
+        if duration > self.interval:
+            self.stats['overruns'] += 1
+            TICK_OVERRUNS.inc()
+        return duration
+
+    def skip(self, count: int):
+        """记录因超时跳过的节拍"""
+        if count:
+            self.stats['skipped'] += count
+            TICKS_SKIPPED.inc(count)
+
+
+class SamplingProfiler:
+    """按需采样分析：在后台线程中定期读取所有线程的调用栈并计数，同一时间只允许一个采集"""
+
+    def __init__(self, max_seconds: float = 30.0, min_interval: float = 0.001):
+        self.max_seconds = max_seconds
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def capture(self, seconds: float, interval: float = 0.01) -> Dict:
+        """采集seconds秒的调用栈（阻塞调用），返回 {stacks: {折叠栈: 次数}, samples, ...}"""
+        seconds = min(max(seconds, 0.0), self.max_seconds)
+        interval = max(interval, self.min_interval)
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("profiler is already running")
+        try:
+            return self._sample(seconds, interval)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float) -> Dict:
+        own = threading.get_ident()
+        stacks = StackCounter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stacks[self._fold(names.get(ident, str(ident)), frame)] += 1
+            samples += 1
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+        return {
+            'duration': time.monotonic() - started,
+            'interval': interval,
+            'samples': samples,
+            'stacks': dict(stacks.most_common())
+        }
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        """折叠为 线程;外层函数;...;内层函数 格式（flamegraph.pl / speedscope可直接读取）"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
@@ -0,0 +1,309 @@
+import math
+import struct
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from prometheus_client import REGISTRY
+from prometheus_client.core import HistogramMetricFamily
+from prometheus_client.utils import floatToGoString
+from .rollup import DEFAULT_TIERS
+from .store import align_columns, to_epoch
+from .utils import parse_duration
+
+# 分位数估计的相对误差；所有草图必须使用相同参数才能合并
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# 小于该值的延迟并入最低的桶（秒）
+MIN_VALUE = 1e-4
+
+# 默认上报的分位数
+QUANTILES = {'p50': 0.5, 'p95': 0.95, 'p99': 0.99, 'p999': 0.999}
+
+# Prometheus延迟直方图的桶上界（秒），覆盖毫秒级到十秒级的尾延迟
+PROMETHEUS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5,
+                      0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, float('inf'))
+
+# 序列化格式：魔数+版本号+(offset, total, sum, accuracy)，之后为各桶计数
+# 版本1无魔数与版本号，计数为uint32；版本2计数为uint64
+_MAGIC = b'LSK'
+_VERSION = 2
+_HEADER = struct.Struct('<3sBqqdd')
+_LEGACY_HEADER = struct.Struct('<qqdd')
+
+
+class LatencySketch:
+    """对数分桶的可合并延迟草图（DDSketch思路）：分位数相对误差不超过RELATIVE_ACCURACY"""
+
+    __slots__ = ('offset', 'counts', 'total', 'sum')
+
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+
+    def __len__(self) -> int:
+        return self.total
+
+    def _extend(self, low: int, high: int):
+        """扩展计数数组使其覆盖桶号[low, high]"""
+        if not len(self.counts):
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        new_low = min(low, self.offset)
+        new_high = max(high, self.offset + len(self.counts) - 1)
+        if new_low == self.offset and new_high == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(new_high - new_low + 1, dtype=np.int64)
+        start = self.offset - new_low
+        counts[start:start + len(self.counts)] = self.counts
+        self.offset = new_low
+        self.counts = counts
+
+    def add_many(self, values: np.ndarray):
+        """批量写入延迟样本（秒）"""
+        if not len(values):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        keys = np.ceil(np.log(np.maximum(values, MIN_VALUE)) / LOG_GAMMA).astype(np.int64)
+        low, high = int(keys.min()), int(keys.max())
+        self._extend(low, high)
+        self.counts += np.bincount(keys - self.offset, minlength=len(self.counts))
+        self.total += len(values)
+        self.sum += float(values.sum())
+
+    def merge(self, other: 'LatencySketch'):
+        if not other.total:
+            return
+        self._extend(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+        self.total += other.total
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float:
+        if not self.total:
+            return 0.0
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, q * (self.total - 1), side='right'))
+        # 取桶的中点值，保证相对误差
+        return 2 * GAMMA ** (self.offset + index) / (GAMMA + 1)
+
+    def quantiles(self, quantiles: Dict[str, float] = QUANTILES) -> Dict[str, float]:
+        result = {name: self.quantile(q) for name, q in quantiles.items()}
+        result['count'] = self.total
+        result['mean'] = self.sum / self.total if self.total else 0.0
+        return result
+
+    def compact(self) -> 'LatencySketch':
+        """去掉两端的空桶（封口后长期保存前调用）"""
+        nonzero = np.flatnonzero(self.counts)
+        if len(nonzero):
+            self.offset += int(nonzero[0])
+            self.counts = self.counts[nonzero[0]:nonzero[-1] + 1].copy()
+        else:
+            self.counts = np.zeros(0, dtype=np.int64)
+        return self
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, _VERSION, self.offset, self.total, self.sum, RELATIVE_ACCURACY) + \
+            self.counts.astype('<u8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'LatencySketch':
+        if data[:len(_MAGIC)] == _MAGIC:
+            _, version, offset, total, value_sum, accuracy = _HEADER.unpack_from(data)
+            if version != _VERSION:
+                raise ValueError(f"unsupported sketch version {version}")
+            dtype, start = '<u8', _HEADER.size
+        else:
+            offset, total, value_sum, accuracy = _LEGACY_HEADER.unpack_from(data)
+            dtype, start = '<u4', _LEGACY_HEADER.size
+        if accuracy != RELATIVE_ACCURACY:
+            raise ValueError(f"sketch accuracy {accuracy} does not match {RELATIVE_ACCURACY}")
+        sketch = cls()
+        sketch.offset = offset
+        sketch.total = total
+        sketch.sum = value_sum
+        sketch.counts = np.frombuffer(data, dtype=dtype, offset=start).astype(np.int64)
+        return sketch
+
+
+def merge_all(sketches: Iterable[LatencySketch]) -> LatencySketch:
+    merged = LatencySketch()
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
+
+
+class LatencyHistogram:
+    """由延迟草图累计的Prometheus直方图：按每个请求计数，而不是每个采集周期的均值；
+    草图桶跨越直方图桶边界时归入较低的桶，误差不超过2*RELATIVE_ACCURACY"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = PROMETHEUS_BUCKETS,
+                 registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.bounds = tuple(buckets)
+        self._finite = np.array([bound for bound in self.bounds if bound != float('inf')], dtype=np.float64)
+        self.counts = np.zeros(len(self._finite) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe_sketch(self, sketch: LatencySketch):
+        """并入一个采集周期的草图"""
+        if not sketch.total:
+            return
+        # 草图桶覆盖(γ^(k-1), γ^k]，按下界归入，恰好落在直方图桶上界的样本（如毫秒精度的日志）计入该桶
+        lower = GAMMA ** (sketch.offset - 1 + np.arange(len(sketch.counts), dtype=np.float64))
+        index = np.searchsorted(self._finite, lower, side='right')
+        with self._lock:
+            np.add.at(self.counts, index, sketch.counts)
+            self.sum += sketch.sum
+
+    def describe(self):
+        return [HistogramMetricFamily(self.name, self.documentation)]
+
+    def collect(self):
+        with self._lock:
+            cumulative = np.cumsum(self.counts).tolist()
+            total = self.sum
+        bounds = [floatToGoString(bound) for bound in self._finite] + ['+Inf']
+        return [HistogramMetricFamily(self.name, self.documentation,
+                                      buckets=list(zip(bounds, cumulative)), sum_value=total)]
+
+
+class SketchTier:
+    """单个粒度上按窗口保存的延迟草图"""
+
+    def __init__(self, step: float, capacity: int):
+        self.step = step
+        self.windows: deque = deque(maxlen=capacity)
+        self.open_start: Optional[float] = None
+        self.open_sketch = LatencySketch()
+
+    def add(self, timestamp: float, sketch: LatencySketch) -> Optional[Tuple[float, LatencySketch]]:
+        """并入一批样本，跨窗口时封口上一个窗口并返回"""
+        bucket = math.floor(timestamp / self.step) * self.step
+        sealed = None
+        if self.open_start is None or bucket > self.open_start:
+            if self.open_start is not None:
+                sealed = (self.open_start, self.open_sketch.compact())
+                self.windows.append(sealed)
+            self.open_start = bucket
+            self.open_sketch = LatencySketch()
+        self.open_sketch.merge(sketch)
+        return sealed
+
+    def oldest(self) -> Optional[float]:
+        return self.windows[0][0] if self.windows else self.open_start
+
+    def window(self, start: float, end: float) -> List[Tuple[float, LatencySketch]]:
+        """返回与[start, end]相交的窗口（含当前未封口窗口）"""
+        result = [(window_start, sketch) for window_start, sketch in self.windows
+                  if window_start + self.step > start and window_start <= end]
+        if self.open_start is not None and self.open_start + self.step > start and self.open_start <= end:
+            result.append((self.open_start, self.open_sketch))
+        return result
+
+
+class LatencyRollup:
+    """按降采样层级保存延迟草图，任意时间范围的分位数由窗口草图合并得到"""
+
+    def __init__(self, config: Dict, on_seal: Optional[Callable[[str, float, LatencySketch], None]] = None):
+        rollup_config = config.get('monitoring', {}).get('rollups', {})
+        tiers = rollup_config.get('tiers', DEFAULT_TIERS)
+        self.max_windows = int(config.get('monitoring', {}).get('latency', {}).get('max_merge', 2000))
+        self.tiers = sorted(
+            ((label, parse_duration(label), parse_duration(retention)) for label, retention in tiers.items()),
+            key=lambda tier: tier[1]
+        )
+        self._buffers = {label: SketchTier(step, max(1, int(retention / step)))
+                         for label, step, retention in self.tiers}
+        self.on_seal = on_seal
+        self._lock = threading.Lock()
+
+    def ingest(self, timestamp: datetime, sketch: LatencySketch):
+        if not sketch.total:
+            return
+        ts = to_epoch(timestamp)
+        sealed = []
+        with self._lock:
+            for label, buffer in self._buffers.items():
+                window = buffer.add(ts, sketch)
+                if window is not None:
+                    sealed.append((label, window))
+        if self.on_seal is not None:
+            for label, (start, window_sketch) in sealed:
+                self.on_seal(label, start, window_sketch)
+
+    def _choose(self, start: float, end: float, resolution: float = 0.0) -> Optional[str]:
+        """选取覆盖起始时间的层级：满足分辨率的最粗层级，合并窗口数超过上限时继续换更粗的层级"""
+        covering = []
+        for label, step, _ in self.tiers:
+            oldest = self._buffers[label].oldest()
+            if oldest is not None and oldest <= start:
+                covering.append((label, step))
+        if not covering:
+            return None
+        index = 0
+        for i, (_, step) in enumerate(covering):
+            if step <= resolution:
+                index = i
+        while index + 1 < len(covering) and (end - start) / covering[index][1] > self.max_windows:
+            index += 1
+        return covering[index][0]
+
+    def _overall_tier(self, start_ts: float, end_ts: float) -> str:
+        # 内存中的数据不覆盖起点时，使用能找到的最长历史
+        return self._choose(start_ts, end_ts) or self.tiers[-1][0]
+
+    def covered_since(self, start: datetime, end: datetime) -> Optional[float]:
+        """quantiles实际合并的最早时间（epoch秒）：内存中的草图不覆盖起点时晚于start，没有数据时为None"""
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        with self._lock:
+            oldest = self._buffers[self._overall_tier(start_ts, end_ts)].oldest()
+        return None if oldest is None else max(oldest, start_ts)
+
+    def quantiles(self, start: datetime, end: datetime,
+                  quantiles: Dict[str, float] = QUANTILES) -> Dict[str, float]:
+        """合并时间范围内的草图得到整体分位数（覆盖范围见covered_since）"""
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        with self._lock:
+            label = self._overall_tier(start_ts, end_ts)
+            merged = merge_all(sketch for _, sketch in self._buffers[label].window(start_ts, end_ts))
+        return merged.quantiles(quantiles)
+
+    def query_columns(self, start: datetime, end: datetime, interval: Optional[float] = None,
+                      max_points: Optional[int] = None,
+                      quantiles: Dict[str, float] = QUANTILES) -> Dict[str, np.ndarray]:
+        """按窗口返回分位数序列（列式）"""
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        resolution = float(interval or 0)
+        if max_points:
+            resolution = max(resolution, (end_ts - start_ts) / max_points)
+        with self._lock:
+            label = self._choose(start_ts, end_ts, resolution) or self.tiers[-1][0]
+            windows = [(window_start, sketch.quantiles(quantiles))
+                       for window_start, sketch in self._buffers[label].window(start_ts, end_ts)]
+        timestamps = np.array([window_start for window_start, _ in windows], dtype=np.float64)
+        columns = {name: (timestamps, np.array([values[name] for _, values in windows], dtype=np.float64))
+                   for name in list(quantiles) + ['count']}
+        return align_columns(columns)
+
+
+class RecentLatency:
+    """最近若干个采集周期的草图，合并后作为告警输入（滑动窗口）"""
+
+    def __init__(self, size: int):
+        self._sketches: deque = deque(maxlen=max(1, size))
+
+    def add(self, sketch: LatencySketch) -> Dict[str, float]:
+        self._sketches.append(sketch)
+        return merge_all(self._sketches).quantiles()
@@ -0,0 +1,240 @@
+import os
+import re
+import glob
+import json
+import time
+import threading
+from typing import Dict, Optional, Tuple
+import numpy as np
+from loguru import logger
+from .latency import LatencySketch
+from .sketch import IPStatsTracker
+from .utils import parse_duration, parse_size
+
+# 与 config/nginx/monitor.conf 中 log_format monitor 对应：combined 格式末尾追加 $request_time
+LINE_PATTERN = re.compile(
+    rb'^(\S+) \S+ \S+ \[[^\]\n]*\] "[^"\n]*" (\d{3}) (\d+|-) "[^"\n]*" "[^"\n]*" (\d+(?:\.\d+)?|-)',
+    re.MULTILINE
+)
+
+
+class LogTailer:
+    """单个日志文件的增量读取：识别轮转（inode变化）与截断，只返回完整行"""
+
+    def __init__(self, path: str, offset: int = 0, inode: Optional[Tuple[int, int]] = None,
+                 from_end: bool = True):
+        self.path = path
+        self._file = None
+        self._inode = None
+        self._partial = b''
+        self._open(offset, inode, from_end)
+
+    def _open(self, offset: int, inode: Optional[Tuple[int, int]], from_end: bool) -> bool:
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return False
+        stat = os.fstat(f.fileno())
+        current = (stat.st_dev, stat.st_ino)
+        if inode is not None and current == inode and offset <= stat.st_size:
+            # 同一文件，从上次的偏移继续
+            f.seek(offset)
+        elif inode is None and from_end:
+            f.seek(0, os.SEEK_END)
+        self._file = f
+        self._inode = current
+        self._partial = b''
+        return True
+
+    @property
+    def state(self) -> Dict:
+        """可持久化的读取位置（只记录完整行之后的偏移）"""
+        if self._file is None:
+            return {}
+        return {
+            'dev': self._inode[0],
+            'ino': self._inode[1],
+            'offset': self._file.tell() - len(self._partial)
+        }
+
+    def read(self, max_bytes: int) -> bytes:
+        """读取新增的完整行，单次最多约max_bytes字节"""
+        if self._file is None and not self._open(0, None, from_end=False):
+            return b''
+        data = self._file.read(max_bytes)
+        if not data:
+            if not self._check_rotation() or self._file is None:
+                return b''
+            data = self._file.read(max_bytes)
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        return data[:end]
+
+    def _check_rotation(self) -> bool:
+        """读到末尾后检查文件是否被轮转或截断，需要从新位置继续读取时返回True"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # 已轮转但新文件尚未创建，继续持有旧文件
+            return False
+        if (stat.st_dev, stat.st_ino) != self._inode:
+            logger.info(f"Access log {self.path} rotated, reopening")
+            self._file.close()
+            self._file = None
+            return self._open(0, None, from_end=False)
+        if stat.st_size < self._file.tell():
+            logger.info(f"Access log {self.path} truncated, reading from start")
+            self._file.seek(0)
+            self._partial = b''
+            return True
+        return False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LogStats:
+    """一个统计周期内的请求计数、状态码分类、流量与延迟分布"""
+
+    __slots__ = ('lines', 'requests', 'status_classes', 'bytes', 'sketch')
+
+    def __init__(self):
+        self.lines = 0
+        self.requests = 0
+        # 以状态码首位数字为下标
+        self.status_classes = [0] * 10
+        self.bytes = 0
+        # 可合并的延迟草图，按窗口保存后可查询任意时间范围的分位数
+        self.sketch = LatencySketch()
+
+    def parse(self, chunk: bytes, ip_tracker: Optional[IPStatsTracker] = None):
+        """批量解析完整行：一次findall取出所有字段，再在单个循环内累加"""
+        self.lines += chunk.count(b'\n')
+        classes = self.status_classes
+        total_bytes = 0
+        latencies = []
+        # 本批次按来源IP聚合，批次大小受读取块限制
+        ip_requests, ip_bytes, ip_errors = {}, {}, {}
+        matches = LINE_PATTERN.findall(chunk)
+        for addr, status, size, request_time in matches:
+            classes[status[0] - 48] += 1
+            ip_requests[addr] = ip_requests.get(addr, 0) + 1
+            if status[0] >= 52:
+                ip_errors[addr] = ip_errors.get(addr, 0) + 1
+            if size != b'-':
+                size = int(size)
+                total_bytes += size
+                ip_bytes[addr] = ip_bytes.get(addr, 0) + size
+            if request_time != b'-':
+                latencies.append(request_time)
+        self.requests += len(matches)
+        self.bytes += total_bytes
+        # 延迟整批转换并写入草图
+        self.sketch.add_many(np.array(latencies, dtype=np.float64))
+        if ip_tracker is not None:
+            ip_tracker.update(ip_requests, ip_bytes, ip_errors)
+
+    def summary(self, elapsed: float) -> Dict:
+        requests = self.requests
+        classes = {f"{digit}xx": self.status_classes[digit] for digit in range(1, 6)}
+        return {
+            'requests': requests,
+            'unparsed_lines': self.lines - requests,
+            'request_rate': requests / elapsed if elapsed > 0 else 0.0,
+            'status': classes,
+            'error_rate': classes['5xx'] / requests if requests else 0.0,
+            'client_error_rate': classes['4xx'] / requests if requests else 0.0,
+            'bytes': self.bytes,
+            'latency': self.sketch.quantiles()
+        }
+
+
+class AccessLogAnalyzer:
+    """增量读取Nginx访问日志，按采集周期输出请求速率、错误率与延迟分布"""
+
+    def __init__(self, config: Dict):
+        log_config = config.get('monitoring', {}).get('access_logs', {})
+        self.patterns = log_config.get('paths', [])
+        self.state_path = log_config.get('state_path', 'data/logtail_offsets.json')
+        self.chunk_size = parse_size(log_config.get('chunk_size', '4MB'))
+        self.max_bytes = parse_size(log_config.get('max_bytes_per_tick', '256MB'))
+        self.from_end = log_config.get('start_at', 'end') == 'end'
+        self.rescan_interval = parse_duration(log_config.get('rescan_interval', '1m'))
+        self._tailers: Dict[str, LogTailer] = {}
+        # 按来源IP的热点与去重统计
+        self.ip_stats = IPStatsTracker(config)
+        self._lock = threading.Lock()
+        self._last_collect = time.monotonic()
+        self._last_scan = float('-inf')
+        self._saved_state = self._load_state()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.patterns)
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        state = {path: tailer.state for path, tailer in self._tailers.items() if tailer.state}
+        if state == self._saved_state:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+            self._saved_state = state
+        except OSError as e:
+            logger.error(f"Error saving access log offsets: {str(e)}")
+
+    def _scan(self):
+        """按通配符发现新日志文件"""
+        for pattern in self.patterns:
+            for path in glob.glob(pattern):
+                if path in self._tailers:
+                    continue
+                saved = self._saved_state.get(path)
+                inode = (saved['dev'], saved['ino']) if saved else None
+                self._tailers[path] = LogTailer(path, saved['offset'] if saved else 0, inode, self.from_end)
+
+    def collect(self) -> Dict:
+        """读取自上次调用以来新增的日志并汇总（阻塞IO，应在线程池中调用）"""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_scan >= self.rescan_interval:
+                self._last_scan = now
+                self._scan()
+            stats = LogStats()
+            for tailer in self._tailers.values():
+                budget = self.max_bytes
+                while budget > 0:
+                    chunk = tailer.read(min(self.chunk_size, budget))
+                    if not chunk:
+                        break
+                    budget -= len(chunk)
+                    stats.parse(chunk, self.ip_stats)
+            self._save_state()
+            elapsed = now - self._last_collect
+            self._last_collect = now
+            summary = stats.summary(elapsed)
+            summary['ip'] = self.ip_stats.summary()
+            # 本周期的延迟草图，由监控器并入按窗口保存的草图
+            summary['latency_sketch'] = stats.sketch
+            return summary
+
+    def close(self):
+        with self._lock:
+            self._save_state()
+            for tailer in self._tailers.values():
+                tailer.close()
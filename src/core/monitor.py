@@ -1,66 +1,179 @@
-import time
-import psutil
-import requests
-from datetime import datetime
-from typing import Dict, List, Optional
+import base64
+import asyncio
+import aiohttp
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
 from loguru import logger
-from prometheus_client import Counter, Gauge, Histogram
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+from prometheus_client import Counter, Gauge
+import numpy as np
+from influxdb_client import Dialect, InfluxDBClient
+from .scheduler import TargetRegistry, ProbeScheduler, probe_http
+from .sharding import ShardedProbes
+from .cadence import ProbeCadence
+from .tls import CertificateScanner
+from .writer import BatchWriter, to_line_protocol
+from .store import MetricStore, to_epoch
+from .cache import QueryCache
+from .utils import parse_duration
+from .snapshot import SnapshotPublisher
+from .rollup import RollupEngine
+from .logtail import AccessLogAnalyzer
+from .counters import InterfaceRates
+from .instrument import timed
+from .latency import LatencyHistogram, LatencyRollup, LatencySketch, QUANTILES, RecentLatency
+
+# 近期历史查询返回的序列
+HISTORY_FIELDS = ['response_time', 'connection_count', 'error_rate', 'bytes_sent', 'bytes_recv', 'request_rate']
+# 序列名 -> nginx_metrics中的字段名：带宽速率（字节/秒）写入*_per_sec字段；
+# 旧版本在bytes_sent/bytes_recv字段中写入的是累计计数器，已停止写入，查询时不再读取
+INFLUX_FIELDS = {'bytes_sent': 'bytes_sent_per_sec', 'bytes_recv': 'bytes_recv_per_sec'}
 
 class NetworkMonitor:
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, query_cache: Optional[QueryCache] = None):
         self.config = config
         self.influx_client = InfluxDBClient(
             url=f"http://{config['database']['influxdb']['host']}:{config['database']['influxdb']['port']}",
             token=config['database']['influxdb']['password'],
             org="myorg"
         )
-        self.write_api = self.influx_client.write_api(write_options=SYNCHRONOUS)
+        self.writer = BatchWriter(config, self.influx_client)
+        
+        # 采集配置：Nginx状态地址及各探测项超时（秒）
+        monitoring = config.get('monitoring', {})
+        self.status_url = monitoring.get('nginx_status_url', 'http://localhost/status')
+        self.timeouts = {'nginx': 2.0, 'psutil': 1.0, 'ssl': 5.0, 'logs': 3.0}
+        self.timeouts.update(monitoring.get('timeouts', {}))
+        
+        # 各探测项按monitoring.intervals中各自的周期执行，未到期时沿用上次结果
+        self.cadence = ProbeCadence(config)
+        self._last_results = {'nginx': {}, 'psutil': {}, 'ssl': {}, 'targets': [], 'logs': {}}
+        self._loop = None
+        self._session = None
+        self._session_loop = None
+        
+        # 网卡流量速率（累计计数器差分）
+        self.interfaces = InterfaceRates(config)
+        
+        # 访问日志增量分析
+        self.access_logs = AccessLogAnalyzer(config)
+        
+        # 多目标探测
+        self.targets = TargetRegistry(config)
+        self.scheduler = ProbeScheduler(config)
+        
+        # 多进程分片探测（可选），目标较多时将探测分散到多个CPU核
+        sharding = monitoring.get('sharding', {})
+        self.shards = ShardedProbes(config, self.scheduler) if sharding.get('enabled', False) else None
+        
+        # TLS证书扫描（独立线程，按security.scan_interval执行）
+        self.tls = CertificateScanner(config, self.targets.all)
+        self._tls_version = self.targets.version
+        self.tls.start()
+        
+        # 近期指标内存存储
+        self.store = MetricStore(config)
+        
+        # 历史查询缓存（可与优化器共享）
+        self.query_cache = query_cache or QueryCache(config)
+        # 缓冲文件重放补写了历史数据，对应时间段的缓存作废
+        self.writer.on_replay = self.query_cache.invalidate
+        self.raw_step = parse_duration(monitoring.get('interval', '5s'))
+        
+        # 多粒度降采样，封口的桶写入InfluxDB
+        self.rollups = RollupEngine(config, HISTORY_FIELDS, on_seal=self._store_rollup)
+        
+        # 延迟分位数：按窗口保存可合并的草图，告警使用最近alert_window内的合并结果
+        latency_config = monitoring.get('latency', {})
+        self.latency = LatencyRollup(config, on_seal=self._store_latency_rollup)
+        alert_window = parse_duration(latency_config.get('alert_window', '1m'))
+        self.recent_latency = RecentLatency(round(alert_window / self.raw_step))
+        
+        # 对外发布的指标快照
+        self.snapshots = SnapshotPublisher()
         
         # Prometheus指标
-        self.response_time = Histogram('nginx_response_time_seconds', 'Response time in seconds')
+        self.response_time = LatencyHistogram('nginx_response_time_seconds',
+                                              'Request latency in seconds from the access log')
+        self.latency_quantiles = Gauge('nginx_request_latency_seconds',
+                                       'Request latency quantiles over the alert window', ['quantile'])
         self.error_rate = Counter('nginx_error_total', 'Total number of errors')
         self.connection_count = Gauge('nginx_connections', 'Number of active connections')
-        self.bandwidth_usage = Gauge('nginx_bandwidth_bytes', 'Bandwidth usage in bytes')
-        
-        # 性能缓存
-        self._cache = {}
-        self._cache_ttl = 60  # 缓存有效期（秒）
+        self.bandwidth_usage = Gauge('nginx_bandwidth_bytes', 'Bandwidth usage in bytes per second')
+        self.interface_rate = Gauge('network_interface_bytes_per_second', 'Per-interface traffic in bytes per second',
+                                    ['interface', 'direction'])
+
+    async def collect_metrics(self) -> Dict:
+        """收集网络性能指标（各探测项并发执行，互不阻塞）
 
-    def collect_metrics(self) -> Dict:
-        """收集网络性能指标"""
+        只能在监控线程的事件循环中调用：HTTP会话与后台任务都绑定该循环，
+        其他线程（如请求处理）应读取 snapshots 中发布的结果
+        """
+        self._bind_loop()
         try:
-            # 获取Nginx状态
-            nginx_status = self._get_nginx_status()
-            
-            # 获取系统网络统计
-            net_stats = psutil.net_io_counters()
+            # 只执行本轮到期的探测项，其余沿用上次结果
+            due = self.cadence.due()
+            probes = {
+                'nginx': lambda: self._with_deadline('nginx', self._get_nginx_status(), {}),
+                'psutil': lambda: self._with_deadline('psutil', self._run_blocking(self.interfaces.sample), {}),
+                'ssl': lambda: self._with_deadline('ssl', self._check_ssl_status(), {}),
+                'targets': lambda: self._timed('targets', self._probe_targets()),
+                'logs': lambda: self._with_deadline('logs', self._run_blocking(self.access_logs.collect), {})
+            }
+            names = [name for name in probes if name in due]
+            self._last_results.update(zip(names, await asyncio.gather(*(probes[name]() for name in names))))
+            nginx_status, bandwidth, ssl_status, target_results, access_log = (
+                self._last_results[name] for name in probes
+            )
             
-            # 获取SSL证书状态
-            ssl_status = self._check_ssl_status()
+            # 本周期的延迟草图并入各窗口，告警使用最近窗口合并后的分位数
+            sketch = access_log.pop('latency_sketch', None) or LatencySketch()
+            timestamp = datetime.utcnow()
+            self.latency.ingest(timestamp, sketch)
+            latency = self.recent_latency.add(sketch)
             
+            # 响应时间与错误率以访问日志为准（未配置日志时为0）
             metrics = {
-                'timestamp': datetime.utcnow(),
-                'response_time': nginx_status.get('response_time', 0),
+                'timestamp': timestamp,
+                'response_time': access_log.get('latency', {}).get('mean', 0.0),
                 'connection_count': nginx_status.get('active_connections', 0),
-                'error_rate': nginx_status.get('error_count', 0),
+                'error_rate': access_log.get('error_rate', 0.0),
+                'request_rate': access_log.get('request_rate', 0.0),
+                'latency': latency,
+                # 带宽为各网卡速率之和（字节/秒、包/秒）
                 'bandwidth': {
-                    'bytes_sent': net_stats.bytes_sent,
-                    'bytes_recv': net_stats.bytes_recv,
-                    'packets_sent': net_stats.packets_sent,
-                    'packets_recv': net_stats.packets_recv
+                    'bytes_sent': bandwidth.get('bytes_sent', 0.0),
+                    'bytes_recv': bandwidth.get('bytes_recv', 0.0),
+                    'packets_sent': bandwidth.get('packets_sent', 0.0),
+                    'packets_recv': bandwidth.get('packets_recv', 0.0)
                 },
-                'ssl_status': ssl_status
+                'interfaces': bandwidth.get('interfaces', {}),
+                'ssl_status': ssl_status,
+                'ssl_invalid': ssl_status.get('invalid', 0),
+                # 各端点证书剩余天数，作为告警的独立序列
+                'tls_expiry': self.tls.expiry(),
+                'access_log': access_log,
+                'targets': target_results,
+                'probe_stats': dict(self.shards.stats if self.shards is not None else self.scheduler.stats)
             }
+            for name in QUANTILES:
+                metrics[f"latency_{name}"] = latency[name]
             
             # 更新Prometheus指标
-            self.response_time.observe(metrics['response_time'])
-            self.error_rate.inc(metrics['error_rate'])
+            self.response_time.observe_sketch(sketch)
+            for name, q in QUANTILES.items():
+                self.latency_quantiles.labels(quantile=str(q)).set(latency[name])
+            if 'logs' in due:
+                self.error_rate.inc(access_log.get('status', {}).get('5xx', 0))
             self.connection_count.set(metrics['connection_count'])
             self.bandwidth_usage.set(metrics['bandwidth']['bytes_sent'] + metrics['bandwidth']['bytes_recv'])
+            for nic, rates in metrics['interfaces'].items():
+                self.interface_rate.labels(interface=nic, direction='sent').set(rates['bytes_sent_per_sec'])
+                self.interface_rate.labels(interface=nic, direction='recv').set(rates['bytes_recv_per_sec'])
             
-            # 存储到InfluxDB
+            # 写入近期存储，并存储到InfluxDB（仅入队，由后台写入器批量刷新）
+            flat_metrics = self._flatten_metrics(metrics)
+            self.store.record(metrics['timestamp'], flat_metrics)
+            self.rollups.ingest(metrics['timestamp'], flat_metrics)
             self._store_metrics(metrics)
             
             return metrics
@@ -69,84 +182,338 @@ class NetworkMonitor:
             logger.error(f"Error collecting metrics: {str(e)}")
             return {}
 
-    def _get_nginx_status(self) -> Dict:
+    async def _with_deadline(self, probe: str, coro, default):
+        """为单个探测项设置超时，超时或失败时返回默认值"""
+        try:
+            with timed('probe', probe):
+                return await asyncio.wait_for(coro, timeout=self.timeouts[probe])
+        except asyncio.TimeoutError:
+            logger.warning(f"Probe {probe} timed out after {self.timeouts[probe]}s")
+        except Exception as e:
+            logger.error(f"Error in probe {probe}: {str(e)}")
+        return default
+
+    async def _timed(self, probe: str, coro):
+        """记录探测项耗时（自带时限的探测项）"""
+        with timed('probe', probe):
+            return await coro
+
+    async def _run_blocking(self, func, *args):
+        """在线程池中执行阻塞调用，避免阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    def _bind_loop(self):
+        """绑定采集所用的事件循环，原循环关闭后才允许换绑"""
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop.is_closed():
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError("collect_metrics must run on the monitor's event loop")
+
+    def _get_session(self) -> Optional[aiohttp.ClientSession]:
+        """获取与当前事件循环绑定的HTTP会话"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop.is_closed():
+            connector = aiohttp.TCPConnector(
+                limit=self.scheduler.max_concurrency,
+                limit_per_host=self.scheduler.per_host_concurrency,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        elif self._session_loop is not loop:
+            # 会话不能跨事件循环复用
+            return None
+        return self._session
+
+    async def _get_nginx_status(self) -> Dict:
         """获取Nginx状态信息"""
         try:
-            response = requests.get('http://localhost/status')
-            if response.status_code == 200:
-                return self._parse_nginx_status(response.text)
-            return {}
+            session = self._get_session()
+            if session is None:
+                async with aiohttp.ClientSession() as temp_session:
+                    return await self._fetch_nginx_status(temp_session)
+            return await self._fetch_nginx_status(session)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Error getting Nginx status: {str(e)}")
             return {}
 
+    async def _fetch_nginx_status(self, session: aiohttp.ClientSession) -> Dict:
+        """请求Nginx状态页面"""
+        async with session.get(self.status_url) as response:
+            if response.status == 200:
+                return self._parse_nginx_status(await response.text())
+            return {}
+
+    async def _probe_targets(self) -> List[Dict]:
+        """探测全部目标；分片模式下读取各worker最近一轮的结果"""
+        if self.shards is not None:
+            return await self.shards.collect(self.targets)
+        return await self.scheduler.run_tick(self.targets.all(), self.probe_target)
+
+    async def probe_target(self, target: Dict) -> Dict:
+        """探测单个目标，记录状态码与响应时间"""
+        session = self._get_session()
+        owned = session is None
+        if owned:
+            session = aiohttp.ClientSession()
+        try:
+            return await probe_http(session, target)
+        finally:
+            if owned:
+                await session.close()
+
     def _parse_nginx_status(self, status_text: str) -> Dict:
-        """解析Nginx状态文本"""
+        """解析Nginx stub_status输出"""
+        # Active connections: 2
+        # server accepts handled requests
+        #  16 16 31
+        # Reading: 0 Writing: 1 Waiting: 1
         status = {}
-        for line in status_text.split('\n'):
-            if ':' in line:
-                key, value = line.split(':', 1)
-                status[key.strip()] = value.strip()
+        lines = status_text.strip().split('\n')
+        for i, line in enumerate(lines):
+            if line.startswith('Active connections:'):
+                status['active_connections'] = int(line.split(':', 1)[1])
+            elif line.strip().startswith('server accepts') and i + 1 < len(lines):
+                accepts, handled, requests = (int(v) for v in lines[i + 1].split())
+                status.update(accepts=accepts, handled=handled, requests=requests)
+            elif line.startswith('Reading:'):
+                parts = line.split()
+                status.update(reading=int(parts[1]), writing=int(parts[3]), waiting=int(parts[5]))
         return status
 
-    def _check_ssl_status(self) -> Dict:
-        """检查SSL证书状态"""
-        try:
-            # 实现SSL证书检查逻辑
-            return {
-                'valid': True,
-                'expiry_date': None,
-                'issuer': None
-            }
-        except Exception as e:
-            logger.error(f"Error checking SSL status: {str(e)}")
+    async def _check_ssl_status(self) -> Dict:
+        """获取SSL证书状态（证书扫描在独立线程中进行，此处只读取最近一次的汇总）"""
+        if self.targets.version != self._tls_version:
+            self._tls_version = self.targets.version
+            self.tls.refresh_endpoints()
+        return self.tls.status()
+
+    def build_metrics_view(self, metrics: Dict, resources: Dict) -> Dict:
+        """构造对外发布的指标视图（与MetricsResponse字段一致）"""
+        if not metrics:
             return {}
+        return {
+            'timestamp': metrics['timestamp'],
+            'response_time': float(metrics['response_time']),
+            'connection_count': int(metrics['connection_count']),
+            'error_rate': float(metrics['error_rate']),
+            'bandwidth': float(metrics['bandwidth']['bytes_sent'] + metrics['bandwidth']['bytes_recv']),
+            'request_rate': float(metrics.get('request_rate', 0.0)),
+            'latency': metrics.get('latency', {}),
+            'interfaces': metrics.get('interfaces', {}),
+            'access_log': metrics.get('access_log', {}),
+            'ssl_status': metrics['ssl_status'],
+            'resources': resources,
+            'probe_stats': metrics.get('probe_stats', {})
+        }
+
+    def _flatten_metrics(self, metrics: Dict) -> Dict[str, float]:
+        """将指标展开为序列名到数值的映射"""
+        values = {
+            'response_time': float(metrics['response_time']),
+            'connection_count': float(metrics['connection_count']),
+            'error_rate': float(metrics['error_rate']),
+            'bytes_sent': float(metrics['bandwidth']['bytes_sent']),
+            'bytes_recv': float(metrics['bandwidth']['bytes_recv']),
+            'request_rate': float(metrics.get('request_rate', 0.0))
+        }
+        for name in QUANTILES:
+            values[f"latency_{name}"] = float(metrics.get(f"latency_{name}", 0.0))
+        for nic, rates in metrics.get('interfaces', {}).items():
+            values[f"nic.{nic}.bytes_sent"] = rates['bytes_sent_per_sec']
+            values[f"nic.{nic}.bytes_recv"] = rates['bytes_recv_per_sec']
+        for result in metrics.get('targets', []):
+            if result.get('ok'):
+                values[f"target.{result['target']}.response_time"] = result['response_time']
+        return values
 
     def _store_metrics(self, metrics: Dict):
         """存储指标到InfluxDB"""
         try:
-            point = Point("nginx_metrics") \
-                .time(metrics['timestamp']) \
-                .field("response_time", metrics['response_time']) \
-                .field("connection_count", metrics['connection_count']) \
-                .field("error_rate", metrics['error_rate']) \
-                .field("bytes_sent", metrics['bandwidth']['bytes_sent']) \
-                .field("bytes_recv", metrics['bandwidth']['bytes_recv'])
-            
-            self.write_api.write(bucket="nginx_monitor", record=point)
+            self.writer.write(to_line_protocol("nginx_metrics", {
+                "response_time": float(metrics['response_time']),
+                "connection_count": int(metrics['connection_count']),
+                "error_rate": float(metrics['error_rate']),
+                INFLUX_FIELDS['bytes_sent']: float(metrics['bandwidth']['bytes_sent']),
+                INFLUX_FIELDS['bytes_recv']: float(metrics['bandwidth']['bytes_recv']),
+                "request_rate": float(metrics.get('request_rate', 0.0))
+            }, metrics['timestamp']))
             
         except Exception as e:
             logger.error(f"Error storing metrics: {str(e)}")
 
-    def get_historical_metrics(self, start_time: datetime, end_time: datetime) -> List[Dict]:
-        """获取历史指标数据"""
+    def _store_rollup(self, series: str, tier: str, bucket: tuple):
+        """存储封口的降采样桶"""
+        start, low, high, mean, count = bucket
         try:
-            query = f'''
-            from(bucket: "nginx_monitor")
-                |> range(start: {start_time.isoformat()}, stop: {end_time.isoformat()})
-                |> filter(fn: (r) => r["_measurement"] == "nginx_metrics")
-            '''
+            self.writer.write(to_line_protocol("nginx_metrics_rollup", {
+                "min": low,
+                "max": high,
+                "mean": mean,
+                "count": int(count)
+            }, datetime.utcfromtimestamp(start), tags={'tier': tier, 'series': series}))
+        except Exception as e:
+            logger.error(f"Error storing rollup: {str(e)}")
+
+    def _store_latency_rollup(self, tier: str, start: float, sketch: LatencySketch):
+        """存储封口窗口的延迟草图（附带分位数，便于直接查询）"""
+        try:
+            fields = sketch.quantiles()
+            fields['count'] = int(fields['count'])
+            fields['sketch'] = base64.b64encode(sketch.to_bytes()).decode('ascii')
+            self.writer.write(to_line_protocol("nginx_latency_rollup", fields,
+                                               datetime.utcfromtimestamp(start), tags={'tier': tier}))
+        except Exception as e:
+            logger.error(f"Error storing latency rollup: {str(e)}")
+
+    def get_latency_quantiles(self, start_time: datetime, end_time: datetime,
+                              interval: Optional[int] = None, max_points: Optional[int] = None) -> Dict:
+        """时间范围内的整体延迟分位数及按窗口的分位数序列（由草图合并得到）
+
+        只合并内存中保留的草图，起点早于保留范围时coverage标记实际覆盖的起点
+        """
+        covered = self.latency.covered_since(start_time, end_time)
+        return {
+            'overall': self.latency.quantiles(start_time, end_time),
+            'series': self.latency.query_columns(start_time, end_time, interval, max_points),
+            'coverage': {'start': covered, 'truncated': covered is None or covered > to_epoch(start_time)}
+        }
+
+    def _flux_time(self, value: datetime) -> str:
+        """转换为Flux使用的RFC3339时间（无时区信息按UTC处理）"""
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat() + 'Z'
+
+    def get_historical_metrics(self, start_time: datetime, end_time: datetime,
+                               interval: Optional[int] = None, max_points: Optional[int] = None) -> Dict:
+        """获取历史指标数据（列式），按请求分辨率自动选用降采样层级"""
+        try:
+            tier = self.rollups.select_tier(start_time, end_time, interval, max_points)
+            if tier is None:
+                # 近期窗口直接由内存存储返回
+                if self.store.covers(start_time, HISTORY_FIELDS):
+                    return self.store.query_columns(HISTORY_FIELDS, start_time, end_time)
+                label, step = None, self.raw_step
+            else:
+                label, step = tier
+                if self.rollups.covers(label, start_time):
+                    return self.rollups.query_columns(label, start_time, end_time)
             
-            result = self.influx_client.query_api().query(query)
-            return self._format_query_result(result)
+            # InfluxDB查询按时间桶缓存，重叠的时间范围只查询缺失部分
+            return self.query_cache.get_range(
+                f"nginx_metrics:{label or 'raw'}",
+                to_epoch(start_time),
+                to_epoch(end_time),
+                step,
+                lambda start, end: self._query_columns(self._history_query(label, start, end), HISTORY_FIELDS,
+                                                       INFLUX_FIELDS if label is None else None)
+            )
             
         except Exception as e:
             logger.error(f"Error getting historical metrics: {str(e)}")
-            return []
-
-    def _format_query_result(self, result) -> List[Dict]:
-        """格式化查询结果"""
-        formatted_data = []
-        for table in result:
-            for record in table.records:
-                formatted_data.append({
-                    'timestamp': record.get_time(),
-                    'field': record.get_field(),
-                    'value': record.get_value()
-                })
-        return formatted_data
+            return {'timestamps': np.empty(0)}
+
+    def _history_query(self, label: Optional[str], start: float, end: float) -> str:
+        """构造历史查询，在InfluxDB端按时间戳透视，每个时间戳一行"""
+        time_range = (f"range(start: {self._flux_time(datetime.utcfromtimestamp(start))}, "
+                      f"stop: {self._flux_time(datetime.utcfromtimestamp(end))})")
+        if label is None:
+            return f'''
+            from(bucket: "nginx_monitor")
+                |> {time_range}
+                |> filter(fn: (r) => r["_measurement"] == "nginx_metrics")
+                |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+            '''
+        # 查询对应层级的预聚合数据，点数与时间跨度无关
+        return f'''
+        from(bucket: "nginx_monitor")
+            |> {time_range}
+            |> filter(fn: (r) => r["_measurement"] == "nginx_metrics_rollup" and r["tier"] == "{label}")
+            |> filter(fn: (r) => r["_field"] == "mean")
+            |> pivot(rowKey: ["_time"], columnKey: ["series"], valueColumn: "_value")
+        '''
+
+    def _query_columns(self, query: str, names: List[str], fields: Optional[Dict[str, str]] = None) -> Dict:
+        """以CSV读取透视后的查询结果并直接组装为列，避免逐条构造记录对象
+
+        fields: 列名与序列名不同时的映射（序列名 -> 列名）
+        """
+        fields = fields or {}
+        rows = self.influx_client.query_api().query_csv(
+            query, dialect=Dialect(header=True, annotations=[])
+        )
+        index = None
+        timestamps = []
+        columns = {name: [] for name in names}
+        for row in rows:
+            if len(row) < 2:
+                continue
+            if '_time' in row:
+                # 每个结果表之前都有一行表头
+                index = {column: i for i, column in enumerate(row)}
+                continue
+            if index is None:
+                continue
+            timestamps.append(row[index['_time']].rstrip('Z'))
+            for name in names:
+                i = index.get(fields.get(name, name))
+                value = row[i] if i is not None else ''
+                columns[name].append(float(value) if value else np.nan)
+        
+        result = {
+            'timestamps': np.array(timestamps, dtype='datetime64[ns]').astype(np.int64) / 1e9
+        }
+        for name in names:
+            result[name] = np.array(columns[name], dtype=np.float64)
+        return result
+
+    def iter_historical_metrics(self, start_time: datetime, end_time: datetime,
+                                page: timedelta = timedelta(hours=1)) -> Iterator[List[Dict]]:
+        """按时间分页读取原始历史数据，每次只在内存中保留一页"""
+        cursor = start_time
+        while cursor < end_time:
+            page_end = min(cursor + page, end_time)
+            if self.store.covers(cursor, HISTORY_FIELDS):
+                rows = self.store.query_rows(HISTORY_FIELDS, cursor, page_end)
+                # 与InfluxDB的range一致，区间右端开放（最后一页除外）
+                if page_end < end_time:
+                    boundary = page_end.replace(tzinfo=timezone.utc) if page_end.tzinfo is None else page_end
+                    rows = [row for row in rows if row['timestamp'] < boundary]
+            else:
+                rows = list(self._stream_rows(cursor, page_end))
+            if rows:
+                yield rows
+            cursor = page_end
+
+    def _stream_rows(self, start_time: datetime, end_time: datetime) -> Iterator[Dict]:
+        """流式读取InfluxDB原始数据，按时间戳透视为行"""
+        query = f'''
+        from(bucket: "nginx_monitor")
+            |> range(start: {self._flux_time(start_time)}, stop: {self._flux_time(end_time)})
+            |> filter(fn: (r) => r["_measurement"] == "nginx_metrics")
+            |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        '''
+        for record in self.influx_client.query_api().query_stream(query):
+            row = {'timestamp': record.get_time()}
+            for field in HISTORY_FIELDS:
+                row[field] = record.values.get(INFLUX_FIELDS.get(field, field))
+            yield row
+
+    async def close(self):
+        """关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
 
     def cleanup(self):
         """清理资源"""
-        self.write_api.close()
+        if self.shards is not None:
+            self.shards.stop()
+        self.tls.close()
+        self.writer.close()
+        self.access_logs.close()
         self.influx_client.close() 
\ No newline at end of file
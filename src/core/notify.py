@@ -0,0 +1,424 @@
+import abc
+import time
+import heapq
+import smtplib
+import threading
+from collections import deque
+from datetime import datetime
+from email.mime.text import MIMEText
+from itertools import count
+from typing import Dict, List
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+from prometheus_client import Counter, Gauge
+from .instrument import timed
+from .utils import parse_duration
+
+# 各渠道默认并发数
+DEFAULT_CONCURRENCY = {'email': 1, 'webhook': 4, 'slack': 2}
+SEVERITY_ORDER = {'info': 0, 'warning': 1, 'critical': 2}
+STATUS_LABELS = {'active': '告警', 'resolved': '已恢复'}
+
+
+def _top_severity(alerts: List[Dict]) -> str:
+    return max((alert['severity'] for alert in alerts), key=lambda severity: SEVERITY_ORDER.get(severity, 0))
+
+
+def _subject(alerts: List[Dict]) -> str:
+    """单条告警沿用原标题，多条合并为摘要标题"""
+    subject = f"[{_top_severity(alerts).upper()}] Nginx监控告警"
+    if len(alerts) > 1:
+        subject = f"{subject} ({len(alerts)}条)"
+    elif alerts[0].get('status') == 'resolved':
+        subject = f"{subject} - 已恢复"
+    return subject
+
+
+class EmailChannel:
+    """邮件通知：每个工作线程复用一条已登录的SMTP连接"""
+
+    def __init__(self, config: Dict, timeout: float):
+        self.config = config['alerts']['email']
+        self.timeout = timeout
+        self.keepalive = parse_duration(self.config.get('keepalive', '60s'))
+        self._local = threading.local()
+        self._servers = set()
+        self._lock = threading.Lock()
+
+    def _connection(self) -> smtplib.SMTP:
+        server = getattr(self._local, 'server', None)
+        last_used = getattr(self._local, 'last_used', 0.0)
+        if server is not None and time.monotonic() - last_used > self.keepalive:
+            # 空闲过久的连接可能已被服务端断开，先探活
+            try:
+                server.noop()
+            except smtplib.SMTPException:
+                self.reset()
+                server = None
+        if server is None:
+            server = smtplib.SMTP(self.config['smtp_server'], self.config.get('smtp_port', smtplib.SMTP_PORT),
+                                  timeout=self.timeout)
+            server.starttls()
+            server.login(self.config['username'], self.config['password'])
+            self._local.server = server
+            with self._lock:
+                self._servers.add(server)
+        self._local.last_used = time.monotonic()
+        return server
+
+    def send(self, alerts: List[Dict]):
+        msg = MIMEText('\n\n'.join(
+            f"告警类型: {alert['type']}\n"
+            f"告警信息: {alert['message']}\n"
+            f"告警时间: {alert['timestamp']}\n"
+            f"告警级别: {alert['severity']}\n"
+            f"告警状态: {STATUS_LABELS.get(alert.get('status'), alert.get('status'))}"
+            for alert in alerts
+        ))
+        msg['Subject'] = _subject(alerts)
+        msg['From'] = self.config['from']
+        msg['To'] = self.config['to']
+        try:
+            self._connection().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # 连接失效时丢弃，由重试使用新连接
+            self.reset()
+            raise
+
+    def reset(self):
+        server = getattr(self._local, 'server', None)
+        self._local.server = None
+        if server is not None:
+            self._quit(server)
+
+    def _quit(self, server: smtplib.SMTP):
+        with self._lock:
+            self._servers.discard(server)
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def close(self):
+        with self._lock:
+            servers = list(self._servers)
+        for server in servers:
+            self._quit(server)
+
+
+class HTTPChannel(abc.ABC):
+    """HTTP通知基类：共享带连接池的Session，所有请求带超时"""
+
+    def __init__(self, url: str, timeout: float, pool_size: int):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @abc.abstractmethod
+    def payload(self, alerts: List[Dict]) -> Dict:
+        """构造请求体"""
+
+    def send(self, alerts: List[Dict]):
+        response = self.session.post(self.url, json=self.payload(alerts), timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+class WebhookChannel(HTTPChannel):
+    """Webhook通知：默认每条告警单独发送，请求体为单个告警对象；
+    webhook_format为digest时整条摘要一次发送，请求体为{count, alerts}"""
+
+    def __init__(self, config: Dict, timeout: float, pool_size: int):
+        super().__init__(config['alerts']['webhook']['url'], timeout, pool_size)
+        self.digest = config['alerts'].get('notify', {}).get('webhook_format', 'single') == 'digest'
+
+    @staticmethod
+    def _alert(alert: Dict) -> Dict:
+        return {
+            'alert_id': alert['id'],
+            'type': alert['type'],
+            'message': alert['message'],
+            'timestamp': alert['timestamp'].isoformat(),
+            'severity': alert['severity'],
+            'status': alert.get('status', 'active')
+        }
+
+    def payload(self, alerts: List[Dict]) -> Dict:
+        if not self.digest and len(alerts) == 1:
+            return self._alert(alerts[0])
+        return {'count': len(alerts), 'alerts': [self._alert(alert) for alert in alerts]}
+
+    def send(self, alerts: List[Dict]):
+        if self.digest:
+            super().send(alerts)
+            return
+        for alert in alerts:
+            super().send([alert])
+
+
+class SlackChannel(HTTPChannel):
+    """Slack通知"""
+
+    def __init__(self, config: Dict, timeout: float, pool_size: int):
+        super().__init__(config['alerts']['slack']['webhook_url'], timeout, pool_size)
+
+    def payload(self, alerts: List[Dict]) -> Dict:
+        if len(alerts) == 1:
+            alert = alerts[0]
+            return {
+                'text': f"*{_subject(alerts)}*\n"
+                        f"类型: {alert['type']}\n"
+                        f"信息: {alert['message']}\n"
+                        f"时间: {alert['timestamp']}"
+            }
+        lines = [f"*{_subject(alerts)}*"]
+        for alert in alerts:
+            lines.append(f"{STATUS_LABELS.get(alert.get('status'), '')} 类型: {alert['type']} | "
+                         f"信息: {alert['message']} | 时间: {alert['timestamp']}")
+        return {'text': '\n'.join(lines)}
+
+
+class DelayQueue:
+    """按到期时间出队的有界队列，用于首次投递与退避重试"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._heap = []
+        self._seq = count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def put(self, item, delay: float = 0.0, force: bool = False) -> bool:
+        """入队，队列已满时返回False（重试项force入队，不因满而丢失）"""
+        with self._cond:
+            if self._closed or (not force and len(self._heap) >= self.maxsize):
+                return False
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item))
+            self._cond.notify()
+            return True
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get(self):
+        """阻塞直到有到期项；关闭后不再等待到期时间，依次取出剩余项，取空后返回None"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return heapq.heappop(self._heap)[2] if self._heap else None
+                if self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def close(self):
+        """停止接收新项，已入队的项仍可取出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def drain(self) -> list:
+        """取出全部剩余项"""
+        with self._cond:
+            items = [entry[2] for entry in sorted(self._heap)]
+            self._heap = []
+            return items
+
+
+class TokenBucket:
+    """令牌桶限流"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """取一个令牌，成功返回0，否则返回还需等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class NotificationDispatcher:
+    """后台通知分发：每个渠道独立队列与工作线程，同一时段的告警合并为摘要，按渠道限流，
+    失败按指数退避重试，超过次数进入死信队列"""
+
+    def __init__(self, config: Dict):
+        notify_config = config['alerts'].get('notify', {})
+        self.queue_size = int(notify_config.get('queue_size', 1000))
+        self.max_retries = int(notify_config.get('max_retries', 5))
+        self.backoff = parse_duration(notify_config.get('backoff', '2s'))
+        self.max_backoff = parse_duration(notify_config.get('max_backoff', '5m'))
+        self.timeout = parse_duration(notify_config.get('timeout', '10s'))
+        self.group_wait = parse_duration(notify_config.get('group_wait', '10s'))
+        self.max_group = int(notify_config.get('max_group', 50))
+        concurrency = dict(DEFAULT_CONCURRENCY, **notify_config.get('concurrency', {}))
+        # 每分钟最多发送的摘要数，未配置则不限流
+        rate_limits = notify_config.get('rate_limit', {})
+
+        self.channels = {}
+        for name in config['alerts'].get('channels', []):
+            workers = max(1, int(concurrency.get(name, 1)))
+            try:
+                if name == 'email':
+                    channel = EmailChannel(config, self.timeout)
+                elif name == 'webhook':
+                    channel = WebhookChannel(config, self.timeout, workers)
+                elif name == 'slack':
+                    channel = SlackChannel(config, self.timeout, workers)
+                else:
+                    continue
+            except KeyError as e:
+                logger.error(f"Error initializing {name} notification channel: missing {str(e)}")
+                continue
+            self.channels[name] = (channel, DelayQueue(self.queue_size), workers)
+
+        self._buckets: Dict[str, TokenBucket] = {
+            name: TokenBucket(float(rate_limits[name]) / 60, int(rate_limits[name]))
+            for name in self.channels if rate_limits.get(name)
+        }
+        # 各渠道尚未开始发送、仍可合并新告警的摘要
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.dead_letters = deque(maxlen=int(notify_config.get('dead_letter_size', 500)))
+        self._threads: List[threading.Thread] = []
+
+        # Prometheus指标
+        self.sent = Counter('notifications_sent_total', 'Notifications delivered', ['channel'])
+        self.failures = Counter('notification_failures_total', 'Failed notification attempts', ['channel'])
+        self.dropped = Counter('notifications_dropped_total', 'Alerts dropped because the queue was full',
+                               ['channel'])
+        self.deferred = Counter('notifications_rate_limited_total', 'Digests deferred by the channel rate limit',
+                                ['channel'])
+        self.dead = Counter('notification_dead_letters_total', 'Notifications moved to the dead-letter queue',
+                            ['channel'])
+        self.queue_depth = Gauge('notification_queue_depth', 'Notifications waiting to be sent', ['channel'])
+
+        for name, (channel, queue, workers) in self.channels.items():
+            for i in range(workers):
+                thread = threading.Thread(target=self._worker, args=(name, channel, queue),
+                                          name=f"notify-{name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, alerts: List[Dict]):
+        """投递一批告警到各渠道，合并进尚未发送的摘要，不阻塞调用方"""
+        if not alerts:
+            return
+        # 拷贝一份，避免发送期间告警记录被更新
+        alerts = [dict(alert) for alert in alerts]
+        for name, (_, queue, _) in self.channels.items():
+            with self._lock:
+                rest = alerts
+                pending = self._pending.get(name)
+                if pending is not None and len(pending['alerts']) < self.max_group:
+                    room = self.max_group - len(pending['alerts'])
+                    pending['alerts'].extend(rest[:room])
+                    rest = rest[room:]
+                while rest:
+                    item = {'alerts': rest[:self.max_group], 'attempt': 0}
+                    rest = rest[self.max_group:]
+                    if queue.put(item, delay=self.group_wait):
+                        self._pending[name] = item
+                    else:
+                        self.dropped.labels(channel=name).inc(len(item['alerts']))
+                        logger.warning(f"Notification queue for {name} is full, dropping {len(item['alerts'])} alerts")
+            self.queue_depth.labels(channel=name).set(len(queue))
+
+    def _worker(self, name: str, channel, queue: DelayQueue):
+        bucket = self._buckets.get(name)
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            with self._lock:
+                if self._pending.get(name) is item:
+                    del self._pending[name]
+                # 关闭时立即发送剩余摘要，不再按限流推迟
+                wait = bucket.reserve() if bucket is not None and not queue.closed else 0.0
+                if wait > 0:
+                    # 超出限流时推迟发送，等待期间新告警继续并入该摘要
+                    if item['attempt'] == 0 and name not in self._pending:
+                        self._pending[name] = item
+                    queue.put(item, delay=wait, force=True)
+                    self.deferred.labels(channel=name).inc()
+                    continue
+            self.queue_depth.labels(channel=name).set(len(queue))
+            try:
+                with timed('io', f"notify_{name}"):
+                    channel.send(item['alerts'])
+                self.sent.labels(channel=name).inc()
+            except Exception as e:
+                self.failures.labels(channel=name).inc()
+                item['attempt'] += 1
+                if item['attempt'] > self.max_retries:
+                    self._dead_letter(name, item, e)
+                    continue
+                delay = min(self.max_backoff, self.backoff * 2 ** (item['attempt'] - 1))
+                # 队列已关闭时不再重试
+                if not queue.put(item, delay=delay, force=True):
+                    self._dead_letter(name, item, e)
+                    continue
+                logger.warning(f"Error sending {name} notification (attempt {item['attempt']}), "
+                               f"retrying in {delay:.0f}s: {str(e)}")
+
+    def _dead_letter(self, name: str, item: Dict, error: Exception):
+        logger.error(f"Error sending {name} notification, giving up after {item['attempt']} attempts: {str(error)}")
+        self.dead.labels(channel=name).inc()
+        self.dead_letters.append({
+            'channel': name,
+            'alerts': item['alerts'],
+            'attempts': item['attempt'],
+            'error': str(error),
+            'failed_at': datetime.utcnow()
+        })
+
+    def retry_dead_letters(self) -> int:
+        """将死信队列中的通知重新投递"""
+        retried = 0
+        while self.dead_letters:
+            entry = self.dead_letters.popleft()
+            channel = self.channels.get(entry['channel'])
+            if channel is not None and channel[1].put({'alerts': entry['alerts'], 'attempt': 0}, force=True):
+                retried += 1
+        return retried
+
+    def get_stats(self) -> Dict:
+        """获取各渠道队列状态"""
+        return {
+            'queues': {name: len(queue) for name, (_, queue, _) in self.channels.items()},
+            'dead_letters': len(self.dead_letters)
+        }
+
+    def close(self, timeout: float = 5.0):
+        """停止工作线程并释放连接：等待中的摘要与重试立即各发送一次，超时仍未发送的转入死信队列"""
+        for _, queue, _ in self.channels.values():
+            queue.close()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        for name, (_, queue, _) in self.channels.items():
+            for item in queue.drain():
+                self._dead_letter(name, item, RuntimeError('dispatcher closed before delivery'))
+            self.queue_depth.labels(channel=name).set(0)
+        for channel, _, _ in self.channels.values():
+            channel.close()
@@ -1,49 +1,39 @@
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List
 from loguru import logger
-import psutil
-import threading
 from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+from .sampler import ResourceSampler
+from .cache import QueryCache
+from .store import to_epoch
 
 class PerformanceOptimizer:
     def __init__(self, config: Dict):
         self.config = config
         self.executor = ThreadPoolExecutor(max_workers=4)
-        self._cache = {}
-        self._cache_ttl = 60  # 缓存有效期（秒）
+        self.query_cache = QueryCache(config)
         self._last_cleanup = time.time()
         self._cleanup_interval = 300  # 清理间隔（秒）
+        
+        # 后台资源采样
+        self.sampler = ResourceSampler(config)
+        self.sampler.start()
 
-    @lru_cache(maxsize=1000)
-    def get_cached_metrics(self, metric_type: str, start_time: datetime, end_time: datetime) -> List[Dict]:
-        """获取缓存的指标数据"""
-        cache_key = f"{metric_type}_{start_time.timestamp()}_{end_time.timestamp()}"
-        if cache_key in self._cache:
-            cache_data = self._cache[cache_key]
-            if time.time() - cache_data['timestamp'] < self._cache_ttl:
-                return cache_data['data']
-        return []
-
-    def cache_metrics(self, metric_type: str, data: List[Dict], start_time: datetime, end_time: datetime):
-        """缓存指标数据"""
-        cache_key = f"{metric_type}_{start_time.timestamp()}_{end_time.timestamp()}"
-        self._cache[cache_key] = {
-            'data': data,
-            'timestamp': time.time()
-        }
+    def get_cached_metrics(self, metric_type: str, start_time: datetime, end_time: datetime,
+                           step: float, fetch) -> Dict:
+        """获取缓存的指标数据，缺失的时间桶通过fetch(start, end)补齐"""
+        return self.query_cache.get_range(metric_type, to_epoch(start_time), to_epoch(end_time), step, fetch)
 
-    def optimize_query(self, query: str) -> str:
+    def optimize_query(self, query: str, every: str = '1m', fn: str = 'mean') -> str:
         """优化查询语句"""
         # 添加时间范围限制
         if 'range' not in query:
             query = f"{query} |> range(start: -1h)"
         
-        # 添加聚合操作
+        # 添加聚合操作（窗口由调用方按请求分辨率给出）
         if 'aggregate' not in query:
-            query = f"{query} |> aggregateWindow(every: 1m, fn: mean)"
+            query = f"{query} |> aggregateWindow(every: {every}, fn: {fn})"
         
         return query
 
@@ -117,17 +107,8 @@ class PerformanceOptimizer:
         return cleaned
 
     def monitor_resources(self) -> Dict:
-        """监控系统资源使用情况"""
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        
-        return {
-            'cpu_percent': cpu_percent,
-            'memory_percent': memory.percent,
-            'disk_percent': disk.percent,
-            'timestamp': datetime.utcnow()
-        }
+        """监控系统资源使用情况（返回后台采样线程的最新结果，不阻塞）"""
+        return self.sampler.latest()
 
     def cleanup(self):
         """清理资源"""
@@ -139,13 +120,7 @@ class PerformanceOptimizer:
 
     def _cleanup_cache(self):
         """清理过期缓存"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, data in self._cache.items()
-            if current_time - data['timestamp'] > self._cache_ttl
-        ]
-        for key in expired_keys:
-            del self._cache[key]
+        self.query_cache.purge_expired()
 
     def optimize_performance(self, metrics: Dict) -> Dict:
         """优化性能指标"""
@@ -169,4 +144,5 @@ class PerformanceOptimizer:
 
     def __del__(self):
         """清理资源"""
+        self.sampler.stop()
         self.executor.shutdown(wait=True) 
\ No newline at end of file
@@ -0,0 +1,164 @@
+import math
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .store import align_columns, to_epoch
+from .utils import parse_duration
+
+# 默认降采样层级：粒度 -> 保留时长
+DEFAULT_TIERS = {'1m': '1d', '5m': '7d', '1h': '30d', '1d': '365d'}
+
+
+class TierBuffer:
+    """单个序列在单个粒度上的聚合环形缓冲区（min/max/sum/count）"""
+
+    def __init__(self, name: str, step: float, capacity: int):
+        self.name = name
+        self.step = step
+        self.capacity = capacity
+        self.starts = np.zeros(capacity, dtype=np.float64)
+        self.mins = np.zeros(capacity, dtype=np.float64)
+        self.maxs = np.zeros(capacity, dtype=np.float64)
+        self.sums = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self._head = 0
+        self._size = 0
+        # 当前未封口的桶
+        self.open_start = None
+        self.open_min = self.open_max = self.open_sum = 0.0
+        self.open_count = 0
+
+    def add(self, timestamp: float, value: float) -> Optional[Tuple]:
+        """累加样本，跨桶时封口上一个桶并返回其聚合结果"""
+        bucket = math.floor(timestamp / self.step) * self.step
+        sealed = None
+        if self.open_start is not None and bucket > self.open_start:
+            sealed = self._seal()
+        if self.open_start is None or bucket > self.open_start:
+            self.open_start = bucket
+            self.open_min = self.open_max = self.open_sum = value
+            self.open_count = 1
+        else:
+            # 迟到的样本并入当前桶
+            self.open_min = min(self.open_min, value)
+            self.open_max = max(self.open_max, value)
+            self.open_sum += value
+            self.open_count += 1
+        return sealed
+
+    def _seal(self) -> Tuple:
+        i = self._head
+        self.starts[i] = self.open_start
+        self.mins[i] = self.open_min
+        self.maxs[i] = self.open_max
+        self.sums[i] = self.open_sum
+        self.counts[i] = self.open_count
+        self._head = (self._head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+        return (self.open_start, self.open_min, self.open_max, self.open_sum / self.open_count, self.open_count)
+
+    def oldest(self) -> Optional[float]:
+        if self._size:
+            return float(self.starts[(self._head - self._size) % self.capacity])
+        return self.open_start
+
+    def window(self, start: float, end: float) -> Dict[str, np.ndarray]:
+        """返回[start, end]内的已封口桶及当前桶"""
+        first = (self._head - self._size) % self.capacity
+        order = (np.arange(self._size) + first) % self.capacity
+        starts = self.starts[order]
+        lo = np.searchsorted(starts, start - self.step, side='right')
+        hi = np.searchsorted(starts, end, side='right')
+        index = order[lo:hi]
+        result = {
+            'timestamps': starts[lo:hi],
+            'min': self.mins[index],
+            'max': self.maxs[index],
+            'mean': self.sums[index] / np.maximum(self.counts[index], 1),
+            'count': self.counts[index]
+        }
+        if self.open_start is not None and start - self.step < self.open_start <= end:
+            result = {
+                'timestamps': np.append(result['timestamps'], self.open_start),
+                'min': np.append(result['min'], self.open_min),
+                'max': np.append(result['max'], self.open_max),
+                'mean': np.append(result['mean'], self.open_sum / self.open_count),
+                'count': np.append(result['count'], self.open_count)
+            }
+        return result
+
+
+class RollupEngine:
+    """多粒度增量降采样：样本到达时更新各层级聚合，查询自动选取最粗可用层级"""
+
+    def __init__(self, config: Dict, series: List[str],
+                 on_seal: Optional[Callable[[str, str, Tuple], None]] = None):
+        rollup_config = config.get('monitoring', {}).get('rollups', {})
+        tiers = rollup_config.get('tiers', DEFAULT_TIERS)
+        self.series = list(rollup_config.get('series', series))
+        # 按粒度从细到粗排列
+        self.tiers = sorted(
+            ((label, parse_duration(label), parse_duration(retention)) for label, retention in tiers.items()),
+            key=lambda tier: tier[1]
+        )
+        self.on_seal = on_seal
+        self._buffers: Dict[str, Dict[str, TierBuffer]] = {
+            name: {label: TierBuffer(name, step, max(1, int(retention / step)))
+                   for label, step, retention in self.tiers}
+            for name in self.series
+        }
+        self._lock = threading.Lock()
+
+    def ingest(self, timestamp: datetime, values: Dict[str, float]):
+        """写入一批同一时刻的样本，每个样本O(层级数)"""
+        ts = to_epoch(timestamp)
+        sealed = []
+        with self._lock:
+            for name, tiers in self._buffers.items():
+                value = values.get(name)
+                if value is None:
+                    continue
+                for label, buffer in tiers.items():
+                    bucket = buffer.add(ts, float(value))
+                    if bucket is not None:
+                        sealed.append((name, label, bucket))
+        if self.on_seal is not None:
+            for name, label, bucket in sealed:
+                self.on_seal(name, label, bucket)
+
+    def select_tier(self, start: datetime, end: datetime,
+                    interval: Optional[float] = None, max_points: Optional[int] = None) -> Optional[Tuple[str, float]]:
+        """选取满足分辨率要求的最粗层级，细于最小层级时返回None（使用原始数据）"""
+        resolution = float(interval or 0)
+        if max_points:
+            resolution = max(resolution, (to_epoch(end) - to_epoch(start)) / max_points)
+        chosen = None
+        for label, step, _ in self.tiers:
+            if step <= resolution:
+                chosen = (label, step)
+        return chosen
+
+    def covers(self, label: str, start: datetime) -> bool:
+        """判断内存中的层级数据是否覆盖起始时间"""
+        start_ts = to_epoch(start)
+        with self._lock:
+            for tiers in self._buffers.values():
+                oldest = tiers[label].oldest()
+                if oldest is None or oldest > start_ts:
+                    return False
+        return bool(self._buffers)
+
+    def query_columns(self, label: str, start: datetime, end: datetime) -> Dict[str, np.ndarray]:
+        """按层级查询聚合结果，返回列式数据（序列名为均值列，另附_min/_max/_count列）"""
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        with self._lock:
+            windows = {name: tiers[label].window(start_ts, end_ts) for name, tiers in self._buffers.items()}
+        aligned = {}
+        for name, window in windows.items():
+            aligned[name] = (window['timestamps'], window['mean'])
+            aligned[f"{name}_min"] = (window['timestamps'], window['min'])
+            aligned[f"{name}_max"] = (window['timestamps'], window['max'])
+            aligned[f"{name}_count"] = (window['timestamps'], window['count'].astype(np.float64))
+        return align_columns(aligned)
@@ -0,0 +1,166 @@
+import operator
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le
+}
+
+
+class CompiledRule:
+    """单条规则及其按序列展开的状态数组"""
+
+    def __init__(self, name: str, spec: Dict, sample_interval: float):
+        self.name = name
+        self.metric = spec.get('metric', name)
+        self.kind = spec.get('kind', 'threshold')
+        self.op = OPERATORS[spec.get('op', '>')]
+        self.threshold = float(spec.get('threshold', 0))
+        self.duration = float(spec.get('duration', 0))
+        self.severity = spec.get('severity', 'warning')
+        # 变化率规则的滑动窗口：保存之前的window/sample_interval个样本，与window之前的样本比较
+        window = float(spec.get('window', 60))
+        self.window_size = max(1, int(round(window / sample_interval)))
+
+        self.size = 0
+        self.breach_since = np.empty(0)
+        self.last_seen = np.empty(0)
+        self.window_values = np.empty((0, self.window_size))
+        self.window_times = np.empty((0, self.window_size))
+        self.window_count = np.empty(0, dtype=np.int64)
+
+    def grow(self, size: int):
+        """序列数增加时按倍数扩容状态数组"""
+        if size <= len(self.breach_since):
+            self.size = max(self.size, size)
+            return
+        capacity = max(size, 2 * len(self.breach_since), 16)
+        extra = capacity - len(self.breach_since)
+        self.breach_since = np.concatenate([self.breach_since, np.full(extra, np.nan)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(extra, np.nan)])
+        self.window_count = np.concatenate([self.window_count, np.zeros(extra, dtype=np.int64)])
+        if self.kind == 'rate':
+            self.window_values = np.vstack([self.window_values, np.zeros((extra, self.window_size))])
+            self.window_times = np.vstack([self.window_times, np.zeros((extra, self.window_size))])
+        self.size = size
+
+    def _rate(self, rows: np.ndarray, values: np.ndarray, now: float) -> np.ndarray:
+        """写入环形窗口并计算窗口内的变化率（每秒）"""
+        slot = self.window_count[rows] % self.window_size
+        oldest_slot = np.where(self.window_count[rows] >= self.window_size, slot,
+                               np.zeros_like(slot))
+        oldest_values = self.window_values[rows, oldest_slot]
+        oldest_times = self.window_times[rows, oldest_slot]
+        has_history = self.window_count[rows] > 0
+        self.window_values[rows, slot] = values
+        self.window_times[rows, slot] = now
+        self.window_count[rows] += 1
+        elapsed = now - oldest_times
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(has_history & (elapsed > 0), (values - oldest_values) / elapsed, np.nan)
+        return rate
+
+    def evaluate(self, rows: np.ndarray, values: np.ndarray, now: float) -> Tuple[np.ndarray, np.ndarray]:
+        """向量化评估一批样本，返回(各行是否处于触发状态, 参与比较的观测值)"""
+        self.last_seen[rows] = now
+        if self.kind == 'rate':
+            observed = self._rate(rows, values, now)
+        else:
+            observed = values
+        with np.errstate(invalid='ignore'):
+            breach = self.op(observed, self.threshold) & ~np.isnan(observed)
+        since = self.breach_since[rows]
+        since = np.where(breach, np.where(np.isnan(since), now, since), np.nan)
+        self.breach_since[rows] = since
+        return breach & (now - since >= self.duration), observed
+
+    def evaluate_absence(self, now: float) -> np.ndarray:
+        """缺失规则：超过duration未收到样本的行"""
+        last_seen = self.last_seen[:self.size]
+        return ~np.isnan(last_seen) & (now - last_seen > self.duration)
+
+
+class RuleEngine:
+    """编译后的告警规则引擎：按(规则, 序列)维护增量状态，每个样本每条规则O(1)"""
+
+    def __init__(self, rules: Dict[str, Dict], sample_interval: float = 5.0):
+        self.rules = [CompiledRule(name, spec, sample_interval) for name, spec in rules.items()]
+        self._by_metric: Dict[str, List[CompiledRule]] = {}
+        for rule in self.rules:
+            self._by_metric.setdefault(rule.metric, []).append(rule)
+        self._series: Dict[str, int] = {}
+        self._series_names: List[str] = []
+        self._index_cache: Dict[tuple, np.ndarray] = {}
+
+    def _rows(self, series: Sequence[str]) -> np.ndarray:
+        """序列名映射为状态行号，同一序列列表重复使用时走缓存"""
+        key = tuple(series)
+        cached = self._index_cache.get(key)
+        if cached is not None:
+            return cached
+        rows = np.empty(len(series), dtype=np.int64)
+        for i, name in enumerate(series):
+            row = self._series.get(name)
+            if row is None:
+                row = self._series[name] = len(self._series_names)
+                self._series_names.append(name)
+            rows[i] = row
+        for rule in self.rules:
+            rule.grow(len(self._series_names))
+        if len(self._index_cache) >= 64:
+            self._index_cache.clear()
+        self._index_cache[key] = rows
+        return rows
+
+    def seed(self, rule_name: str, series: str, since: float):
+        """恢复重启前的触发状态：since为告警触发时间，视为此前已持续超限duration（缺失规则视为已缺失duration）"""
+        rule = next((rule for rule in self.rules if rule.name == rule_name), None)
+        if rule is None:
+            return
+        row = self._rows([series])[0]
+        if rule.kind == 'absence':
+            rule.last_seen[row] = since - rule.duration
+        else:
+            rule.breach_since[row] = since - rule.duration
+
+    def evaluate(self, now: float, samples: Dict[str, tuple]) -> List[Dict]:
+        """评估一个周期的样本
+
+        samples: 指标名 -> (序列名列表, 数值数组)
+        返回处于触发状态的(规则, 序列)列表
+        """
+        firing = []
+        for metric, (series, values) in samples.items():
+            rules = self._by_metric.get(metric)
+            if not rules or not len(series):
+                continue
+            rows = self._rows(series)
+            values = np.asarray(values, dtype=np.float64)
+            for rule in rules:
+                if rule.kind == 'absence':
+                    rule.last_seen[rows] = now
+                    continue
+                mask, observed = rule.evaluate(rows, values, now)
+                for i in np.flatnonzero(mask).tolist():
+                    firing.append(self._result(rule, series[i], float(observed[i]), now, rows[i]))
+
+        for rule in self.rules:
+            if rule.kind != 'absence':
+                continue
+            for row in np.flatnonzero(rule.evaluate_absence(now)).tolist():
+                firing.append(self._result(rule, self._series_names[row], None, now, row))
+        return firing
+
+    def _result(self, rule: CompiledRule, series: str, value: Optional[float], now: float, row: int) -> Dict:
+        since = rule.breach_since[row] if rule.kind != 'absence' else rule.last_seen[row]
+        return {
+            'rule': rule.name,
+            'metric': rule.metric,
+            'series': series,
+            'value': value,
+            'severity': rule.severity,
+            'since': float(since)
+        }
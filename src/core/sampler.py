@@ -0,0 +1,126 @@
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List
+import psutil
+from loguru import logger
+from .counters import CounterRates
+from .utils import parse_duration
+
+
+class ResourceSampler(threading.Thread):
+    """后台系统资源采样线程：固定节奏做增量采样，调用方O(1)读取最新值"""
+
+    def __init__(self, config: Dict):
+        super().__init__(name='resource-sampler', daemon=True)
+        sampler_config = config.get('monitoring', {}).get('sampler', {})
+        self.interval = parse_duration(sampler_config.get('interval', '1s'))
+        self.disk_interval = parse_duration(sampler_config.get('disk_interval', '30s'))
+        self.process_interval = parse_duration(sampler_config.get('process_interval', '10s'))
+        self.process_top = int(sampler_config.get('process_top', 5))
+
+        self._stop_event = threading.Event()
+        # 磁盘累计计数器差分为速率（处理回绕与重置）；网卡速率由监控器的InterfaceRates计算
+        self._disk_rates = CounterRates(('read_bytes', 'write_bytes'))
+        self._disk_usage = {}
+        self._processes = []
+        self._last_disk_scan = float('-inf')
+        self._last_process_scan = float('-inf')
+        self._overhead = {'sample_seconds': 0.0, 'cpu_fraction': 0.0}
+        self._latest = self._empty()
+
+    def _empty(self) -> Dict:
+        return {
+            'cpu_percent': 0.0,
+            'cpu_per_core': [],
+            'memory_percent': 0.0,
+            'swap_percent': 0.0,
+            'disk_percent': 0.0,
+            'disks': {},
+            'disk_read_bps': 0.0,
+            'disk_write_bps': 0.0,
+            'processes': [],
+            'timestamp': datetime.utcnow(),
+            'overhead': {'sample_seconds': 0.0, 'cpu_fraction': 0.0}
+        }
+
+    def latest(self) -> Dict:
+        """获取最新采样结果（不阻塞）"""
+        return self._latest
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        # 初始化CPU增量基准
+        psutil.cpu_percent(interval=None, percpu=True)
+        next_run = time.monotonic()
+        while not self._stop_event.is_set():
+            wall_start = time.monotonic()
+            cpu_start = time.thread_time()
+            try:
+                self._sample(wall_start)
+            except Exception as e:
+                logger.error(f"Error sampling resources: {str(e)}")
+            elapsed = time.monotonic() - wall_start
+            cpu_used = time.thread_time() - cpu_start
+            # 采样自身开销在下一次采样结果中发布
+            self._overhead = {
+                'sample_seconds': elapsed,
+                'cpu_fraction': cpu_used / self.interval
+            }
+            next_run += self.interval
+            self._stop_event.wait(max(0.0, next_run - time.monotonic()))
+
+    def _sample(self, now: float):
+        per_core = psutil.cpu_percent(interval=None, percpu=True)
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        disk_io = psutil.disk_io_counters()
+
+        # 磁盘容量变化缓慢，按较低频率扫描
+        if now - self._last_disk_scan >= self.disk_interval:
+            self._last_disk_scan = now
+            disks = {}
+            for partition in psutil.disk_partitions(all=False):
+                try:
+                    disks[partition.mountpoint] = psutil.disk_usage(partition.mountpoint).percent
+                except OSError:
+                    continue
+            self._disk_usage = disks
+
+        if now - self._last_process_scan >= self.process_interval:
+            self._last_process_scan = now
+            self._processes = self._top_processes()
+
+        disk_rates = self._disk_rates.update({'disk': disk_io} if disk_io is not None else {}, now).get('disk', {})
+        disk_read_bps = disk_rates.get('read_bytes_per_sec', 0.0)
+        disk_write_bps = disk_rates.get('write_bytes_per_sec', 0.0)
+
+        cpu_percent = sum(per_core) / len(per_core) if per_core else 0.0
+        disk_percent = self._disk_usage.get('/', max(self._disk_usage.values(), default=0.0))
+        latest = {
+            'cpu_percent': cpu_percent,
+            'cpu_per_core': per_core,
+            'memory_percent': memory.percent,
+            'swap_percent': swap.percent,
+            'disk_percent': disk_percent,
+            'disks': self._disk_usage,
+            'disk_read_bps': disk_read_bps,
+            'disk_write_bps': disk_write_bps,
+            'processes': self._processes,
+            'timestamp': datetime.utcnow(),
+            'overhead': self._overhead
+        }
+        # 整体替换引用，读者不会看到写了一半的结果
+        self._latest = latest
+
+    def _top_processes(self) -> List[Dict]:
+        """按CPU占用取前N个进程"""
+        processes = []
+        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
+            info = proc.info
+            if info.get('cpu_percent') is not None:
+                processes.append(info)
+        processes.sort(key=lambda p: p['cpu_percent'], reverse=True)
+        return processes[:self.process_top]
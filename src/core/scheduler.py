@@ -0,0 +1,157 @@
+import time
+import asyncio
+import aiohttp
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+from loguru import logger
+from prometheus_client import REGISTRY, Counter, Gauge
+
+
+class TargetRegistry:
+    """监控目标注册表"""
+
+    def __init__(self, config: Dict):
+        monitoring = config.get('monitoring', {})
+        self.default_deadline = float(monitoring.get('probe', {}).get('deadline', 3))
+        self._targets: Dict[str, Dict] = {}
+        # 目标增删时递增，供分片模式判断是否需要重新分配
+        self.version = 0
+        for item in monitoring.get('targets', []):
+            self.add(item)
+
+    def add(self, item) -> Dict:
+        """注册目标，支持字符串（IP/主机名/URL）或字典配置"""
+        if isinstance(item, str):
+            item = {'url': item}
+        url = item['url']
+        if '://' not in url:
+            url = f"http://{url}/"
+        target = {
+            'name': item.get('name', url),
+            'url': url,
+            'host': urlsplit(url).hostname or url,
+            'deadline': float(item.get('deadline', self.default_deadline))
+        }
+        self._targets[target['name']] = target
+        self.version += 1
+        return target
+
+    def remove(self, name: str):
+        """注销目标"""
+        if self._targets.pop(name, None) is not None:
+            self.version += 1
+
+    def all(self) -> List[Dict]:
+        """获取全部目标"""
+        return list(self._targets.values())
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+
+async def probe_http(session: aiohttp.ClientSession, target: Dict) -> Dict:
+    """探测单个目标，记录状态码与响应时间"""
+    start = time.monotonic()
+    async with session.get(target['url'], allow_redirects=False) as response:
+        await response.read()
+        return {
+            'target': target['name'],
+            'ok': response.status < 500,
+            'status': response.status,
+            'response_time': time.monotonic() - start
+        }
+
+
+class ProbeScheduler:
+    """有界并发探测调度器：全局并发上限、单主机并发上限、单目标超时"""
+
+    def __init__(self, config: Dict, registry=REGISTRY):
+        probe_config = config.get('monitoring', {}).get('probe', {})
+        self.max_concurrency = int(probe_config.get('max_concurrency', 500))
+        self.per_host_concurrency = int(probe_config.get('per_host_concurrency', 4))
+        self.tick_deadline = float(probe_config.get('tick_deadline', 4))
+        self._global_limit: Optional[asyncio.Semaphore] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._loop = None
+        self.stats = {
+            'targets': 0,
+            'completed': 0,
+            'failed': 0,
+            'timed_out': 0,
+            'tick_duration': 0.0,
+            'probes_per_second': 0.0
+        }
+
+        # Prometheus指标（registry为None时不注册，供分片worker使用）
+        self.probe_total = Counter('monitor_probe_total', 'Total number of target probes', ['result'],
+                                   registry=registry)
+        self.probe_rate = Gauge('monitor_probe_rate', 'Sustained target probes per second', registry=registry)
+
+    def _bind_loop(self):
+        """信号量与事件循环绑定，循环变化时重建"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global_limit = asyncio.Semaphore(self.max_concurrency)
+            self._host_limits = {}
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return limit
+
+    async def _run_one(self, target: Dict, probe: Callable[[Dict], Awaitable[Dict]]) -> Dict:
+        """在并发限制下执行单个探测"""
+        # 先取主机槽位再取全局槽位，避免等待单主机时占用全局并发
+        async with self._host_limit(target['host']):
+            async with self._global_limit:
+                try:
+                    return await asyncio.wait_for(probe(target), timeout=target['deadline'])
+                except asyncio.TimeoutError:
+                    return {'target': target['name'], 'ok': False, 'error': 'timeout'}
+                except Exception as e:
+                    return {'target': target['name'], 'ok': False, 'error': str(e)}
+
+    async def run_tick(self, targets: List[Dict], probe: Callable[[Dict], Awaitable[Dict]]) -> List[Dict]:
+        """并发探测全部目标，单轮耗时不超过tick_deadline"""
+        self._bind_loop()
+        start = time.monotonic()
+        tasks = [asyncio.ensure_future(self._run_one(target, probe)) for target in targets]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.tick_deadline)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning(f"{len(pending)} probes did not finish within tick deadline {self.tick_deadline}s")
+
+        results = []
+        completed = failed = timed_out = 0
+        for target, task in zip(targets, tasks):
+            if task.cancelled() or not task.done():
+                result = {'target': target['name'], 'ok': False, 'error': 'tick_deadline'}
+            else:
+                result = task.result()
+            if result.get('ok'):
+                completed += 1
+            elif result.get('error') in ('timeout', 'tick_deadline'):
+                timed_out += 1
+            else:
+                failed += 1
+            results.append(result)
+
+        duration = time.monotonic() - start
+        self.stats.update({
+            'targets': len(targets),
+            'completed': completed,
+            'failed': failed,
+            'timed_out': timed_out,
+            'tick_duration': duration,
+            'probes_per_second': len(targets) / duration if duration > 0 else 0.0
+        })
+        self.probe_total.labels('ok').inc(completed)
+        self.probe_total.labels('failed').inc(failed)
+        self.probe_total.labels('timeout').inc(timed_out)
+        self.probe_rate.set(self.stats['probes_per_second'])
+        return results
@@ -0,0 +1,439 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import signal
+import asyncio
+import subprocess
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+import numpy as np
+from loguru import logger
+from prometheus_client import Counter, Gauge
+from .scheduler import ProbeScheduler, probe_http
+from .utils import parse_duration
+from .cadence import probe_intervals
+
+# 探测失败原因编码（共享内存中以整数保存），0表示无错误
+ERRORS = ('', 'timeout', 'tick_deadline', 'failed')
+_ERROR_CODES = {error: code for code, error in enumerate(ERRORS)}
+# 主进程标记的结果：分片尚未发布第一轮结果 / 分片已退出或结果超过stale_after未更新
+PENDING = 'pending'
+STALE = 'stale'
+
+# 列式结果布局：列名与类型，按对齐要求从宽到窄排列
+COLUMNS = (('response_time', np.float64), ('status', np.int32), ('ok', np.uint8), ('error', np.uint8))
+
+# 头部：seq(uint64) + 发布时间、单轮耗时、结果条数(float64)
+_HEADER_SIZE = 32
+
+
+def shard_of(name: str, shards: int) -> int:
+    """按目标名的crc32分配分片，与进程和启动顺序无关"""
+    return zlib.crc32(name.encode('utf-8')) % shards
+
+
+class ShardBuffer:
+    """单个分片的共享内存列式缓冲：worker单写，主进程按seqlock无锁读取"""
+
+    def __init__(self, capacity: int, name: Optional[str] = None):
+        self.capacity = max(1, capacity)
+        size = _HEADER_SIZE + sum(self.capacity * np.dtype(dtype).itemsize for _, dtype in COLUMNS)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        buf = self.shm.buf
+        self._seq = np.ndarray((1,), np.uint64, buf, 0)
+        self._info = np.ndarray((3,), np.float64, buf, 8)
+        self.columns: Dict[str, np.ndarray] = {}
+        offset = _HEADER_SIZE
+        for column, dtype in COLUMNS:
+            self.columns[column] = np.ndarray((self.capacity,), dtype, buf, offset)
+            offset += self.capacity * np.dtype(dtype).itemsize
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def seq(self) -> int:
+        return int(self._seq[0])
+
+    def write(self, columns: Dict[str, np.ndarray], published: float, duration: float):
+        """发布一轮结果；seq为奇数时表示写入中"""
+        count = min(len(columns['ok']), self.capacity)
+        self._seq[0] += 1
+        for column, values in columns.items():
+            self.columns[column][:count] = values[:count]
+        self._info[:] = (published, duration, count)
+        self._seq[0] += 1
+
+    def read(self, retries: int = 1000) -> Optional[Tuple[int, Dict[str, np.ndarray], float, float]]:
+        """复制最近一轮结果，返回 (seq, 列, 发布时间, 单轮耗时)；尚未发布或持续争用时返回None"""
+        for _ in range(retries):
+            before = self.seq
+            if before == 0:
+                return None
+            if before & 1:
+                time.sleep(0)
+                continue
+            published, duration, count = self._info
+            data = {column: values[:int(count)].copy() for column, values in self.columns.items()}
+            # 读取期间seq未变，说明复制的是同一轮完整数据
+            if self.seq == before:
+                return before, data, float(published), float(duration)
+        return None
+
+    def close(self, unlink: bool = False):
+        # 释放numpy视图后才能关闭共享内存
+        self._seq = self._info = None
+        self.columns = {}
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _encode(results: List[Dict]) -> Dict[str, np.ndarray]:
+    """探测结果转为列"""
+    count = len(results)
+    return {
+        'response_time': np.fromiter((r.get('response_time', np.nan) for r in results), np.float64, count),
+        'status': np.fromiter((r.get('status', 0) for r in results), np.int32, count),
+        'ok': np.fromiter((bool(r.get('ok')) for r in results), np.uint8, count),
+        'error': np.fromiter((_ERROR_CODES.get(r.get('error') or '', _ERROR_CODES['failed'])
+                              for r in results), np.uint8, count)
+    }
+
+
+def _worker_main(index: int, targets: List[Dict], settings: Dict, shm_name: str,
+                 interval: float, parent_pid: int):
+    """分片worker进程入口"""
+    buffer = ShardBuffer(len(targets), name=shm_name)
+    # 共享内存由主进程创建和释放，避免本进程的resource_tracker在退出时将其删除
+    resource_tracker.unregister(buffer.shm._name, 'shared_memory')
+    # 指标在主进程汇总，worker内的调度器不注册Prometheus指标
+    scheduler = ProbeScheduler({'monitoring': {'probe': settings}}, registry=None)
+    try:
+        asyncio.run(_worker_loop(buffer, targets, scheduler, interval, parent_pid))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        buffer.close()
+
+
+async def _worker_loop(buffer: ShardBuffer, targets: List[Dict], scheduler: ProbeScheduler,
+                       interval: float, parent_pid: int):
+    # SIGTERM时完成当前一轮后退出
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    connector = aiohttp.TCPConnector(
+        limit=scheduler.max_concurrency,
+        limit_per_host=scheduler.per_host_concurrency,
+        ttl_dns_cache=300
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # 首轮随机错开，避免各分片同时发起探测
+        deadline = time.monotonic() + random.uniform(0, interval)
+        while True:
+            # 分段等待，及时响应停止信号与主进程退出
+            while not stop.is_set() and os.getppid() == parent_pid and time.monotonic() < deadline:
+                await asyncio.sleep(min(0.2, deadline - time.monotonic()))
+            if stop.is_set() or os.getppid() != parent_pid:
+                break
+            results = await scheduler.run_tick(targets, lambda target: probe_http(session, target))
+            buffer.write(_encode(results), time.time(), scheduler.stats['tick_duration'])
+            deadline += interval
+            now = time.monotonic()
+            if deadline < now:
+                # 超时的轮次直接跳过，不补跑
+                deadline += (now - deadline) // interval * interval + interval
+
+
+def _worker_cli():
+    """worker子进程入口：python -m <本模块> <参数JSON>，目标列表经标准输入传入"""
+    args = json.loads(sys.argv[1])
+    targets = json.load(sys.stdin)
+    _worker_main(args['index'], targets, args['settings'], args['shm_name'], args['interval'], args['parent_pid'])
+
+
+class ShardedProbes:
+    """分片探测：按目标名crc32将目标分配到N个worker进程，各自按采集周期探测，
+    结果写入共享内存列式缓冲，主进程每个周期读取最近一轮结果；worker退出或停止更新时自动重启
+
+    worker以新的解释器进程启动（python -m），不从主进程fork：主进程此时已有写入、采样、
+    TLS扫描等线程，fork出的子进程可能继承被这些线程持有的锁（loguru 0.5.3未在fork时重置锁）而死锁；
+    multiprocessing的spawn/forkserver又会在子进程中重新执行main.py的模块级初始化
+    """
+
+    def __init__(self, config: Dict, scheduler: ProbeScheduler):
+        monitoring = config.get('monitoring', {})
+        sharding = monitoring.get('sharding', {})
+        self.workers = int(sharding.get('workers', 0)) or os.cpu_count() or 1
+        self.interval = probe_intervals(config)['targets']
+        self.stale_after = parse_duration(sharding.get('stale_after', '30s'))
+        # 两次发布的间隔最长约为采集周期加单轮时限，stale_after至少再容忍错过一轮，否则正常运行的worker也会被判定过期
+        min_stale = 2 * self.interval + scheduler.tick_deadline
+        if self.stale_after < min_stale:
+            logger.warning(f"sharding.stale_after {self.stale_after:.0f}s is shorter than two probe intervals "
+                           f"plus tick_deadline, using {min_stale:.0f}s")
+            self.stale_after = min_stale
+        self.restart_backoff = parse_duration(sharding.get('restart_backoff', '5s'))
+        self.scheduler = scheduler
+        # worker按主进程的sys.path导入本模块
+        self._env = dict(os.environ, PYTHONPATH=os.pathsep.join(os.path.abspath(path) for path in sys.path if path))
+        self._shards: List[Dict] = []
+        # 已通知退出、尚未回收的旧worker：(进程, 共享内存, 强制结束的时刻)
+        self._retired: List[Tuple[subprocess.Popen, ShardBuffer, float]] = []
+        self._version = None
+        self.stats = {
+            'targets': 0,
+            'completed': 0,
+            'failed': 0,
+            'timed_out': 0,
+            'pending': 0,
+            'stale': 0,
+            'tick_duration': 0.0,
+            'probes_per_second': 0.0,
+            'shards': self.workers,
+            'restarts': 0,
+            'stale_shards': 0
+        }
+
+        # Prometheus指标
+        self.shard_restarts = Counter('monitor_shard_restarts_total', 'Probe shard worker restarts', ['shard'])
+        self.shard_age = Gauge('monitor_shard_result_age_seconds', 'Age of the latest probe results per shard',
+                               ['shard'])
+
+    def start(self, targets: List[Dict]):
+        """按当前目标分配分片，只重启目标有变化的分片
+
+        重启的分片保留仍属于它的目标的上一轮结果，直到新worker发布第一轮
+        """
+        groups: List[List[Dict]] = [[] for _ in range(self.workers)]
+        for target in targets:
+            groups[shard_of(target['name'], self.workers)].append(target)
+        changed = 0
+        for index, group in enumerate(groups):
+            if index < len(self._shards):
+                shard = self._shards[index]
+                if shard['targets'] == group:
+                    continue
+                previous = {result['target']: result for result in shard['results']}
+                self._retire(shard, kill=False)
+            else:
+                shard = {'index': index, 'process': None, 'died_at': None, 'updated_at': time.monotonic()}
+                previous = {}
+                self._shards.append(shard)
+            shard['targets'] = group
+            shard['results'] = [previous.get(target['name']) or self._placeholder(target, PENDING)
+                                for target in group]
+            shard['counts'] = self._tally(shard['results'])
+            self._spawn(shard)
+            changed += 1
+        logger.info(f"Started {changed} of {self.workers} probe shards for {len(targets)} targets")
+
+    def _spawn(self, shard: Dict):
+        """为分片分配新的共享内存并启动worker"""
+        shard['buffer'] = ShardBuffer(len(shard['targets']))
+        shard['seq'] = 0
+        settings = {
+            'max_concurrency': self.scheduler.max_concurrency,
+            'per_host_concurrency': self.scheduler.per_host_concurrency,
+            'tick_deadline': self.scheduler.tick_deadline
+        }
+        args = {'index': shard['index'], 'settings': settings, 'shm_name': shard['buffer'].name,
+                'interval': self.interval, 'parent_pid': os.getpid()}
+        process = subprocess.Popen([sys.executable, '-m', __name__, json.dumps(args)],
+                                   stdin=subprocess.PIPE, env=self._env)
+        try:
+            process.stdin.write(json.dumps(shard['targets']).encode('utf-8'))
+            process.stdin.close()
+        except OSError as e:
+            # worker启动即退出，由supervise按退出处理
+            logger.error(f"Error passing targets to probe shard {shard['index']}: {str(e)}")
+        shard['process'] = process
+        shard['started_at'] = time.monotonic()
+        shard['died_at'] = None
+
+    def _retire(self, shard: Dict, kill: bool):
+        """通知分片当前的worker退出，旧进程与共享内存交由_reap回收，不等待其退出
+
+        新worker总是使用新的共享内存：被强制结束的worker可能停在写入中途，seq永远为奇数
+        """
+        process = shard['process']
+        if process.poll() is None:
+            if kill:
+                process.kill()
+            else:
+                # SIGTERM后worker完成当前一轮再退出
+                process.terminate()
+        self._retired.append((process, shard['buffer'], time.monotonic() + (1 if kill else self.interval + 1)))
+
+    def _reap(self, block: bool = False):
+        """回收已退出的旧worker并释放其共享内存，超过期限仍未退出的强制结束"""
+        remaining = []
+        for process, buffer, deadline in self._retired:
+            if block and not _wait(process, max(0.0, deadline - time.monotonic())):
+                process.kill()
+                _wait(process, 1)
+            elif process.poll() is None:
+                if time.monotonic() >= deadline:
+                    process.kill()
+                remaining.append((process, buffer, deadline))
+                continue
+            buffer.close(unlink=True)
+        self._retired = remaining
+
+    def _restart(self, shard: Dict, reason: str):
+        logger.warning(f"Restarting probe shard {shard['index']}: {reason}")
+        self._retire(shard, kill=True)
+        self.stats['restarts'] += 1
+        self.shard_restarts.labels(shard=str(shard['index'])).inc()
+        self._spawn(shard)
+
+    def _stale_at(self, shard: Dict) -> float:
+        """分片结果视为过期的时刻：最近一次更新后stale_after；
+        新worker首轮随机错开至多一个采集周期，发布第一轮之前从其最晚的首轮开始时间起算"""
+        stale_at = shard['updated_at'] + self.stale_after
+        if not shard['seq']:
+            stale_at = max(stale_at, shard['started_at'] + self.interval + self.stale_after)
+        return stale_at
+
+    def supervise(self):
+        """重启已退出或长时间未更新结果的worker（退出后等待restart_backoff，避免频繁重启）"""
+        self._reap()
+        now = time.monotonic()
+        for shard in self._shards:
+            process = shard['process']
+            if process.poll() is not None:
+                if shard['died_at'] is None:
+                    shard['died_at'] = now
+                    logger.error(f"Probe shard {shard['index']} exited with code {process.returncode}")
+                if now - shard['died_at'] >= self.restart_backoff:
+                    self._restart(shard, f"exit code {process.returncode}")
+            elif shard['targets'] and now > self._stale_at(shard):
+                self._restart(shard, f"no results for {now - shard['updated_at']:.0f}s")
+
+    async def collect(self, registry) -> List[Dict]:
+        """读取各分片最近一轮的探测结果（目标变化时重新分配分片）
+
+        已退出或结果超过stale_after未更新的分片，其目标标记为stale，不计入成功；
+        启停worker涉及进程创建与向管道写入目标列表，在线程池中执行，不阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        if self._version != registry.version:
+            version = registry.version
+            await loop.run_in_executor(None, self.start, registry.all())
+            self._version = version
+        # 先读取新结果再检查worker，避免两次调用间隔超过stale_after时误判
+        self._refresh()
+        await loop.run_in_executor(None, self.supervise)
+
+        now = time.time()
+        monotonic = time.monotonic()
+        totals = dict.fromkeys(('completed', 'failed', 'timed_out', 'pending', 'stale'), 0)
+        stale_shards = 0
+        tick_duration = 0.0
+        results = []
+        for shard in self._shards:
+            self.shard_age.labels(shard=str(shard['index'])).set(now - shard.get('published', now))
+            shard_results, counts = shard['results'], shard['counts']
+            if shard['process'].poll() is not None or monotonic > self._stale_at(shard):
+                stale_shards += 1
+                shard_results = [self._placeholder(target, STALE) for target in shard['targets']]
+                counts = {'stale': len(shard_results)}
+            tick_duration = max(tick_duration, shard.get('duration', 0.0))
+            for key, value in counts.items():
+                totals[key] += value
+            results.extend(shard_results)
+
+        self.stats.update(totals)
+        self.stats.update({
+            'targets': len(results),
+            'tick_duration': tick_duration,
+            'probes_per_second': len(results) / self.interval if self.interval > 0 else 0.0,
+            'stale_shards': stale_shards
+        })
+        self.scheduler.probe_rate.set(self.stats['probes_per_second'])
+        return results
+
+    def _refresh(self):
+        """读取各分片新发布的一轮结果"""
+        for shard in self._shards:
+            snapshot = shard['buffer'].read()
+            if snapshot is not None and snapshot[0] != shard['seq']:
+                seq, columns, published, duration = snapshot
+                shard['seq'] = seq
+                shard['updated_at'] = time.monotonic()
+                shard['published'] = published
+                shard['duration'] = duration
+                shard['results'] = self._decode(shard['targets'], columns)
+                shard['counts'] = counts = self._tally_columns(columns)
+                # 新一轮结果计入探测总数
+                self.scheduler.probe_total.labels('ok').inc(counts['completed'])
+                self.scheduler.probe_total.labels('timeout').inc(counts['timed_out'])
+                self.scheduler.probe_total.labels('failed').inc(counts['failed'])
+
+    @staticmethod
+    def _tally_columns(columns: Dict[str, np.ndarray]) -> Dict[str, int]:
+        """按列统计一轮结果，每轮只计算一次"""
+        completed = int(np.count_nonzero(columns['ok']))
+        timed_out = int(np.count_nonzero((columns['error'] == _ERROR_CODES['timeout']) |
+                                         (columns['error'] == _ERROR_CODES['tick_deadline'])))
+        return {'completed': completed, 'timed_out': timed_out,
+                'failed': len(columns['ok']) - completed - timed_out}
+
+    @staticmethod
+    def _tally(results: List[Dict]) -> Dict[str, int]:
+        counts = dict.fromkeys(('completed', 'failed', 'timed_out', 'pending'), 0)
+        for result in results:
+            error = result.get('error')
+            if result.get('ok'):
+                counts['completed'] += 1
+            elif error in ('timeout', 'tick_deadline'):
+                counts['timed_out'] += 1
+            elif error == PENDING:
+                counts['pending'] += 1
+            else:
+                counts['failed'] += 1
+        return counts
+
+    @staticmethod
+    def _placeholder(target: Dict, error: str) -> Dict:
+        return {'target': target['name'], 'ok': False, 'error': error}
+
+    @staticmethod
+    def _decode(targets: List[Dict], columns: Dict[str, np.ndarray]) -> List[Dict]:
+        """列还原为与ProbeScheduler.run_tick一致的结果"""
+        results = []
+        rows = zip(columns['response_time'].tolist(), columns['status'].tolist(),
+                   columns['ok'].tolist(), columns['error'].tolist())
+        for target, (response_time, status, ok, error) in zip(targets, rows):
+            if error:
+                results.append({'target': target['name'], 'ok': False, 'error': ERRORS[error]})
+            else:
+                results.append({'target': target['name'], 'ok': bool(ok), 'status': status,
+                                'response_time': response_time})
+        return results
+
+    def stop(self):
+        """停止全部worker并释放共享内存"""
+        for shard in self._shards:
+            self._retire(shard, kill=False)
+        self._shards = []
+        self._version = None
+        self._reap(block=True)
+
+
+def _wait(process: subprocess.Popen, timeout: float) -> bool:
+    """等待进程退出，超时返回False"""
+    try:
+        process.wait(timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        return False
+
+
+if __name__ == '__main__':
+    _worker_cli()
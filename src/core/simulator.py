@@ -0,0 +1,230 @@
+import os
+import math
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from loguru import logger
+from .utils import parse_duration, parse_size
+
+PROFILES = ('steady', 'spike', 'flapping', 'outage')
+
+# 访问日志的请求路径与客户端，格式与 config/nginx/monitor.conf 中 log_format monitor 一致
+LOG_PATHS = ('/', '/api/metrics', '/api/alerts?limit=100', '/static/app.js', '/login')
+LOG_AGENTS = ('Mozilla/5.0 (X11; Linux x86_64)', 'curl/7.68.0', 'python-requests/2.26.0')
+
+STUB_STATUS = ("Active connections: {active}\n"
+               "server accepts handled requests\n"
+               " {accepts} {accepts} {requests}\n"
+               "Reading: 0 Writing: {writing} Waiting: 0\n")
+
+
+class VirtualTarget:
+    """虚拟目标：按脚本化的配置在不同时刻给出延迟、错误率与响应大小"""
+
+    def __init__(self, name: str, profile: str, settings: Dict, phase: float):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown simulator profile {profile!r}")
+        self.name = name
+        self.profile = profile
+        self.latency = settings['base_latency']
+        self.error_rate = settings['base_error_rate']
+        self.size = settings['response_size']
+        self.period = settings['period']
+        self.duration = settings['duration']
+        self.flap_interval = settings['flap_interval']
+        # 各目标的异常时段错开，避免所有目标同时异常
+        self.phase = phase
+
+    def degraded(self, now: float) -> bool:
+        """当前是否处于异常时段"""
+        if self.profile == 'steady':
+            return False
+        if self.profile == 'flapping':
+            return int((now + self.phase) / self.flap_interval) % 2 == 1
+        return (now + self.phase) % self.period < self.duration
+
+    def state(self, now: float) -> Tuple[float, float, int]:
+        """返回 (延迟秒数, 错误率, 响应字节数)"""
+        if not self.degraded(now):
+            return self.latency, self.error_rate, self.size
+        if self.profile == 'spike':
+            return self.latency * 10, 0.05, self.size * 10
+        if self.profile == 'flapping':
+            return self.latency * 5, 0.3, self.size
+        # outage：全部返回503
+        return self.latency, 1.0, 0
+
+
+class TrafficSimulator:
+    """模拟模式：在本地提供虚拟目标与stub_status，并按设定速率生成访问日志"""
+
+    def __init__(self, config: Dict):
+        sim_config = config.get('simulator', {})
+        self.host = sim_config.get('host', '127.0.0.1')
+        self.port = int(sim_config.get('port', 18080))
+        self.log_path = sim_config.get('log_path', 'data/simulator/access.log')
+        self.log_rate = float(sim_config.get('log_rate', 1000))
+        self.log_max_size = sim_config.get('log_max_size')
+        self.client_ips = int(sim_config.get('client_ips', 5000))
+        settings = {
+            'base_latency': parse_duration(sim_config.get('base_latency', '50ms')),
+            'base_error_rate': float(sim_config.get('base_error_rate', 0.001)),
+            'response_size': int(sim_config.get('response_size', 2048)),
+            'period': parse_duration(sim_config.get('period', '5m')),
+            'duration': parse_duration(sim_config.get('duration', '1m')),
+            'flap_interval': parse_duration(sim_config.get('flap_interval', '30s'))
+        }
+        self.targets = self._build_targets(int(sim_config.get('targets', 100)),
+                                           sim_config.get('profiles', {'steady': 100}), settings,
+                                           int(sim_config.get('seed', 1)))
+        self._by_name = {target.name: target for target in self.targets}
+        self._rng = random.Random(sim_config.get('seed', 1))
+        self.stats = {'requests': 0, 'active': 0, 'log_lines': 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner = None
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @staticmethod
+    def _build_targets(count: int, profiles: Dict[str, float], settings: Dict, seed: int) -> List[VirtualTarget]:
+        """按各配置的占比分配目标"""
+        rng = random.Random(seed)
+        total = sum(profiles.values())
+        targets = []
+        for profile, share in profiles.items():
+            for _ in range(round(count * share / total)):
+                name = f"sim-{profile}-{len(targets)}"
+                targets.append(VirtualTarget(name, profile, settings, rng.uniform(0, settings['period'])))
+        # 四舍五入的差额由第一个配置补足或截去
+        first = next(iter(profiles))
+        while len(targets) < count:
+            targets.append(VirtualTarget(f"sim-{first}-{len(targets)}", first, settings,
+                                         rng.uniform(0, settings['period'])))
+        return targets[:count]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def target_configs(self) -> List[Dict]:
+        """可直接写入 monitoring.targets 的目标列表"""
+        return [{'name': target.name, 'url': f"{self.base_url}/t/{target.name}"} for target in self.targets]
+
+    def start(self):
+        """在后台线程中启动HTTP服务与日志生成"""
+        ready = threading.Event()
+        server = threading.Thread(target=self._serve, args=(ready,), name='simulator-http', daemon=True)
+        server.start()
+        ready.wait()
+        writer = threading.Thread(target=self._write_logs, name='simulator-logs', daemon=True)
+        writer.start()
+        self._threads = [server, writer]
+        logger.info(f"Simulator serving {len(self.targets)} targets on {self.base_url}, "
+                    f"writing {self.log_rate:.0f} lines/s to {self.log_path}")
+
+    def attach(self, monitor):
+        """将监控器指向模拟环境：注册虚拟目标、stub_status地址与访问日志"""
+        for target in self.target_configs():
+            monitor.targets.add(target)
+        monitor.status_url = f"{self.base_url}/status"
+        monitor.access_logs.patterns = [self.log_path]
+        # 虚拟目标共用一个主机，单主机并发上限会让探测排队
+        monitor.scheduler.per_host_concurrency = monitor.scheduler.max_concurrency
+
+    def stop(self):
+        self._stop_event.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        for thread in self._threads:
+            thread.join()
+
+    def _serve(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get('/status', self._status)
+        app.router.add_get('/t/{name}', self._target)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.TCPSite(self._runner, self.host, self.port, backlog=4096).start())
+        ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+    async def _status(self, request):
+        requests = self.stats['requests']
+        return web.Response(text=STUB_STATUS.format(active=self.stats['active'] + 1, accepts=requests,
+                                                    requests=requests, writing=self.stats['active']))
+
+    async def _target(self, request):
+        target = self._by_name.get(request.match_info['name'])
+        if target is None:
+            raise web.HTTPNotFound()
+        self.stats['requests'] += 1
+        self.stats['active'] += 1
+        try:
+            latency, error_rate, size = target.state(time.time())
+            # 延迟按对数正态抖动
+            await asyncio.sleep(latency * math.exp(self._rng.gauss(0, 0.25)))
+            if self._rng.random() < error_rate:
+                return web.Response(status=503, text='unavailable')
+            return web.Response(body=b'x' * size)
+        finally:
+            self.stats['active'] -= 1
+
+    def _client_ip(self, rng: random.Random) -> str:
+        # 少数客户端贡献大部分请求（Zipf近似），便于观察热点IP
+        index = min(self.client_ips - 1, int(rng.paretovariate(1.2)) - 1)
+        return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+    def _log_lines(self, count: int, now: float, rng: random.Random) -> str:
+        """生成count行访问日志，状态码与延迟取自随机虚拟目标的当前状态"""
+        stamp = datetime.fromtimestamp(now, tz=timezone.utc).strftime('%d/%b/%Y:%H:%M:%S +0000')
+        states = [target.state(now) for target in rng.sample(self.targets, min(len(self.targets), 32))]
+        lines = []
+        for _ in range(count):
+            latency, error_rate, size = rng.choice(states)
+            status = 503 if rng.random() < error_rate else 200
+            lines.append(
+                f'{self._client_ip(rng)} - - [{stamp}] "GET {rng.choice(LOG_PATHS)} HTTP/1.1" {status} '
+                f'{size if status == 200 else 0} "-" "{rng.choice(LOG_AGENTS)}" '
+                f'{latency * math.exp(rng.gauss(0, 0.25)):.3f}\n'
+            )
+        return ''.join(lines)
+
+    def _rotate_if_needed(self):
+        """超过log_max_size时按logrotate的方式重命名后新建文件"""
+        if not self.log_max_size:
+            return
+        try:
+            if os.path.getsize(self.log_path) >= parse_size(self.log_max_size):
+                os.replace(self.log_path, f"{self.log_path}.1")
+        except OSError:
+            pass
+
+    def _write_logs(self):
+        """每100ms追加一批日志，累计行数跟随设定速率"""
+        os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+        rng = random.Random(self._rng.random())
+        started = time.monotonic()
+        written = 0
+        while not self._stop_event.wait(0.1):
+            due = int((time.monotonic() - started) * self.log_rate) - written
+            if due <= 0:
+                continue
+            self._rotate_if_needed()
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(self._log_lines(due, time.time(), rng))
+            except OSError as e:
+                logger.error(f"Error writing simulated access log: {str(e)}")
+                continue
+            written += due
+            self.stats['log_lines'] = written
@@ -0,0 +1,242 @@
+import time
+import heapq
+import hashlib
+import ipaddress
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .utils import parse_duration
+
+DIMENSIONS = ('requests', 'bytes', 'errors')
+
+
+def hash_keys(keys: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """批量计算两个独立的32位哈希（BLAKE2b 64位摘要的高低两半），供各草图共用
+
+    不同初值的CRC32是线性的，两者异或只取决于键长，不能作为双重哈希的独立哈希对
+    """
+    digests = b''.join(hashlib.blake2b(key, digest_size=8).digest() for key in keys)
+    hashes = np.frombuffer(digests, dtype='<u8').astype(np.uint64)
+    return hashes >> np.uint64(32), hashes & np.uint64(0xFFFFFFFF)
+
+
+def mix64(h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+    """拼接为64位后做 splitmix64 混洗，得到分布均匀的64位哈希"""
+    x = (h1 << np.uint64(32)) | h2
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class CountMinSketch:
+    """Count-Min Sketch：固定 depth×width 计数表，估计值只会偏大"""
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth, dtype=np.uint64)[:, None]
+        self._row_index = np.arange(depth)[:, None]
+
+    def _indexes(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        # 双重哈希：h1 + i*h2 生成各行下标
+        return ((h1 + self._rows * (h2 | np.uint64(1))) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, h1: np.ndarray, h2: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """累加一批计数，返回这批键更新后的估计值"""
+        indexes = self._indexes(h1, h2)
+        for row in range(self.depth):
+            np.add.at(self.table[row], indexes[row], weights)
+        return self.table[self._row_index, indexes].min(axis=0)
+
+    def estimate(self, key: bytes) -> int:
+        h1, h2 = hash_keys([key])
+        indexes = self._indexes(h1, h2)
+        return int(self.table[self._row_index, indexes].min())
+
+
+class TopK:
+    """固定容量的热点集合：以Count-Min估计值为计数，仅当估计值超过当前最小值时才替换"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: Dict[bytes, int] = {}
+        # 最小堆，计数只增不减，堆中可能是过期的较小值，出堆时校正
+        self._heap: List[Tuple[int, bytes]] = []
+
+    def floor(self) -> int:
+        """进入集合所需的最小计数（未满时为0）"""
+        if len(self.counts) < self.k:
+            return 0
+        while True:
+            count, key = self._heap[0]
+            current = self.counts[key]
+            if current == count:
+                return count
+            heapq.heapreplace(self._heap, (current, key))
+
+    def offer(self, key: bytes, count: int):
+        if key in self.counts:
+            self.counts[key] = max(self.counts[key], count)
+            return
+        if len(self.counts) < self.k:
+            self.counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+            return
+        floor = self.floor()
+        if count > floor:
+            _, victim = heapq.heapreplace(self._heap, (count, key))
+            del self.counts[victim]
+            self.counts[key] = count
+
+    def top(self, n: int) -> List[Tuple[bytes, int]]:
+        """返回计数最高的n项 (键, 估计计数)"""
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计：2^p 个寄存器，标准误差约 1.04/sqrt(2^p)"""
+
+    def __init__(self, precision: int = 14):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+        self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add_hashes(self, hashes: np.ndarray):
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # 前导零个数+1；frexp 的指数即 bit_length
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        rank = np.where(rest > 0, (64 - self.p) - bit_length + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self) -> float:
+        estimate = self.alpha * self.m * self.m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # 小基数时使用线性计数
+            estimate = self.m * np.log(self.m / zeros)
+        return float(estimate)
+
+
+class IPWindow:
+    """一个统计窗口内按来源IP的请求、流量、错误热点与去重计数"""
+
+    def __init__(self, started: float, top_k: int, width: int, depth: int, precision: int):
+        self.started = started
+        self.top = {dim: TopK(top_k) for dim in DIMENSIONS}
+        self.cms = {dim: CountMinSketch(width, depth) for dim in DIMENSIONS}
+        self.distinct = HyperLogLog(precision)
+
+    def update(self, batches: Dict[str, Dict[bytes, int]]):
+        for dim, counts in batches.items():
+            if not counts:
+                continue
+            keys = list(counts)
+            h1, h2 = hash_keys(keys)
+            weights = np.fromiter(counts.values(), dtype=np.int64, count=len(keys))
+            estimates = self.cms[dim].update(h1, h2, weights)
+            # 只有估计值不低于当前门槛的键才可能进入热点集合
+            top = self.top[dim]
+            for i in np.flatnonzero(estimates >= top.floor()).tolist():
+                top.offer(keys[i], int(estimates[i]))
+            if dim == 'requests':
+                self.distinct.add_hashes(mix64(h1, h2))
+
+
+class IPStatsTracker:
+    """按来源IP的流式统计：内存固定，与不同IP数量无关；超出允许网段的热点IP用于告警"""
+
+    def __init__(self, config: Dict):
+        ip_config = config.get('monitoring', {}).get('ip_stats', {})
+        self.window = parse_duration(ip_config.get('window', '5m'))
+        self.top_k = int(ip_config.get('top_k', 100))
+        self.width = int(ip_config.get('cms_width', 4096))
+        self.depth = int(ip_config.get('cms_depth', 4))
+        self.precision = int(ip_config.get('hll_precision', 14))
+        self.allowed = [ipaddress.ip_network(cidr, strict=False)
+                        for cidr in config.get('security', {}).get('allowed_ips', [])]
+        self._lock = threading.Lock()
+        self._current = self._new_window(time.time())
+        self._previous: Optional[IPWindow] = None
+
+    def _new_window(self, started: float) -> IPWindow:
+        return IPWindow(started, self.top_k, self.width, self.depth, self.precision)
+
+    def _rotate(self, now: float):
+        if now - self._current.started >= self.window:
+            self._previous = self._current
+            self._current = self._new_window(now)
+
+    def update(self, requests: Dict[bytes, int], sizes: Dict[bytes, int], errors: Dict[bytes, int]):
+        """合并一批已按IP聚合的计数"""
+        with self._lock:
+            self._rotate(time.time())
+            self._current.update({'requests': requests, 'bytes': sizes, 'errors': errors})
+
+    def is_allowed(self, ip: str) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed)
+
+    def _elapsed(self, window: IPWindow, now: float) -> float:
+        return max(1.0, min(now - window.started, self.window))
+
+    def summary(self) -> Dict:
+        """当前窗口的去重IP数，及允许网段之外热点IP的最大请求/错误速率（告警输入）"""
+        with self._lock:
+            now = time.time()
+            self._rotate(now)
+            window = self._current
+            elapsed = self._elapsed(window, now)
+            unlisted = {}
+            for dim in ('requests', 'errors'):
+                rate = 0.0
+                for key, count in window.top[dim].top(self.top_k):
+                    if not self.is_allowed(key.decode('ascii', 'replace')):
+                        rate = count / elapsed
+                        break
+                unlisted[dim] = rate
+            return {
+                'distinct_ips': window.distinct.count(),
+                'unlisted_request_rate': unlisted['requests'],
+                'unlisted_error_rate': unlisted['errors']
+            }
+
+    def report(self, limit: int = 20, previous: bool = False) -> Dict:
+        """热点IP报表"""
+        with self._lock:
+            now = time.time()
+            self._rotate(now)
+            window = self._previous if previous else self._current
+            if window is None:
+                return {}
+            elapsed = self._elapsed(window, now) if not previous else self.window
+            top = {}
+            for dim, sketch in window.top.items():
+                top[dim] = []
+                for key, count in sketch.top(limit):
+                    ip = key.decode('ascii', 'replace')
+                    top[dim].append({
+                        'ip': ip,
+                        'count': count,
+                        'rate': count / elapsed,
+                        'allowed': self.is_allowed(ip)
+                    })
+            return {
+                'window_start': window.started,
+                'window_seconds': elapsed,
+                'distinct_ips': window.distinct.count(),
+                'top': top
+            }
+
+    def lookup(self, ip: str) -> Dict:
+        """估算单个IP在当前窗口的计数（Count-Min，偏大估计）"""
+        key = ip.encode('ascii')
+        with self._lock:
+            window = self._current
+            estimates = {dim: sketch.estimate(key) for dim, sketch in window.cms.items()}
+        return dict(estimates, ip=ip, allowed=self.is_allowed(ip))
@@ -0,0 +1,65 @@
+import json
+import time
+import threading
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+
+# 进程启动标识：版本号每次重启从0开始，ETag带上启动标识，避免重启后误返回304
+BOOT_ID = format(time.time_ns(), 'x')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, Mapping):
+        # 快照中的只读视图（MappingProxyType）
+        return dict(value)
+    return str(value)
+
+
+class Snapshot:
+    """不可变的指标快照，发布时预先序列化为JSON"""
+
+    __slots__ = ('version', 'published_at', 'data', '_payloads')
+
+    def __init__(self, version: int, published_at: Optional[float], sections: Dict[str, Dict]):
+        self.version = version
+        self.published_at = published_at
+        self.data: Mapping[str, Mapping] = MappingProxyType(
+            {key: MappingProxyType(value) for key, value in sections.items()}
+        )
+        self._payloads = {
+            key: json.dumps(value, default=_json_default, ensure_ascii=False).encode('utf-8')
+            for key, value in sections.items()
+        }
+
+    def payload(self, section: str) -> bytes:
+        """获取某一部分的JSON字节串"""
+        return self._payloads.get(section, b'{}')
+
+    @property
+    def etag(self) -> str:
+        return f'"{BOOT_ID}-{self.version}"'
+
+
+class SnapshotPublisher:
+    """快照发布器：后台循环单写，请求处理无锁读取最新引用"""
+
+    def __init__(self):
+        self._current = Snapshot(0, None, {})
+        self._write_lock = threading.Lock()
+
+    def publish(self, sections: Dict[str, Dict]) -> Snapshot:
+        """发布新版本快照（调用后不得再修改sections）"""
+        with self._write_lock:
+            snapshot = Snapshot(self._current.version + 1, time.time(), sections)
+            # 引用赋值是原子的，读者要么看到旧快照要么看到新快照
+            self._current = snapshot
+        return snapshot
+
+    def latest(self) -> Snapshot:
+        """获取最新快照"""
+        return self._current
@@ -0,0 +1,182 @@
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from .utils import parse_duration, parse_size
+
+
+def to_epoch(timestamp: datetime) -> float:
+    """UTC时间转为epoch秒（无时区信息按UTC处理）"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def align_columns(windows: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """将各序列的(时间戳, 数值)对齐到统一的时间轴"""
+    arrays = [timestamps for timestamps, _ in windows.values()]
+    if not arrays:
+        return {'timestamps': np.empty(0)}
+    axis = arrays[0]
+    # 同一时刻写入的序列时间戳完全一致，无需合并
+    if any(len(ts) != len(axis) or not np.array_equal(ts, axis) for ts in arrays[1:]):
+        axis = np.unique(np.concatenate(arrays))
+    columns = {'timestamps': axis}
+    for name, (timestamps, values) in windows.items():
+        if timestamps is axis or (len(timestamps) == len(axis) and np.array_equal(timestamps, axis)):
+            columns[name] = values
+        else:
+            column = np.full(len(axis), np.nan)
+            column[np.searchsorted(axis, timestamps)] = values
+            columns[name] = column
+    return columns
+
+
+class RingBuffer:
+    """定长环形缓冲区：时间戳与数值两列，内存预分配，写入不产生新对象"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self._head = 0  # 下一个写入位置
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def append(self, timestamp: float, value: float):
+        """追加一个样本（时间戳需单调不减）"""
+        self.timestamps[self._head] = timestamp
+        self.values[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def oldest(self) -> Optional[float]:
+        if not self._size:
+            return None
+        return float(self.timestamps[(self._head - self._size) % self.capacity])
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        if not self._size:
+            return None
+        index = (self._head - 1) % self.capacity
+        return float(self.timestamps[index]), float(self.values[index])
+
+    def _segments(self) -> List[slice]:
+        """按时间顺序返回有效数据所在的切片（最多两段）"""
+        start = (self._head - self._size) % self.capacity
+        if start + self._size <= self.capacity:
+            return [slice(start, start + self._size)]
+        return [slice(start, self.capacity), slice(0, self._head)]
+
+    def window(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """二分查找返回[start, end]区间内的样本"""
+        timestamps, values = [], []
+        for segment in self._segments():
+            ts = self.timestamps[segment]
+            lo = np.searchsorted(ts, start, side='left')
+            hi = np.searchsorted(ts, end, side='right')
+            if hi > lo:
+                timestamps.append(ts[lo:hi])
+                values.append(self.values[segment][lo:hi])
+        if not timestamps:
+            return np.empty(0), np.empty(0)
+        if len(timestamps) == 1:
+            return timestamps[0].copy(), values[0].copy()
+        return np.concatenate(timestamps), np.concatenate(values)
+
+
+class MetricStore:
+    """进程内近期指标存储：每个序列一个环形缓冲区，总内存受预算约束"""
+
+    def __init__(self, config: Dict):
+        monitoring = config.get('monitoring', {})
+        store_config = monitoring.get('store', {})
+        self.retention = parse_duration(store_config.get('retention', '1h'))
+        resolution = parse_duration(store_config.get('resolution', monitoring.get('interval', '5s')))
+        self.capacity = max(2, int(self.retention / resolution) + 1)
+        self.max_bytes = parse_size(store_config.get('max_memory', '64MB'))
+        self.max_series = max(1, self.max_bytes // (self.capacity * 16))
+        self._series: Dict[str, RingBuffer] = {}
+        self._lock = threading.Lock()
+
+    def _buffer(self, name: str) -> Optional[RingBuffer]:
+        buffer = self._series.get(name)
+        if buffer is None:
+            if len(self._series) >= self.max_series:
+                logger.warning(f"Metric store budget exhausted, dropping series {name}")
+                return None
+            buffer = self._series[name] = RingBuffer(self.capacity)
+        return buffer
+
+    def record(self, timestamp: datetime, values: Dict[str, float]):
+        """记录同一时刻的多个序列值"""
+        ts = to_epoch(timestamp)
+        with self._lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+                buffer = self._buffer(name)
+                if buffer is not None:
+                    buffer.append(ts, value)
+
+    def covers(self, start: datetime, series: Optional[List[str]] = None) -> bool:
+        """判断近期存储是否覆盖从start开始的时间范围"""
+        names = series or list(self._series)
+        if not names:
+            return False
+        start_ts = to_epoch(start)
+        with self._lock:
+            for name in names:
+                buffer = self._series.get(name)
+                oldest = buffer.oldest() if buffer is not None else None
+                if oldest is None or oldest > start_ts:
+                    return False
+        return True
+
+    def query(self, name: str, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """查询单个序列在时间窗口内的样本"""
+        with self._lock:
+            buffer = self._series.get(name)
+            if buffer is None:
+                return np.empty(0), np.empty(0)
+            return buffer.window(to_epoch(start), to_epoch(end))
+
+    def query_rows(self, names: List[str], start: datetime, end: datetime) -> List[Dict]:
+        """按时间戳对齐多个序列，返回逐行结果"""
+        rows: Dict[float, Dict] = {}
+        for name in names:
+            timestamps, values = self.query(name, start, end)
+            for ts, value in zip(timestamps.tolist(), values.tolist()):
+                row = rows.get(ts)
+                if row is None:
+                    row = rows[ts] = {'timestamp': datetime.fromtimestamp(ts, tz=timezone.utc)}
+                row[name] = value
+        return [rows[ts] for ts in sorted(rows)]
+
+    def query_columns(self, names: List[str], start: datetime, end: datetime) -> Dict[str, np.ndarray]:
+        """按时间戳对齐多个序列，返回列式结果（缺失值为NaN）"""
+        windows = {name: self.query(name, start, end) for name in names}
+        return align_columns(windows)
+
+    def latest(self, name: str) -> Optional[Tuple[float, float]]:
+        """获取序列的最新样本"""
+        with self._lock:
+            buffer = self._series.get(name)
+            return buffer.latest() if buffer is not None else None
+
+    def series(self) -> List[str]:
+        with self._lock:
+            return list(self._series)
+
+    def memory_usage(self) -> int:
+        """已分配的缓冲区字节数"""
+        with self._lock:
+            return sum(buffer.nbytes for buffer in self._series.values())
@@ -0,0 +1,221 @@
+import ssl
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import numpy as np
+from cryptography import x509
+from loguru import logger
+from prometheus_client import Gauge
+from .cadence import Cadence
+from .instrument import observe
+from .utils import parse_duration
+
+
+def _not_after(cert: x509.Certificate) -> datetime:
+    # cryptography 42起提供带时区的版本
+    if hasattr(cert, 'not_valid_after_utc'):
+        return cert.not_valid_after_utc
+    return cert.not_valid_after.replace(tzinfo=timezone.utc)
+
+
+def parse_certificate(der: bytes) -> Dict:
+    """解析证书的到期时间、签发者、主体与SAN"""
+    cert = x509.load_der_x509_certificate(der)
+    try:
+        names = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        sans = names.get_values_for_type(x509.DNSName) + [str(ip) for ip in names.get_values_for_type(x509.IPAddress)]
+    except x509.ExtensionNotFound:
+        sans = []
+    return {
+        'not_after': _not_after(cert),
+        'issuer': cert.issuer.rfc4514_string(),
+        'subject': cert.subject.rfc4514_string(),
+        'sans': sans
+    }
+
+
+class CertificateScanner:
+    """TLS证书扫描：在独立线程中按security.scan_interval并发握手检查各HTTPS目标与附加端点，
+    结果缓存至refresh到期或证书到期前expiry_margin，监控循环只读取最近一次的汇总"""
+
+    def __init__(self, config: Dict, targets: Callable[[], List[Dict]]):
+        security = config.get('security', {})
+        cert_config = security.get('certificates', {})
+        self.enabled = cert_config.get('enabled', True)
+        self.interval = parse_duration(security.get('scan_interval', '1h'))
+        self.verify = security.get('ssl_verify', True)
+        self.timeout = float(config.get('monitoring', {}).get('timeouts', {}).get('ssl', 5))
+        self.concurrency = int(cert_config.get('concurrency', 100))
+        self.refresh = parse_duration(cert_config.get('refresh', '12h'))
+        self.expiry_margin = parse_duration(cert_config.get('expiry_margin', '1d'))
+        self.warning_days = float(cert_config.get('warning_days', 30))
+        self.jitter = parse_duration(cert_config.get('jitter', '10s'))
+        self.extra_endpoints = cert_config.get('endpoints', [])
+        self._targets = targets
+        self._cache: Dict[str, Dict] = {}
+        # 汇总与各端点到期时间在扫描后整体替换，读者无需加锁
+        self._status = {'valid': True, 'warning': False, 'expiry_date': None, 'issuer': None,
+                        'days_to_expiry': None, 'endpoints': 0, 'invalid': 0, 'last_scan': None}
+        self._expiry: Tuple[Tuple[str, ...], np.ndarray] = ((), np.empty(0))
+        self._verify_context = ssl.create_default_context()
+        self._insecure_context = ssl.create_default_context()
+        self._insecure_context.check_hostname = False
+        self._insecure_context.verify_mode = ssl.CERT_NONE
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Prometheus指标
+        self.expiry_days = Gauge('tls_certificate_expiry_days', 'Days until the TLS certificate expires',
+                                 ['endpoint'])
+        self.invalid_count = Gauge('tls_certificate_invalid', 'TLS endpoints failing the handshake or verification')
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='tls-scanner', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def endpoints(self) -> Dict[str, Tuple[str, int]]:
+        """需要检查的端点：HTTPS目标及security.certificates.endpoints（host或host:port）"""
+        endpoints = {}
+        for target in self._targets():
+            parts = urlsplit(target['url'])
+            if parts.scheme == 'https' and parts.hostname:
+                port = parts.port or 443
+                endpoints[f"{parts.hostname}:{port}"] = (parts.hostname, port)
+        for item in self.extra_endpoints:
+            host, _, port = str(item).partition(':')
+            port = int(port or 443)
+            endpoints[f"{host}:{port}"] = (host, port)
+        return endpoints
+
+    def refresh_endpoints(self):
+        """端点变化时提前唤醒扫描线程（只检查缓存中没有的端点）"""
+        if self._thread is not None:
+            self._wake.set()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        cadence = Cadence(self.interval, jitter=self.jitter)
+        try:
+            while True:
+                woken = self._wake.wait(cadence.remaining())
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                start = time.perf_counter()
+                try:
+                    loop.run_until_complete(self.scan(self.endpoints()))
+                except Exception as e:
+                    logger.error(f"Error scanning TLS certificates: {str(e)}")
+                observe('io', 'tls_scan', time.perf_counter() - start)
+                if not woken:
+                    cadence.advance()
+        finally:
+            loop.close()
+
+    async def scan(self, endpoints: Dict[str, Tuple[str, int]]):
+        """并发检查缓存已过期的端点，并发布汇总"""
+        now = time.time()
+        due = [key for key in endpoints if self._cache.get(key, {}).get('expires', 0) <= now]
+        if due:
+            limit = asyncio.Semaphore(self.concurrency)
+            results = await asyncio.gather(*(self._check(key, *endpoints[key], limit) for key in due))
+            self._cache.update(zip(due, results))
+        # 不再监控的端点移出缓存
+        for key in set(self._cache) - set(endpoints):
+            if self._cache.pop(key).get('not_after') is not None:
+                self.expiry_days.remove(key)
+        self._publish()
+
+    async def _handshake(self, host: str, port: int, context: ssl.SSLContext) -> bytes:
+        """完成TLS握手并返回叶子证书（DER）"""
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, server_hostname=host), timeout=self.timeout
+        )
+        try:
+            return writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+        finally:
+            writer.close()
+            try:
+                await asyncio.wait_for(writer.wait_closed(), timeout=1)
+            except Exception:
+                pass
+
+    async def _check(self, key: str, host: str, port: int, limit: asyncio.Semaphore) -> Dict:
+        """检查单个端点：先按系统信任链验证，验证失败时再以不验证的方式取回证书"""
+        checked = time.time()
+        result = {'endpoint': key, 'checked_at': checked, 'expires': checked}
+        try:
+            async with limit:
+                der, error = None, None
+                if self.verify:
+                    try:
+                        der = await self._handshake(host, port, self._verify_context)
+                    except ssl.SSLCertVerificationError as e:
+                        error = e.verify_message or str(e)
+                if der is None:
+                    der = await self._handshake(host, port, self._insecure_context)
+            cert = parse_certificate(der)
+        except (OSError, asyncio.TimeoutError, ssl.SSLError, ValueError) as e:
+            result.update(valid=False, chain_valid=None, error=str(e) or type(e).__name__)
+            return result
+
+        expires_at = cert['not_after'].timestamp()
+        valid = error is None and expires_at > checked
+        result.update(cert, valid=valid, chain_valid=(error is None) if self.verify else None, error=error,
+                      warning=0 < expires_at - checked < self.warning_days * 86400,
+                      # 快到期的证书每轮都重新检查
+                      expires=min(checked + self.refresh, expires_at - self.expiry_margin))
+        return result
+
+    def _publish(self):
+        results = list(self._cache.values())
+        certs = [r for r in results if r.get('not_after') is not None]
+        soonest = min(certs, key=lambda r: r['not_after']) if certs else None
+        invalid = sum(1 for r in results if not r['valid'])
+        self._expiry = (tuple(r['endpoint'] for r in certs),
+                        np.array([r['not_after'].timestamp() for r in certs], dtype=np.float64))
+        self._status = {
+            'valid': invalid == 0,
+            'warning': any(r.get('warning') for r in results),
+            'expiry_date': soonest['not_after'] if soonest else None,
+            'issuer': soonest['issuer'] if soonest else None,
+            'days_to_expiry': None,
+            'endpoints': len(results),
+            'invalid': invalid,
+            'last_scan': datetime.utcnow()
+        }
+        now = time.time()
+        for r in certs:
+            self.expiry_days.labels(endpoint=r['endpoint']).set((r['not_after'].timestamp() - now) / 86400)
+        self.invalid_count.set(invalid)
+        if invalid:
+            logger.warning(f"{invalid} of {len(results)} TLS endpoints failed verification or handshake")
+
+    def status(self) -> Dict:
+        """证书状态汇总（与SSLStatus字段一致），剩余天数按当前时间计算"""
+        status = dict(self._status)
+        if status['expiry_date'] is not None:
+            status['days_to_expiry'] = (status['expiry_date'].timestamp() - time.time()) / 86400
+        return status
+
+    def expiry(self) -> Tuple[Tuple[str, ...], np.ndarray]:
+        """各端点证书的剩余天数，返回 (端点列表, 天数数组)"""
+        endpoints, not_after = self._expiry
+        return endpoints, (not_after - time.time()) / 86400
+
+    def results(self) -> List[Dict]:
+        """各端点最近一次的检查结果，按到期时间升序（握手失败的在前）"""
+        results = list(self._cache.values())
+        return sorted(results, key=lambda r: r['not_after'].timestamp() if r.get('not_after') else float('-inf'))
@@ -0,0 +1,56 @@
+import re
+from typing import Union
+
+_DURATION_UNITS = {
+    'ms': 0.001,
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+    'w': 604800
+}
+
+_SIZE_UNITS = {
+    'b': 1,
+    'kb': 1024,
+    'mb': 1024 ** 2,
+    'gb': 1024 ** 3
+}
+
+_QUANTITY_PATTERN = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*$')
+
+
+def _parse_quantity(value: Union[str, int, float], units: dict, default_unit: str) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _QUANTITY_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid quantity: {value!r}")
+    number, unit = match.groups()
+    unit = (unit or default_unit).lower()
+    if unit not in units:
+        raise ValueError(f"Unknown unit {unit!r} in {value!r}")
+    return float(number) * units[unit]
+
+
+def parse_duration(value: Union[str, int, float]) -> float:
+    """解析时长配置（如 500ms、5s、1h、30d），返回秒数；纯数字按秒处理"""
+    return _parse_quantity(value, _DURATION_UNITS, 's')
+
+
+def parse_size(value: Union[str, int, float]) -> int:
+    """解析容量配置（如 64MB），返回字节数；纯数字按字节处理"""
+    return int(_parse_quantity(value, _SIZE_UNITS, 'b'))
+
+
+_BANDWIDTH_UNITS = {
+    'bps': 1,
+    'kbps': 1000,
+    'mbps': 1000 ** 2,
+    'gbps': 1000 ** 3
+}
+
+
+def parse_bandwidth(value: Union[str, int, float]) -> float:
+    """解析带宽配置（如 100Mbps，按位计），返回字节/秒；纯数字按bps处理"""
+    return _parse_quantity(value, _BANDWIDTH_UNITS, 'bps') / 8
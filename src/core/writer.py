@@ -0,0 +1,235 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+from influxdb_client.client.write_api import SYNCHRONOUS
+from .instrument import observe
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _escape_key(value: str) -> str:
+    return value.replace(',', r'\,').replace('=', r'\=').replace(' ', r'\ ')
+
+
+def _format_field(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def to_line_protocol(measurement: str, fields: Dict, timestamp: datetime, tags: Optional[Dict] = None) -> str:
+    """将一个数据点编码为InfluxDB行协议"""
+    parts = [measurement.replace(',', r'\,').replace(' ', r'\ ')]
+    for key, value in sorted((tags or {}).items()):
+        if value is not None and value != '':
+            parts.append(f"{_escape_key(str(key))}={_escape_key(str(value))}")
+    field_set = ','.join(
+        f"{_escape_key(key)}={_format_field(value)}"
+        for key, value in fields.items() if value is not None
+    )
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    ns = (timestamp - _EPOCH) // _MICROSECOND * 1000
+    return f"{','.join(parts)} {field_set} {ns}"
+
+
+def _line_seconds(line: bytes) -> Optional[float]:
+    """行协议末尾的纳秒时间戳转为秒"""
+    try:
+        return int(line.rsplit(b' ', 1)[1]) / 1e9
+    except (IndexError, ValueError):
+        return None
+
+
+class BatchWriter:
+    """后台批量写入InfluxDB，失败时落盘到本地追加式缓冲文件并在恢复后重放"""
+
+    def __init__(self, config: Dict, influx_client):
+        influx_config = config['database']['influxdb']
+        writer_config = influx_config.get('writer', {})
+        self.bucket = influx_config.get('bucket', influx_config.get('database', 'nginx_monitor'))
+        self.batch_size = int(writer_config.get('batch_size', 5000))
+        self.flush_interval = float(writer_config.get('flush_interval', 1))
+        self.max_queue = int(writer_config.get('max_queue', 100000))
+        self.spool_path = writer_config.get('spool_path', 'data/influx_spool.lp')
+        self.spool_max_bytes = int(writer_config.get('spool_max_bytes', 100 * 1024 * 1024))
+        self.replay_interval = float(writer_config.get('replay_interval', 30))
+
+        self.write_api = influx_client.write_api(write_options=SYNCHRONOUS)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._last_replay = 0.0
+        self._replay_offset = 0
+        # 重放成功后回调 on_replay(最早时间, 最晚时间)（秒），供查询缓存失效
+        self.on_replay: Optional[Callable[[float, float], None]] = None
+        self.stats = {
+            'queue_depth': 0,
+            'written': 0,
+            'dropped': 0,
+            'spooled_bytes': self._spool_size(),
+            'last_flush_latency': 0.0,
+            'last_error': None
+        }
+
+        # Prometheus指标
+        self.flush_latency = Histogram('influx_flush_seconds', 'InfluxDB batch flush latency in seconds')
+        self.queue_depth = Gauge('influx_write_queue_depth', 'Number of points waiting to be written')
+        self.spooled = Gauge('influx_spool_bytes', 'Bytes waiting in the local spool')
+        self.dropped = Counter('influx_dropped_points_total', 'Points dropped because queue or spool was full')
+
+        self._thread = threading.Thread(target=self._run, name='influx-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, line: str):
+        """写入一行行协议数据（仅入队，不阻塞）"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.stats['dropped'] += 1
+                self.dropped.inc()
+            self._queue.append(line)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def write_many(self, lines: List[str]):
+        """批量入队"""
+        for line in lines:
+            self.write(line)
+
+    def _next_batch(self) -> List[str]:
+        """等待凑满一批或到达刷新间隔"""
+        deadline = time.monotonic() + self.flush_interval
+        with self._cond:
+            while not self._stop and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            self.stats['queue_depth'] = len(self._queue)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self.queue_depth.set(self.stats['queue_depth'])
+            if batch and not self._flush(batch):
+                self._spill(batch)
+            # 写入恢复后（或空闲时）重放缓冲文件
+            elif self._spool_pending() and time.monotonic() - self._last_replay > self.replay_interval:
+                self._replay()
+            if self._stop and not self._queue:
+                break
+
+    def _flush(self, batch: List[str]) -> bool:
+        """写入一批数据，返回是否成功"""
+        start = time.monotonic()
+        try:
+            self.write_api.write(bucket=self.bucket, record=batch)
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            logger.error(f"Error flushing {len(batch)} points to InfluxDB: {str(e)}")
+            return False
+        latency = time.monotonic() - start
+        self.flush_latency.observe(latency)
+        observe('io', 'influx_write', latency)
+        self.stats['last_flush_latency'] = latency
+        self.stats['written'] += len(batch)
+        return True
+
+    def _spool_size(self) -> int:
+        try:
+            return os.path.getsize(self.spool_path)
+        except OSError:
+            return 0
+
+    def _spool_pending(self) -> bool:
+        return self.stats['spooled_bytes'] > self._replay_offset
+
+    def _spill(self, batch: List[str]):
+        """InfluxDB不可用时追加写入本地缓冲文件，超出上限则丢弃"""
+        data = ('\n'.join(batch) + '\n').encode('utf-8')
+        if self.stats['spooled_bytes'] + len(data) > self.spool_max_bytes:
+            self.stats['dropped'] += len(batch)
+            self.dropped.inc(len(batch))
+            logger.warning(f"Spool full, dropped {len(batch)} points")
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spool_path) or '.', exist_ok=True)
+            with open(self.spool_path, 'ab') as f:
+                f.write(data)
+            self.stats['spooled_bytes'] += len(data)
+            self.spooled.set(self.stats['spooled_bytes'])
+        except OSError as e:
+            self.stats['dropped'] += len(batch)
+            self.dropped.inc(len(batch))
+            logger.error(f"Error writing spool: {str(e)}")
+
+    def _replay(self):
+        """从上次位置继续重放缓冲文件，全部成功后清空"""
+        self._last_replay = time.monotonic()
+        # 已重放数据的时间范围（秒），只保留最早与最晚值
+        span = [math.inf, -math.inf]
+        try:
+            with open(self.spool_path, 'rb') as f:
+                f.seek(self._replay_offset)
+                while True:
+                    lines = []
+                    for _ in range(self.batch_size):
+                        line = f.readline()
+                        if not line:
+                            break
+                        lines.append(line)
+                    if not lines:
+                        break
+                    if not self._flush([line.decode('utf-8').rstrip('\n') for line in lines]):
+                        return
+                    self._replay_offset = f.tell()
+                    times = [t for t in map(_line_seconds, lines) if t is not None]
+                    if times:
+                        span[0], span[1] = min(span[0], min(times)), max(span[1], max(times))
+            os.remove(self.spool_path)
+            logger.info(f"Replayed {self._replay_offset} spooled bytes to InfluxDB")
+            self._replay_offset = 0
+            self.stats['spooled_bytes'] = 0
+            self.spooled.set(0)
+        except OSError as e:
+            logger.error(f"Error replaying spool: {str(e)}")
+        finally:
+            self._notify_replay(*span)
+
+    def _notify_replay(self, earliest: float, latest: float):
+        if earliest <= latest and self.on_replay is not None:
+            try:
+                self.on_replay(earliest, latest)
+            except Exception as e:
+                logger.error(f"Error in replay callback: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        """获取写入器状态"""
+        with self._cond:
+            self.stats['queue_depth'] = len(self._queue)
+        return dict(self.stats)
+
+    def close(self, timeout: float = 10):
+        """刷新剩余数据并停止后台线程"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.write_api.close()
+
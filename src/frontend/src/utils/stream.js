@@ -0,0 +1,77 @@
+// 订阅服务端推送通道(/api/stream)，连接失败时回退到轮询，并定期尝试恢复推送
+export function subscribeStream ({ topics, fields, severity, onOpen, onState, onAlert, poll, pollInterval = 5000, retryInterval = 30000 }) {
+  const states = {}
+  let source = null
+  let pollTimer = null
+  let retryTimer = null
+  let stopped = false
+
+  const params = new URLSearchParams({ topics: topics.join(',') })
+  if (fields) params.set('fields', fields.join(','))
+  if (severity) params.set('severity', severity.join(','))
+
+  const startPolling = () => {
+    if (pollTimer || !poll) return
+    poll()
+    pollTimer = setInterval(poll, pollInterval)
+  }
+
+  const stopPolling = () => {
+    clearInterval(pollTimer)
+    pollTimer = null
+  }
+
+  const connect = () => {
+    if (stopped) return
+    if (typeof EventSource === 'undefined') {
+      startPolling()
+      return
+    }
+    source = new EventSource(`/api/stream?${params}`)
+
+    source.onopen = () => {
+      stopPolling()
+      onOpen && onOpen()
+    }
+
+    source.addEventListener('snapshot', (event) => {
+      const { topic, data } = JSON.parse(event.data)
+      states[topic] = data
+      onState && onState(topic, states[topic])
+    })
+
+    source.addEventListener('delta', (event) => {
+      const { topic, changes, removed } = JSON.parse(event.data)
+      const state = { ...(states[topic] || {}), ...changes }
+      removed.forEach(key => delete state[key])
+      states[topic] = state
+      onState && onState(topic, state)
+    })
+
+    source.addEventListener('alerts', (event) => {
+      onAlert && onAlert(JSON.parse(event.data))
+    })
+
+    source.onerror = () => {
+      // 服务端断开(如客户端处理过慢)或不可用：关闭连接，轮询并稍后重连
+      source.close()
+      source = null
+      startPolling()
+      if (!stopped && !retryTimer) {
+        retryTimer = setTimeout(() => {
+          retryTimer = null
+          connect()
+        }, retryInterval)
+      }
+    }
+  }
+
+  connect()
+
+  return () => {
+    stopped = true
+    if (source) source.close()
+    stopPolling()
+    clearTimeout(retryTimer)
+  }
+}
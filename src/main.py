@@ -1,18 +1,25 @@
 import os
 import yaml
 import time
+import asyncio
 import threading
+import click
 from datetime import datetime
 from loguru import logger
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from prometheus_client import start_http_server
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api import metrics
+from api import debug, metrics, stream
 
 from core.monitor import NetworkMonitor
 from core.alert import AlertSystem
+from core.broadcast import Broadcaster
 from core.optimizer import PerformanceOptimizer
+from core.simulator import TrafficSimulator
+from core.instrument import LoopStats, timed
+from core.cadence import Cadence
+from core.utils import parse_duration
 
 # 配置日志
 logger.add(
@@ -33,76 +40,147 @@ app = Flask(__name__)
 
 # 全局变量
 config = load_config()
-monitor = NetworkMonitor(config)
-alert_system = AlertSystem(config)
 optimizer = PerformanceOptimizer(config)
+monitor = NetworkMonitor(config, query_cache=optimizer.query_cache)
+broadcaster = Broadcaster(config)
+alert_system = AlertSystem(config, on_change=lambda alert: broadcaster.publish_event('alerts', alert))
+metrics.init(monitor, optimizer)
+stream.init(broadcaster, config)
+debug.init(config)
+_monitor_thread = None
+
+def publish_snapshot(collected: dict):
+    """发布指标与状态快照，供API请求无锁读取"""
+    resources = optimizer.monitor_resources()
+    snapshot = monitor.snapshots.publish({
+        'metrics': monitor.build_metrics_view(collected, resources),
+        'status': {
+            'monitor': {
+                'is_running': True,
+                'last_check': datetime.utcnow().isoformat()
+            },
+            'alerts': {
+                'active_count': alert_system.active_count()
+            },
+            'resources': resources
+        }
+    })
+    # 推送给订阅客户端
+    for section in ('metrics', 'status'):
+        broadcaster.publish_state(section, snapshot.data[section])
 
 def monitor_loop():
     """监控循环"""
+    # 监控线程独占一个事件循环，采集协程在其中并发执行
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # 各阶段耗时、调度延迟与超时导出到Prometheus
+    loop_stats = LoopStats(parse_duration(config['monitoring'].get('interval', '5s')))
+    # 按单调时钟的截止时间固定节拍执行，周期不随每轮耗时漂移
+    cadence = Cadence(loop_stats.interval, jitter=parse_duration(config['monitoring'].get('jitter', '1s')))
     while True:
+        # 等待下一次检查
+        time.sleep(cadence.remaining())
         try:
+            started = loop_stats.begin(cadence.deadline)
+            
             # 收集指标
-            metrics = monitor.collect_metrics()
+            with timed('stage', 'collect'):
+                metrics = loop.run_until_complete(monitor.collect_metrics())
             
-            # 优化性能
-            optimized_metrics = optimizer.optimize_performance(metrics)
+            # 发布快照
+            with timed('stage', 'publish'):
+                publish_snapshot(metrics)
+            
+            # 优化性能（派生指标并入采集结果，告警检查需要原始字段）
+            with timed('stage', 'optimize'):
+                optimized_metrics = {**metrics, **optimizer.optimize_performance(metrics)}
             
             # 检查告警
-            alerts = alert_system.check_alerts(optimized_metrics)
+            with timed('stage', 'alerts'):
+                alerts = alert_system.check_alerts(optimized_metrics)
             
             # 发送告警通知
             if alerts:
-                alert_system.send_notifications(alerts)
+                with timed('stage', 'notify'):
+                    alert_system.send_notifications(alerts)
             
             # 清理资源
-            optimizer.cleanup()
+            with timed('stage', 'cleanup'):
+                optimizer.cleanup()
             
-            # 等待下一次检查
-            time.sleep(config['monitoring']['interval'])
+            loop_stats.end(started)
             
         except Exception as e:
             logger.error(f"Error in monitor loop: {str(e)}")
-            time.sleep(5)  # 发生错误时等待5秒
+        
+        # 超时的轮次跳过错过的节拍，不补跑
+        skipped = cadence.advance()
+        if skipped:
+            loop_stats.skip(skipped)
+            logger.warning(f"Monitor tick overran, skipped {skipped} tick(s)")
+
+def snapshot_response(section: str):
+    """返回快照中预先序列化的JSON，客户端版本一致时返回304"""
+    snapshot = monitor.snapshots.latest()
+    if request.headers.get('If-None-Match') == snapshot.etag:
+        return Response(status=304)
+    return Response(snapshot.payload(section), mimetype='application/json',
+                    headers={'ETag': snapshot.etag})
 
 @app.route('/api/metrics')
 def get_metrics():
     """获取当前指标"""
-    try:
-        metrics = monitor.collect_metrics()
-        optimized_metrics = optimizer.optimize_performance(metrics)
-        return jsonify(optimized_metrics)
-    except Exception as e:
-        logger.error(f"Error getting metrics: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    return snapshot_response('metrics')
 
 @app.route('/api/alerts')
 def get_alerts():
-    """获取告警历史"""
+    """获取告警历史（游标分页）"""
     try:
-        alerts = alert_system.get_alert_history()
-        return jsonify(alerts)
+        start_time = request.args.get('start_time')
+        end_time = request.args.get('end_time')
+        cursor = request.args.get('cursor', type=int)
+        page = alert_system.get_alert_history(
+            start_time=datetime.fromisoformat(start_time) if start_time else None,
+            end_time=datetime.fromisoformat(end_time) if end_time else None,
+            alert_type=request.args.get('type'),
+            status=request.args.get('status'),
+            severity=request.args.get('severity'),
+            cursor=cursor,
+            limit=min(request.args.get('limit', 100, type=int), 1000)
+        )
+        page['active_count'] = alert_system.active_count()
+        return jsonify(page)
     except Exception as e:
         logger.error(f"Error getting alerts: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/alerts/<alert_id>/resolve', methods=['POST'])
+def resolve_alert(alert_id):
+    """解决告警"""
+    alert = alert_system.resolve_alert(alert_id)
+    if alert is None:
+        return jsonify({'error': 'alert not found'}), 404
+    return jsonify(alert)
+
+@app.route('/api/alerts/clear', methods=['POST'])
+def clear_alerts():
+    """清理已解决的告警"""
+    alert_system.clear_alert_history(status='resolved')
+    return jsonify({'status': 'ok'})
+
 @app.route('/api/status')
 def get_status():
     """获取系统状态"""
-    try:
-        status = {
-            'monitor': {
-                'is_running': True,
-                'last_check': datetime.utcnow().isoformat()
-            },
-            'alerts': {
-                'active_count': len([a for a in alert_system.get_alert_history() if a['status'] == 'active'])
-            },
-            'resources': optimizer.monitor_resources()
-        }
-        return jsonify(status)
-    except Exception as e:
-        logger.error(f"Error getting status: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    return snapshot_response('status')
+
+def start_monitor_thread():
+    """启动后台监控线程（仅启动一次）"""
+    global _monitor_thread
+    if _monitor_thread is None:
+        _monitor_thread = threading.Thread(target=monitor_loop, name='monitor-loop')
+        _monitor_thread.daemon = True
+        _monitor_thread.start()
 
 def main():
     """主函数"""
@@ -111,9 +189,7 @@ def main():
         start_http_server(9090)
         
         # 启动监控线程
-        monitor_thread = threading.Thread(target=monitor_loop)
-        monitor_thread.daemon = True
-        monitor_thread.start()
+        start_monitor_thread()
         
         # 启动Flask应用
         app.run(
@@ -125,9 +201,64 @@ def main():
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
         raise
+    finally:
+        # 退出前刷新未写入的指标并停止通知分发
+        monitor.cleanup()
+        alert_system.close()
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def cli(ctx):
+    """IP监控系统；不带子命令时直接启动监控服务"""
+    if ctx.invoked_subcommand is None:
+        main()
+
+@cli.command()
+@click.option('--targets', type=int, help='虚拟目标数量')
+@click.option('--profile', 'profiles', multiple=True, metavar='NAME=SHARE',
+              help='目标配置占比，可重复，如 --profile steady=80 --profile outage=20')
+@click.option('--log-rate', type=float, help='每秒生成的访问日志行数')
+@click.option('--port', type=int, help='虚拟目标监听端口')
+@click.option('--serve-only', is_flag=True, help='只提供虚拟目标与访问日志，不启动监控')
+def simulate(targets, profiles, log_rate, port, serve_only):
+    """模拟模式：启动虚拟目标与访问日志生成，并让监控器采集它们"""
+    sim_config = config.setdefault('simulator', {})
+    if targets is not None:
+        sim_config['targets'] = targets
+    if profiles:
+        try:
+            sim_config['profiles'] = {name: float(share) for name, share in
+                                      (item.split('=', 1) for item in profiles)}
+        except ValueError:
+            raise click.BadParameter('格式应为 NAME=SHARE', param_hint='--profile')
+    if log_rate is not None:
+        sim_config['log_rate'] = log_rate
+    if port is not None:
+        sim_config['port'] = port
+
+    try:
+        simulator = TrafficSimulator(config)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--profile')
+    simulator.start()
+    try:
+        if serve_only:
+            click.echo(f"stub_status: {simulator.base_url}/status")
+            click.echo(f"access log: {simulator.log_path}")
+            click.echo(yaml.safe_dump({'targets': simulator.target_configs()}, allow_unicode=True,
+                                      sort_keys=False), nl=False)
+            while True:
+                time.sleep(1)
+        else:
+            simulator.attach(monitor)
+            main()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
 
 if __name__ == '__main__':
-    main()
+    cli()
 
 # 创建FastAPI主应用文件
 app = FastAPI(
@@ -147,6 +278,13 @@ app.add_middleware(
 
 # 注册路由
 app.include_router(metrics.router, prefix="/api", tags=["metrics"])
+app.include_router(stream.router, prefix="/api", tags=["stream"])
+app.include_router(debug.router, prefix="/api", tags=["debug"])
+
+@app.on_event("startup")
+async def startup():
+    # 由uvicorn启动时同样需要后台监控线程发布快照
+    start_monitor_thread()
 
 @app.get("/")
 async def root():
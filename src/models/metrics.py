@@ -1,11 +1,15 @@
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class SSLStatus(BaseModel):
     valid: bool
     warning: bool = False
     expiry_date: Optional[datetime] = None
+    issuer: Optional[str] = None
+    days_to_expiry: Optional[float] = None
+    endpoints: int = 0
+    invalid: int = 0
 
 class Resources(BaseModel):
     cpu_percent: float
@@ -18,8 +22,22 @@ class MetricsResponse(BaseModel):
     connection_count: int
     error_rate: float
     bandwidth: float
+    request_rate: float = 0.0
+    latency: Dict[str, float] = {}
+    interfaces: Dict[str, Dict[str, float]] = {}
     ssl_status: SSLStatus
     resources: Resources
 
-class MetricsHistoryResponse(MetricsResponse):
-    pass 
\ No newline at end of file
+class MetricsHistoryResponse(BaseModel):
+    """列式历史数据：每个指标一列，与timestamps等长"""
+    timestamps: List[float]
+    response_time: List[Optional[float]] = []
+    connection_count: List[Optional[float]] = []
+    error_rate: List[Optional[float]] = []
+    bytes_sent: List[Optional[float]] = []
+    bytes_recv: List[Optional[float]] = []
+    request_rate: List[Optional[float]] = []
+
+    class Config:
+        # 降采样层级还会附带 *_min/*_max/*_count 列
+        extra = 'allow' 
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+import sys
+import copy
+import pytest
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+with open(os.path.join(ROOT, 'config', 'app', 'config.yaml'), 'r', encoding='utf-8') as f:
+    _CONFIG = yaml.safe_load(f)
+
+
+@pytest.fixture
+def config(tmp_path):
+    """仓库默认配置的副本，数据文件指向临时目录"""
+    config = copy.deepcopy(_CONFIG)
+    config['database']['influxdb']['writer']['spool_path'] = str(tmp_path / 'spool.lp')
+    config['alerts']['history']['persist_path'] = str(tmp_path / 'alerts.jsonl')
+    config['monitoring']['access_logs']['state_path'] = str(tmp_path / 'offsets.json')
+    return config
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+import pytest
+from src.core import alert as alert_module
+from src.core.alert import AlertSystem
+
+
+class _Dispatcher:
+    def __init__(self, config):
+        self.sent = []
+
+    def enqueue(self, alerts):
+        self.sent.extend(alerts)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def alerts(config, monkeypatch):
+    # 通知渠道会注册Prometheus指标并启动线程，测试中替换为内存实现
+    monkeypatch.setattr(alert_module, 'NotificationDispatcher', _Dispatcher)
+    return lambda: AlertSystem(config)
+
+
+def _metrics(response_time):
+    return {'response_time': response_time, 'error_rate': 0.0, 'connection_count': 0,
+            'bandwidth': {'bytes_sent': 0, 'bytes_recv': 0}}
+
+
+def _adopted(alerts):
+    before = alerts()
+    fired = before._create_alert('response_time', 'slow', 2.0, datetime.utcnow() - timedelta(minutes=10))
+    after = alerts()
+    return after, fired['id']
+
+
+def test_adopted_alert_continues_while_breaching(alerts):
+    system, alert_id = _adopted(alerts)
+    assert system.check_alerts(_metrics(2.0)) == []
+    assert system.store.get(alert_id)['status'] == 'active'
+    assert system.active_count() == 1
+
+
+def test_adopted_alert_resolves_after_grace(alerts):
+    system, alert_id = _adopted(alerts)
+    assert system.check_alerts(_metrics(0.1)) == []
+    assert system.store.get(alert_id)['status'] == 'active'
+
+    system._grace[('response_time', 'host')] = 0.0
+    resolved = system.check_alerts(_metrics(0.1))
+    assert [alert['id'] for alert in resolved] == [alert_id]
+    assert system.store.get(alert_id)['status'] == 'resolved'
@@ -0,0 +1,28 @@
+import json
+import asyncio
+from types import MappingProxyType
+from src.core.broadcast import Broadcaster
+
+
+def _frame(message: bytes) -> dict:
+    fields = dict(line.split(': ', 1) for line in message.decode('utf-8').strip().split('\n'))
+    return {'event': fields['event'], 'data': json.loads(fields['data'])}
+
+
+def test_snapshot_frames_are_json_objects(config):
+    broadcaster = Broadcaster(config)
+    # 与SnapshotPublisher发布的快照一致：各部分及嵌套字段均为只读视图
+    broadcaster.publish_state('metrics', MappingProxyType({
+        'cpu_usage': 12.5,
+        'bandwidth': MappingProxyType({'bytes_sent': 10, 'bytes_recv': 20})
+    }))
+
+    async def first_frame():
+        subscription = broadcaster.subscribe(['metrics'])
+        return await subscription.queue.get()
+
+    frame = _frame(asyncio.run(first_frame()))
+    assert frame['event'] == 'snapshot'
+    assert frame['data'] == {'topic': 'metrics', 'data': {
+        'cpu_usage': 12.5, 'bandwidth': {'bytes_sent': 10, 'bytes_recv': 20}
+    }}
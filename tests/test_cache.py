@@ -0,0 +1,40 @@
+import numpy as np
+from src.core.cache import QueryCache
+
+
+def _fetcher(points):
+    calls = []
+
+    def fetch(start, end):
+        calls.append((start, end))
+        timestamps = np.array([t for t in points if start <= t < end], dtype=np.float64)
+        return {'timestamps': timestamps, 'value': np.ones(len(timestamps))}
+    return fetch, calls
+
+
+def test_empty_bucket_is_not_sealed(config):
+    cache = QueryCache(config)
+    step = 5.0
+    bucket = cache.bucket_size(step)
+    fetch, calls = _fetcher([])
+    cache.get_range('q', 0, bucket, step, fetch)
+    key = ('q', bucket, 0.0)
+    assert cache._entries[key][2] is not None
+    # 过期后重新查询，能看到补写的数据
+    cache._entries[key] = cache._entries[key][:2] + (0.0,)
+    late = [i * step for i in range(cache.bucket_points)]
+    fetch, calls = _fetcher(late)
+    result = cache.get_range('q', 0, bucket, step, fetch)
+    assert len(result['timestamps']) == cache.bucket_points
+    assert cache._entries[key][2] is None
+
+
+def test_invalidate_drops_overlapping_buckets(config):
+    cache = QueryCache(config)
+    step = 5.0
+    bucket = cache.bucket_size(step)
+    fetch, calls = _fetcher([i * step for i in range(cache.bucket_points * 3)])
+    cache.get_range('q', 0, bucket * 3, step, fetch)
+    cache.invalidate(bucket + 10, bucket + 20)
+    cache.get_range('q', 0, bucket * 3, step, fetch)
+    assert calls[-1] == (bucket, bucket * 2)
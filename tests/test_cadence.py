@@ -0,0 +1,37 @@
+from src.core import cadence as cadence_module
+from src.core.cadence import Cadence, ProbeCadence
+
+
+def test_probe_first_deadlines_are_jittered(config, monkeypatch):
+    monkeypatch.setattr(cadence_module.time, 'monotonic', lambda: 100.0)
+    config['monitoring']['jitter'] = '3s'
+    cadence = ProbeCadence(config)
+    offsets = [c.deadline - 100.0 for c in cadence.cadences.values()]
+    assert all(0 <= offset <= 3.0 for offset in offsets)
+    assert len(set(offsets)) > 1
+
+    # 抖动不超过探测项自己的周期
+    config['monitoring']['jitter'] = '1h'
+    cadence = ProbeCadence(config)
+    assert all(c.deadline - 100.0 <= c.interval for c in cadence.cadences.values())
+
+
+def test_advance_keeps_fixed_schedule():
+    cadence = Cadence(5.0, start=0.0)
+    assert cadence.due(0.0)
+    # 执行耗时不影响下一次截止时间
+    assert cadence.advance(3.0) == 0
+    assert cadence.deadline == 5.0
+    assert not cadence.due(4.9)
+    assert cadence.remaining(4.0) == 1.0
+
+
+def test_advance_skips_missed_ticks():
+    cadence = Cadence(5.0, start=0.0)
+    # 一轮耗时17秒：5、10、15三个截止时间已错过，直接跳到20
+    assert cadence.advance(17.0) == 3
+    assert cadence.deadline == 20.0
+    assert cadence.skipped == 3
+    # 恰好落在截止时间上也算错过
+    assert cadence.advance(25.0) == 1
+    assert cadence.deadline == 30.0
@@ -0,0 +1,49 @@
+from collections import namedtuple
+import numpy as np
+from src.core.counters import CounterRates
+
+Counters = namedtuple('Counters', 'bytes_sent bytes_recv')
+
+
+def _deltas(current, previous):
+    rates = CounterRates(('bytes_sent',))
+    deltas = rates._deltas(np.array([current], dtype=np.uint64), np.array([previous], dtype=np.uint64))
+    return int(deltas[0]), rates.resets
+
+
+def test_increasing_counter():
+    assert _deltas(1500, 1000) == (500, 0)
+
+
+def test_32bit_wrap():
+    assert _deltas(100, (1 << 32) - 400) == (500, 0)
+
+
+def test_64bit_wrap():
+    assert _deltas(100, (1 << 64) - 400) == (500, 0)
+
+
+def test_reset_counts_from_zero():
+    # 计数器变小且不像回绕时按重置处理，重置以来的计数即为增量
+    assert _deltas(300, 5_000_000_000) == (300, 1)
+    assert _deltas(300, 1_000_000) == (300, 1)
+
+
+def test_rates_follow_interfaces_added_and_removed():
+    rates = CounterRates(('bytes_sent', 'bytes_recv'))
+    assert rates.update({'eth0': Counters(1000, 2000)}, now=0.0) == {}
+
+    # 新网卡本轮没有速率，已有网卡按名称对齐
+    result = rates.update({'eth1': Counters(50, 50), 'eth0': Counters(1500, 3000)}, now=1.0)
+    assert result == {'eth0': {'bytes_sent_per_sec': 500.0, 'bytes_recv_per_sec': 1000.0}}
+
+    result = rates.update({'eth0': Counters(2500, 3000), 'eth1': Counters(250, 450)}, now=3.0)
+    assert result == {'eth0': {'bytes_sent_per_sec': 500.0, 'bytes_recv_per_sec': 0.0},
+                      'eth1': {'bytes_sent_per_sec': 100.0, 'bytes_recv_per_sec': 200.0}}
+
+    # 移除的网卡不再出现，重新出现时视为新网卡
+    assert rates.update({'eth1': Counters(450, 650)}, now=4.0) == {
+        'eth1': {'bytes_sent_per_sec': 200.0, 'bytes_recv_per_sec': 200.0}}
+    assert rates.update({'eth0': Counters(10, 10), 'eth1': Counters(550, 650)}, now=5.0) == {
+        'eth1': {'bytes_sent_per_sec': 100.0, 'bytes_recv_per_sec': 0.0}}
+    assert rates.resets == 0
@@ -0,0 +1,48 @@
+import struct
+from datetime import datetime, timedelta
+import numpy as np
+from src.core.latency import LatencyHistogram, LatencyRollup, LatencySketch, PROMETHEUS_BUCKETS
+
+
+def test_histogram_counts_each_request():
+    rng = np.random.default_rng(3)
+    values = rng.lognormal(np.log(0.05), 1.0, size=20000)
+    histogram = LatencyHistogram('test_latency_seconds', 'test', registry=None)
+    for chunk in np.array_split(values, 10):
+        sketch = LatencySketch()
+        sketch.add_many(chunk)
+        histogram.observe_sketch(sketch)
+
+    family, = histogram.collect()
+    buckets = {s.labels['le']: s.value for s in family.samples if s.name.endswith('_bucket')}
+    assert buckets['+Inf'] == len(values)
+    for bound in PROMETHEUS_BUCKETS[:-1]:
+        counted = buckets[str(bound)]
+        # 略高于上界（2%以内）的样本可能计入该桶
+        assert np.sum(values <= bound) <= counted <= np.sum(values <= bound * 1.02)
+    total, = [s.value for s in family.samples if s.name.endswith('_sum')]
+    assert abs(total - values.sum()) < 1e-6 * values.sum()
+
+
+def test_quantiles_flag_truncated_coverage(config):
+    rollup = LatencyRollup(config)
+    now = datetime.utcnow()
+    sketch = LatencySketch()
+    sketch.add_many(np.full(100, 0.2))
+    rollup.ingest(now - timedelta(minutes=5), sketch)
+
+    covered = rollup.covered_since(now - timedelta(days=30), now)
+    assert covered is not None and covered > (now - timedelta(days=30) - datetime(1970, 1, 1)).total_seconds()
+    assert rollup.quantiles(now - timedelta(days=30), now)['count'] == 100
+    assert LatencyRollup(config).covered_since(now - timedelta(hours=1), now) is None
+
+
+def test_serialization_keeps_counts_past_uint32():
+    sketch = LatencySketch()
+    sketch.add_many(np.full(3, 0.05))
+    sketch.counts[-1] = 2 ** 32 + 3
+    restored = LatencySketch.from_bytes(sketch.to_bytes())
+    assert restored.counts[-1] == 2 ** 32 + 3
+    # 版本1格式（无版本号，uint32计数）仍可读取
+    legacy = struct.pack('<qqdd', restored.offset, 3, 0.15, 0.01) + np.array([3], dtype='<u4').tobytes()
+    assert LatencySketch.from_bytes(legacy).counts.tolist() == [3]
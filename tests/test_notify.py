@@ -0,0 +1,39 @@
+from datetime import datetime
+from src.core.notify import DelayQueue, WebhookChannel
+
+
+def test_closed_queue_drains_delayed_items():
+    queue = DelayQueue(10)
+    queue.put('retry', delay=60)
+    queue.put('digest', delay=10)
+    queue.close()
+    # 关闭后不再等待到期时间，按到期顺序取出剩余项
+    assert queue.get() == 'digest'
+    assert queue.get() == 'retry'
+    assert queue.get() is None
+    assert not queue.put('late')
+
+
+def test_drain_returns_leftovers():
+    queue = DelayQueue(10)
+    queue.put('a', delay=5)
+    queue.put('b', delay=1)
+    queue.close()
+    assert queue.drain() == ['b', 'a']
+    assert len(queue) == 0
+
+
+def _webhook(config, fmt):
+    config['alerts']['webhook'] = {'url': 'http://localhost/hook'}
+    config['alerts']['notify']['webhook_format'] = fmt
+    return WebhookChannel(config, 1.0, 1)
+
+
+def test_webhook_keeps_single_alert_shape(config):
+    alert = {'id': 1, 'type': 'error_rate', 'message': 'm', 'timestamp': datetime(2024, 1, 1),
+             'severity': 'warning'}
+    channel = _webhook(config, 'single')
+    payload = channel.payload([alert])
+    assert payload['alert_id'] == 1 and 'alerts' not in payload
+    channel = _webhook(config, 'digest')
+    assert channel.payload([alert])['count'] == 1
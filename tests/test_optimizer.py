@@ -0,0 +1,14 @@
+import time
+from src.core.optimizer import PerformanceOptimizer
+
+
+def test_monitor_resources_does_not_block(config):
+    optimizer = PerformanceOptimizer(config)
+    try:
+        start = time.monotonic()
+        for _ in range(100):
+            resources = optimizer.monitor_resources()
+        assert time.monotonic() - start < 0.1
+        assert 'cpu_percent' in resources
+    finally:
+        optimizer.sampler.stop()
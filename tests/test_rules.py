@@ -0,0 +1,51 @@
+import numpy as np
+from src.core.rules import RuleEngine
+
+
+def _fired(engine, now, samples):
+    return {(item['rule'], item['series']) for item in engine.evaluate(now, samples)}
+
+
+def test_threshold_fires_after_duration():
+    engine = RuleEngine({'slow': {'metric': 'response_time', 'threshold': 1.0, 'duration': 10}}, 5.0)
+    series = ['host', 'target:a']
+    assert _fired(engine, 0, {'response_time': (series, [2.0, 0.5])}) == set()
+    assert _fired(engine, 5, {'response_time': (series, [2.0, 2.0])}) == set()
+    assert _fired(engine, 10, {'response_time': (series, [2.0, 2.0])}) == {('slow', 'host')}
+    # 恢复后重新计时
+    assert _fired(engine, 15, {'response_time': (series, [0.5, 2.0])}) == {('slow', 'target:a')}
+    assert _fired(engine, 20, {'response_time': (series, [2.0, 2.0])}) == {('slow', 'target:a')}
+
+
+def test_threshold_operator_and_since():
+    engine = RuleEngine({'expiry': {'metric': 'days', 'op': '<', 'threshold': 14, 'duration': 0}}, 5.0)
+    fired = engine.evaluate(100, {'days': (['tls:a', 'tls:b'], np.array([3.0, 90.0]))})
+    assert [(item['series'], item['value'], item['since']) for item in fired] == [('tls:a', 3.0, 100.0)]
+
+
+def test_rate_uses_sliding_window():
+    rules = {'surge': {'metric': 'requests', 'kind': 'rate', 'threshold': 1.0, 'window': 10, 'duration': 0}}
+    engine = RuleEngine(rules, 5.0)
+    # 变化率与window（2个样本）之前的样本比较，数据不足时与最早样本比较
+    assert _fired(engine, 0, {'requests': (['host'], [0])}) == set()
+    assert _fired(engine, 5, {'requests': (['host'], [4])}) == set()
+    assert _fired(engine, 10, {'requests': (['host'], [30])}) == {('surge', 'host')}
+    fired = engine.evaluate(15, {'requests': (['host'], [34])})
+    assert fired and abs(fired[0]['value'] - 3.0) < 1e-9
+    # 最早样本滑出窗口后变化率下降
+    assert _fired(engine, 20, {'requests': (['host'], [36])}) == set()
+
+
+def test_absence_fires_when_series_stops():
+    engine = RuleEngine({'silent': {'metric': 'response_time', 'kind': 'absence', 'duration': 10}}, 5.0)
+    assert _fired(engine, 0, {'response_time': (['target:a', 'target:b'], [0.1, 0.1])}) == set()
+    assert _fired(engine, 10, {'response_time': (['target:a'], [0.1])}) == set()
+    assert _fired(engine, 11, {'response_time': (['target:a'], [0.1])}) == {('silent', 'target:b')}
+    # 重新出现后恢复
+    assert _fired(engine, 15, {'response_time': (['target:a', 'target:b'], [0.1, 0.1])}) == set()
+
+
+def test_seed_restores_breach_state():
+    engine = RuleEngine({'slow': {'metric': 'response_time', 'threshold': 1.0, 'duration': 300}}, 5.0)
+    engine.seed('slow', 'host', 1000.0)
+    assert _fired(engine, 1005, {'response_time': (['host'], [2.0])}) == {('slow', 'host')}
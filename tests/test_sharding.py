@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from src.core.sharding import ERRORS, ShardBuffer, ShardedProbes, _encode, shard_of
+
+
+@pytest.fixture
+def buffer():
+    buffer = ShardBuffer(4)
+    yield buffer
+    buffer.close(unlink=True)
+
+
+def test_read_before_first_write(buffer):
+    assert buffer.read() is None
+
+
+def test_write_read_round_trip(buffer):
+    results = [
+        {'target': 'a', 'ok': True, 'status': 200, 'response_time': 0.05},
+        {'target': 'b', 'ok': False, 'error': 'timeout'},
+        {'target': 'c', 'ok': False, 'error': 'connection refused'}
+    ]
+    buffer.write(_encode(results), published=123.0, duration=0.5)
+    seq, columns, published, duration = buffer.read()
+    assert seq == 2 and published == 123.0 and duration == 0.5
+    assert columns['ok'].tolist() == [1, 0, 0]
+    assert columns['status'][0] == 200 and columns['response_time'][0] == 0.05
+    # 未知错误统一编码为failed
+    assert [ERRORS[code] for code in columns['error']] == ['', 'timeout', 'failed']
+
+    decoded = ShardedProbes._decode([{'name': r['target']} for r in results], columns)
+    assert decoded[0] == {'target': 'a', 'ok': True, 'status': 200, 'response_time': 0.05}
+    assert decoded[2] == {'target': 'c', 'ok': False, 'error': 'failed'}
+
+
+def test_read_returns_a_copy(buffer):
+    buffer.write(_encode([{'target': 'a', 'ok': True, 'status': 200, 'response_time': 0.1}]), 1.0, 0.1)
+    _, columns, _, _ = buffer.read()
+    buffer.write(_encode([{'target': 'a', 'ok': True, 'status': 500, 'response_time': 0.2}]), 2.0, 0.1)
+    assert columns['status'][0] == 200
+    assert buffer.read()[1]['status'][0] == 500
+
+
+def test_read_skips_write_in_progress(buffer):
+    buffer.write(_encode([{'target': 'a', 'ok': True, 'status': 200, 'response_time': 0.1}]), 1.0, 0.1)
+    # seq为奇数表示worker正在写入，读者不返回半写的数据
+    buffer._seq[0] += 1
+    assert buffer.read(retries=3) is None
+    buffer._seq[0] += 1
+    assert buffer.read()[0] == 4
+
+
+def test_attached_buffer_sees_writes(buffer):
+    reader = ShardBuffer(4, name=buffer.name)
+    try:
+        buffer.write(_encode([{'target': 'a', 'ok': True, 'status': 204, 'response_time': 0.1}]), 1.0, 0.1)
+        assert reader.read()[1]['status'].tolist() == [204]
+    finally:
+        reader.close()
+
+
+def test_shard_assignment_is_stable():
+    names = [f"target-{i}" for i in range(1000)]
+    shards = [shard_of(name, 4) for name in names]
+    assert shards == [shard_of(name, 4) for name in names]
+    assert np.bincount(shards).min() > 200
+
+
+def test_new_worker_is_not_stale_before_its_first_round():
+    probes = SimpleNamespace(interval=60.0, stale_after=124.0)
+    shard = {'seq': 0, 'started_at': 1000.0, 'updated_at': 900.0}
+    # 首轮随机错开至多一个采集周期，从最晚的首轮开始时间起算
+    assert ShardedProbes._stale_at(probes, shard) == 1000.0 + 60.0 + 124.0
+    shard.update(seq=2, updated_at=1100.0)
+    assert ShardedProbes._stale_at(probes, shard) == 1100.0 + 124.0
+
+
+def test_tally_columns_matches_decoded_results():
+    results = [
+        {'target': 'a', 'ok': True, 'status': 200, 'response_time': 0.05},
+        {'target': 'b', 'ok': False, 'error': 'timeout'},
+        {'target': 'c', 'ok': False, 'error': 'tick_deadline'},
+        {'target': 'd', 'ok': False, 'status': 500, 'response_time': 0.1}
+    ]
+    counts = ShardedProbes._tally_columns(_encode(results))
+    assert counts == {'completed': 1, 'timed_out': 2, 'failed': 1}
+    assert ShardedProbes._tally(results) == dict(counts, pending=0)
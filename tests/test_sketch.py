@@ -0,0 +1,42 @@
+import math
+import numpy as np
+from src.core.sketch import CountMinSketch, HyperLogLog, hash_keys, mix64
+
+
+def _ip_stream(count: int, seed: int = 7):
+    """长尾的来源IP流：少数IP贡献大部分请求"""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.3, size=count), 1 << 20)
+    keys, weights = np.unique(ranks, return_counts=True)
+    return [f"10.{k >> 16 & 255}.{k >> 8 & 255}.{k & 255}".encode() for k in keys.tolist()], weights
+
+
+def test_hash_pair_is_not_length_determined():
+    keys = [f"10.0.0.{i}".encode() for i in range(100, 200)]
+    h1, h2 = hash_keys(keys)
+    # 等长键的两个哈希之差不应恒定
+    assert len(np.unique(h1 ^ h2)) == len(keys)
+
+
+def test_count_min_overestimate_within_bound():
+    keys, weights = _ip_stream(200000)
+    width, depth = 1024, 4
+    sketch = CountMinSketch(width, depth)
+    h1, h2 = hash_keys(keys)
+    sketch.update(h1, h2, weights)
+
+    total = int(weights.sum())
+    bound = math.e / width * total
+    estimates = sketch.table[sketch._row_index, sketch._indexes(h1, h2)].min(axis=0)
+    errors = estimates - weights
+    assert (errors >= 0).all()
+    # 超出 ε·N 的概率不超过 δ = e^-depth
+    assert np.mean(errors > bound) <= math.exp(-depth)
+
+
+def test_hyperloglog_accuracy():
+    hll = HyperLogLog(14)
+    keys = [f"192.168.{i >> 8 & 255}.{i & 255}-{i}".encode() for i in range(100000)]
+    hll.add_hashes(mix64(*hash_keys(keys)))
+    # 标准误差约0.8%，按4倍放宽
+    assert abs(hll.count() - len(keys)) / len(keys) < 4 * 1.04 / math.sqrt(hll.m)
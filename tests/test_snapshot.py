@@ -0,0 +1,11 @@
+from src.core import snapshot as snapshot_module
+from src.core.snapshot import SnapshotPublisher
+
+
+def test_etag_differs_across_restarts(monkeypatch):
+    before = SnapshotPublisher().publish({'metrics': {'cpu_usage': 1.0}}).etag
+    # 模拟重启：版本号重新从1开始
+    monkeypatch.setattr(snapshot_module, 'BOOT_ID', 'restarted')
+    after = SnapshotPublisher().publish({'metrics': {'cpu_usage': 2.0}}).etag
+    assert before != after
+    assert after == '"restarted-1"'